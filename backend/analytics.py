@@ -0,0 +1,165 @@
+import asyncio
+import os
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from urllib.parse import urlparse
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import AsyncSessionLocal, upsert
+
+ANALYTICS_QUEUE_SIZE = int(os.getenv("ANALYTICS_QUEUE_SIZE", "100000"))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "5000"))
+ROLLUP_UPSERT_CHUNK = 1000
+
+GRANULARITIES = {
+    "minute": lambda ts: ts.replace(second=0, microsecond=0),
+    "hour": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "day": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+# range -> (тривалість, з якої таблиці агрегатів читати)
+STATS_RANGES = {
+    "1h": (timedelta(hours=1), "minute"),
+    "24h": (timedelta(hours=24), "hour"),
+    "7d": (timedelta(days=7), "day"),
+    "30d": (timedelta(days=30), "day"),
+}
+
+UA_FAMILIES = (
+    ("bot", "Bot"), ("spider", "Bot"), ("crawl", "Bot"), ("telegrambot", "Bot"),
+    ("edg/", "Edge"), ("opr/", "Opera"), ("chrome/", "Chrome"), ("firefox/", "Firefox"),
+    ("safari/", "Safari"), ("curl/", "curl"), ("python", "Python"),
+)
+
+
+def user_agent_family(user_agent: str):
+    if not user_agent:
+        return None
+    lowered = user_agent.lower()
+    for needle, family in UA_FAMILIES:
+        if needle in lowered:
+            return family
+    return "Other"
+
+
+def referrer_host(referrer: str):
+    if not referrer:
+        return None
+    try:
+        return (urlparse(referrer).hostname or "")[:255] or None
+    except ValueError:
+        return None
+
+
+class ClickEventQueue:
+    def __init__(self, maxsize: int, flush_interval: float, batch_size: int):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._events = deque()
+        self._maxsize = maxsize
+        self._lock = Lock()
+        self.dropped = 0
+        self.written = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+
+    def push(self, short_key: str, referrer: str = None, user_agent: str = None):
+        # Викликається з redirect: тільки дешевий append, без I/O
+        event = (datetime.now(timezone.utc).replace(tzinfo=None), short_key, referrer, user_agent)
+        with self._lock:
+            if len(self._events) >= self._maxsize:
+                self.dropped += 1
+                return
+            self._events.append(event)
+
+    def take(self, limit: int) -> list:
+        with self._lock:
+            return [self._events.popleft() for _ in range(min(limit, len(self._events)))]
+
+    def requeue(self, events: list):
+        with self._lock:
+            self._events.extendleft(reversed(events))
+
+    async def flush(self, db: AsyncSession) -> int:
+        events = self.take(self.batch_size)
+        if not events:
+            return 0
+
+        started = time.perf_counter()
+        rows = [
+            {
+                "clicked_at": clicked_at,
+                "short_key": short_key,
+                "referrer": referrer_host(referrer),
+                "user_agent_family": user_agent_family(user_agent),
+                "country": None,  # заглушка під GeoIP
+            }
+            for clicked_at, short_key, referrer, user_agent in events
+        ]
+        rollups = Counter(
+            (row["short_key"], granularity, truncate(row["clicked_at"]))
+            for row in rows
+            for granularity, truncate in GRANULARITIES.items()
+        )
+        rollup_rows = [
+            {"short_key": short_key, "granularity": granularity, "bucket_start": bucket_start, "clicks": count}
+            for (short_key, granularity, bucket_start), count in rollups.items()
+        ]
+        try:
+            await db.execute(insert(models.ClickEvent), rows)
+            for i in range(0, len(rollup_rows), ROLLUP_UPSERT_CHUNK):
+                await db.execute(upsert_rollups(db, rollup_rows[i:i + ROLLUP_UPSERT_CHUNK]))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            self.failed_flushes += 1
+            self.requeue(events)
+            raise
+
+        self.written += len(events)
+        self.last_flush_seconds = time.perf_counter() - started
+        return len(events)
+
+    async def flush_all(self):
+        async with AsyncSessionLocal() as db:
+            while await self.flush(db):
+                pass
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_all()
+            except Exception as e:
+                print(f"Click events flush failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._events),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_seconds": round(self.last_flush_seconds, 6),
+        }
+
+
+def upsert_rollups(db: AsyncSession, rows: list):
+    # INSERT ... ON CONFLICT (short_key, granularity, bucket_start) DO UPDATE SET clicks = clicks + excluded.clicks
+    stmt = upsert(db, models.ClickRollup).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["short_key", "granularity", "bucket_start"],
+        set_={"clicks": models.ClickRollup.clicks + stmt.excluded.clicks},
+    )
+
+
+click_events = ClickEventQueue(
+    maxsize=ANALYTICS_QUEUE_SIZE,
+    flush_interval=ANALYTICS_FLUSH_INTERVAL,
+    batch_size=ANALYTICS_BATCH_SIZE,
+)
@@ -1,29 +1,56 @@
+import hmac
 import os
+import time
 from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, Header, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import cache
 import crud
-from database import get_db
+import hashing
+import metrics
+from database import get_async_db, primary_until, replicas
+from hashing import get_pwd_context
 
 SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+# Токен для /metrics і /internal/stats (X-Internal-Token або Authorization: Bearer). Без нього вони вимкнені
+INTERNAL_TOKEN = os.getenv("INTERNAL_TOKEN")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+class Principal(NamedTuple):
+    # Легкий знімок користувача для кешу: без ORM-сесії і без hashed_password
+    id: int
+    username: str
+    telegram_id: Optional[int]
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, username=user.username, telegram_id=user.telegram_id)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    with metrics.span("bcrypt_hash"):
+        return await hashing.password_hasher.hash(password)
+
+async def verify_password_async(plain_password, hashed_password):
+    with metrics.span("bcrypt_verify"):
+        return await hashing.password_hasher.verify(plain_password, hashed_password)
 
 def create_access_token(data: dict):
+    # jose (і cryptography під ним) імпортується при першому використанні, а не на старті воркера
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
@@ -31,7 +58,32 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def get_current_user(db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)):
+    from jose import JWTError, jwt
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+    user = await crud.get_user_by_username(db, username=username)
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+
+async def principal_from_token(db: AsyncSession, token: str) -> Principal:
+    cached = cache.principal_cache.get(("token", token))
+    if cached is not None:
+        principal, expires_at = cached
+        if expires_at > time.time():
+            return principal
+
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -40,7 +92,76 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
     except JWTError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
-    user = crud.get_user_by_username(db, username=username)
+    user = await crud.get_user_by_username(db, username=username)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
\ No newline at end of file
+
+    principal = Principal.from_user(user)
+    cache.principal_cache.set(("token", token), (principal, payload.get("exp", float("inf"))))
+    return principal
+
+
+async def principal_from_telegram_id(db: AsyncSession, telegram_id: int) -> Optional[Principal]:
+    cached = cache.principal_cache.get(("tg", telegram_id))
+    if cached is not None:
+        return cached[0]
+
+    user = await crud.get_user_by_tg_id(db, telegram_id=telegram_id)
+    if user is None:
+        return None
+
+    principal = Principal.from_user(user)
+    cache.principal_cache.set(("tg", telegram_id), (principal, float("inf")))
+    return principal
+
+
+async def get_current_principal(db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)):
+    # Як get_current_user, але через кеш і без ORM-об'єкта. Для ендпоінтів, що тільки читають user.id
+    if not token:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return await principal_from_token(db, token)
+
+
+async def get_principal(
+        db: AsyncSession = Depends(get_async_db),
+        token: Optional[str] = Depends(oauth2_scheme),
+        x_telegram_id: Optional[str] = Header(None, alias="X-Telegram-ID")
+):
+    # Один dependency для обох типів credentials: X-Telegram-ID (бот) або JWT
+    if x_telegram_id:
+        try:
+            telegram_id = int(x_telegram_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid X-Telegram-ID")
+        principal = await principal_from_telegram_id(db, telegram_id)
+        if principal is not None:
+            return principal
+
+    if token:
+        return await principal_from_token(db, token)
+
+    raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+async def require_internal_token(
+        token: Optional[str] = Depends(oauth2_scheme),
+        x_internal_token: Optional[str] = Header(None, alias="X-Internal-Token")
+):
+    if not INTERNAL_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = x_internal_token or token or ""
+    if not hmac.compare_digest(supplied.encode(), INTERNAL_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid internal token")
+
+
+def read_db_for(principal_dependency):
+    # Сесія на репліку для ендпоінтів, що лише читають; principal потрібен для read-your-writes
+    async def get_read_db(request: Request, principal: Principal = Depends(principal_dependency)):
+        async with replicas.session(principal.id, primary_until(request)) as db:
+            yield db
+
+    return get_read_db
+
+
+get_principal_read_db = read_db_for(get_principal)
+get_current_principal_read_db = read_db_for(get_current_principal)
@@ -2,9 +2,6 @@ import asyncio
 import os
 import sys
 
-print(f"Поточна директорія: {os.getcwd()}")
-print(f"Список файлів: {os.listdir('.')}")
-
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
@@ -14,20 +11,18 @@ from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-import httpx
 
 try:
-    from database import SessionLocal
-    from crud import create_user, get_user_by_username, authenticate_user, get_user_by_tg_id
-    import schemas
-except ImportError as e:
-    from backend.database import SessionLocal
-    from backend.crud import create_user, get_user_by_username, authenticate_user, get_user_by_tg_id
-    import backend.schemas as schemas
+    from service import InProcessBotService, ServiceError, build_service
+    from utils import short_url
+except ImportError:
+    from backend.bot.service import InProcessBotService, ServiceError, build_service
+    from backend.utils import short_url
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-bot = Bot(token=TOKEN)
 dp = Dispatcher()
+# Один сервіс (і один пул з'єднань) на весь процес бота; створюється в main(), не при імпорті
+service = None
 
 class RegisterSteps(StatesGroup):
     wait_username = State()
@@ -65,31 +60,21 @@ async def reg_finish(message: types.Message, state: FSMContext):
     tg_id = message.from_user.id
     password = message.text
 
-    db = SessionLocal()
     try:
-        if get_user_by_username(db, username):
-            await message.answer("❌ Помилка: Цей логін вже зайнятий. Спробуй /registration ще раз.")
-            return
-
-        if get_user_by_tg_id(db, tg_id):
-            await message.answer("❌ Помилка: Твій Telegram вже прив'язаний до іншого акаунта.")
-            return  # Зупиняємо!
-
-        create_user(
-            db,
-            user=schemas.UserCreateTelegram(
-                username=username,
-                password=password,
-                telegram_id=tg_id
-            )
-        )
+        await service.register(username, password, tg_id)
         await message.answer(f"✅ Готово! Акаунт {username} створено. Можеш надсилати посилання.")
 
+    except ServiceError as e:
+        if e.detail == "username taken":
+            await message.answer("❌ Помилка: Цей логін вже зайнятий. Спробуй /registration ще раз.")
+        elif e.detail == "telegram linked":
+            await message.answer("❌ Помилка: Твій Telegram вже прив'язаний до іншого акаунта.")
+        else:
+            await message.answer("⚠️ Сталася помилка при реєстрації. Спробуй пізніше.")
     except Exception as e:
         print(f"Error during registration: {e}")
         await message.answer("⚠️ Сталася помилка при реєстрації. Спробуй пізніше.")
     finally:
-        db.close()
         await state.clear()
 
 # ЛОГІН
@@ -112,18 +97,23 @@ async def login_finish(message: types.Message, state: FSMContext):
         pass
 
     data = await state.get_data()
-    db = SessionLocal()
     try:
-        user = authenticate_user(db, data['username'], message.text)
+        user = await service.login(data['username'], message.text, message.from_user.id)
         if user:
-            user.telegram_id = message.from_user.id
-            db.commit()
             await message.answer(f"Успішно! Ласкаво просимо, {data['username']}.")
-            await state.update_data(user_id=user.telegram_id)
         else:
             await message.answer("Помилка: Невірний логін або пароль. Спробуй /login")
+    except ServiceError as e:
+        if e.detail == "telegram linked":
+            await message.answer("❌ Помилка: Твій Telegram вже прив'язаний до іншого акаунта.")
+        elif e.status_code == 503:
+            await message.answer("Сервіс тимчасово недоступний")
+        else:
+            await message.answer("⚠️ Сталася помилка при вході. Спробуй пізніше.")
+    except Exception as e:
+        print(f"Error during login: {e}")
+        await message.answer("Сервіс тимчасово недоступний")
     finally:
-        db.close()
         await state.clear()
 
 
@@ -136,38 +126,30 @@ async def current_tg_id(message: types.Message):
 
 @dp.message(Command("urls"))
 async def start_stats(message: types.Message):
-    async with httpx.AsyncClient() as client:
-        try:
-            telegram_id = str(message.from_user.id)
-            response = await client.get(
-                "http://api:8000/my-urls",
-                headers={"X-Telegram-ID": telegram_id},
-                timeout=5.0
-            )
-
-            if response.status_code == 200:
-                urls = response.json()
-
-                if not urls:
-                    await message.answer("У тебе ще немає створених посилань.")
-                    return
-
-                report = "Твої посилання:\n\n"
-                for url in urls:
-                    short = url.get('short_key')
-                    clicks = url.get('clicks', 0)
-                    report += f"http://localhost:8000/{short} — {clicks} кліків\n"
-
-                await message.answer(report)
-
-            elif response.status_code == 401:
-                await message.answer("Помилка: Твій акаунт не знайдено. Спочатку використай /login або /registration")
-            else:
-                await message.answer("Не вдалося отримати статистику.")
-
-        except httpx.RequestError as e:
+    try:
+        urls, has_more = await service.list_urls(message.from_user.id)
+
+        if not urls:
+            await message.answer("У тебе ще немає створених посилань.")
+            return
+
+        report = "Твої посилання:\n\n"
+        for url in urls:
+            short = url.get('short_key')
+            clicks = url.get('clicks', 0)
+            report += f"{short_url(short)} — {clicks} кліків\n"
+        if has_more:
+            report += f"\nПоказано останні {len(urls)}, решта — у веб-кабінеті."
+
+        await message.answer(report)
+
+    except ServiceError as e:
+        if e.status_code == 401:
+            await message.answer("Помилка: Твій акаунт не знайдено. Спочатку використай /login або /registration")
+        elif e.status_code == 503:
             await message.answer("Помилка зв'язку з сервісом.")
-            print(f"HTTpx error: {e}")
+        else:
+            await message.answer("Не вдалося отримати статистику.")
 
 
 # HELP
@@ -193,32 +175,38 @@ async def start_shorten(message: types.Message, state: FSMContext):
 @dp.message(ShortenSteps.wait_url)
 async def process_shorten(message: types.Message, state: FSMContext):
     long_url = message.text.strip()
-    telegram_id = str(message.from_user.id)
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                "http://api:8000/shorten",
-                headers={"X-Telegram-ID": telegram_id},
-                json={"target_url": long_url},
-                timeout=5.0,
-            )
-
-            if response.status_code == 200:
-                short_url_data = response.json()
-                short_key = short_url_data.get("short_key")
-                await message.answer(f"Твоє посилання: http://localhost:8000/{short_key}")
-            else:
-                await message.answer("Помилка при створенні посилання.")
-
-        except Exception as e:
+    try:
+        short_key = await service.shorten(message.from_user.id, long_url)
+        await message.answer(f"Твоє посилання: {short_url(short_key)}")
+    except ServiceError as e:
+        if e.status_code == 503:
             await message.answer("Сервіс тимчасово недоступний")
-            print(f"Помилка запиту: {e}")
+        else:
+            await message.answer("Помилка при створенні посилання.")
+    except Exception as e:
+        await message.answer("Сервіс тимчасово недоступний")
+        print(f"Помилка запиту: {e}")
 
     await state.clear()
 
 async def main():
-    await dp.start_polling(bot)
+    global service
+    bot = Bot(token=TOKEN)
+    service = build_service()
+    listener = None
+    if isinstance(service, InProcessBotService):
+        # inprocess-бот має власні кеші користувачів: слухає ту саму шину інвалідації, що й API
+        import invalidation
+
+        listener = asyncio.create_task(invalidation.bus.run())
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if listener is not None:
+            listener.cancel()
+        await service.close()
+        await bot.session.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
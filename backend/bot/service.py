@@ -0,0 +1,155 @@
+import abc
+import os
+from typing import TYPE_CHECKING
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+
+import auth
+import bulk
+import cache
+import crud
+import invalidation
+import metrics
+import schemas
+from database import AsyncSessionLocal
+from utils import validate_url
+
+if TYPE_CHECKING:
+    import httpx
+
+# http — через API (http://api:8000), inprocess — напряму через crud у процесі бота
+BOT_API_MODE = os.getenv("BOT_API_MODE", "http")
+BOT_API_URL = os.getenv("BOT_API_URL", "http://api:8000").rstrip("/")
+BOT_API_TIMEOUT = float(os.getenv("BOT_API_TIMEOUT", "5"))
+BOT_MAX_CONNECTIONS = int(os.getenv("BOT_MAX_CONNECTIONS", "100"))
+# Ліміт /shorten на користувача Telegram для inprocess (в http його тримає API)
+BOT_SHORTEN_PER_MINUTE = int(os.getenv("BOT_SHORTEN_PER_MINUTE", "10"))
+# Скільки посилань показує /my_links: усе в одне повідомлення Telegram (до 4096 символів) не влізе,
+# про решту бот пише окремим рядком
+BOT_LIST_LIMIT = int(os.getenv("BOT_LIST_LIMIT", "50"))
+
+
+class ServiceError(Exception):
+    def __init__(self, status_code: int, detail: str = ""):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class BotService(abc.ABC):
+    # Реєстрація і логін завжди йдуть у базу (API не вміє прив'язувати telegram_id);
+    # bcrypt — через пул hashing.password_hasher, тож event loop бота не блокується
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def register(self, username: str, password: str, telegram_id: int):
+        async with self.session_factory() as db:
+            if await crud.get_user_by_username(db, username):
+                raise ServiceError(409, "username taken")
+            if await crud.get_user_by_tg_id(db, telegram_id):
+                raise ServiceError(409, "telegram linked")
+            user = schemas.UserCreateTelegram(username=username, password=password, telegram_id=telegram_id)
+            return await crud.create_user(db, user=user)
+
+    async def login(self, username: str, password: str, telegram_id: int):
+        async with self.session_factory() as db:
+            user = await crud.authenticate_user(db, username, password)
+            if not user:
+                return None
+            user.telegram_id = telegram_id
+            try:
+                await invalidation.bus.publish(db, invalidation.USER, [user.id])
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()
+                raise ServiceError(409, "telegram linked")
+            cache.invalidate_user(user.id)
+            return user
+
+    @abc.abstractmethod
+    async def list_urls(self, telegram_id: int) -> tuple:
+        # (останні BOT_LIST_LIMIT посилань, чи є ще)
+        ...
+
+    @abc.abstractmethod
+    async def shorten(self, telegram_id: int, target_url: str) -> str:
+        ...
+
+    async def close(self):
+        pass
+
+
+class HttpBotService(BotService):
+    def __init__(self, base_url: str, transport: "httpx.AsyncBaseTransport" = None,
+                 session_factory=AsyncSessionLocal):
+        # httpx лише в режимі http: inprocess-бот його не імпортує
+        import httpx
+
+        super().__init__(session_factory)
+        # Один клієнт на процес бота: keep-alive до API замість нового з'єднання на кожне повідомлення
+        self.client = metrics.instrument_client(httpx.AsyncClient(
+            base_url=base_url,
+            timeout=BOT_API_TIMEOUT,
+            limits=httpx.Limits(max_connections=BOT_MAX_CONNECTIONS, max_keepalive_connections=BOT_MAX_CONNECTIONS),
+            transport=transport,
+        ))
+
+    async def _request(self, method: str, path: str, telegram_id: int, **kwargs) -> "httpx.Response":
+        import httpx
+
+        try:
+            response = await self.client.request(method, path, headers={"X-Telegram-ID": str(telegram_id)}, **kwargs)
+        except httpx.RequestError as e:
+            raise ServiceError(503, str(e))
+        if response.status_code != 200:
+            raise ServiceError(response.status_code, response.text)
+        return response
+
+    async def list_urls(self, telegram_id: int) -> tuple:
+        response = await self._request("GET", "/my-urls", telegram_id, params={"limit": BOT_LIST_LIMIT})
+        return response.json(), bool(response.headers.get("x-next-cursor"))
+
+    async def shorten(self, telegram_id: int, target_url: str) -> str:
+        response = await self._request("POST", "/shorten", telegram_id, json={"target_url": target_url})
+        return response.json()["short_key"]
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class InProcessBotService(BotService):
+    def __init__(self, session_factory=AsyncSessionLocal):
+        super().__init__(session_factory)
+        self.quota = bulk.BulkQuota(capacity=BOT_SHORTEN_PER_MINUTE, window=60, max_concurrent=1)
+
+    async def _principal(self, db, telegram_id: int):
+        principal = await auth.principal_from_telegram_id(db, telegram_id)
+        if principal is None:
+            raise ServiceError(401, "Not authenticated")
+        return principal
+
+    async def list_urls(self, telegram_id: int) -> tuple:
+        async with self.session_factory() as db:
+            principal = await self._principal(db, telegram_id)
+            rows, has_more = await crud.list_user_urls(db, principal.id, limit=BOT_LIST_LIMIT)
+            return [{"short_key": row.short_key, "clicks": row.clicks or 0} for row in rows], has_more
+
+    async def shorten(self, telegram_id: int, target_url: str) -> str:
+        async with self.session_factory() as db:
+            principal = await self._principal(db, telegram_id)
+            if not await self.quota.consume(principal.id, 1):
+                raise ServiceError(429, "Too many requests")
+            try:
+                safe_url = validate_url(target_url)
+            except HTTPException as e:
+                raise ServiceError(e.status_code, e.detail)
+            db_url = await crud.create_db_url(db, url_address=safe_url, user_id=principal.id)
+            return db_url.short_key
+
+
+def build_service(mode: str = BOT_API_MODE) -> BotService:
+    if mode == "inprocess":
+        return InProcessBotService()
+    return HttpBotService(BOT_API_URL)
+
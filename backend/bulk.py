@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from threading import Lock
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import ratelimit
+from database import AsyncSessionLocal
+from utils import short_url, validate_urls
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "50000"))
+# Квота окремо від RateLimiter інтерактивного /shorten: посилань на користувача за вікно
+BULK_QUOTA_LINKS = int(os.getenv("BULK_QUOTA_LINKS", "100000"))
+BULK_QUOTA_WINDOW = float(os.getenv("BULK_QUOTA_WINDOW", "86400"))
+BULK_MAX_CONCURRENT = int(os.getenv("BULK_MAX_CONCURRENT", "1"))
+# auto — sql, якщо воркерів кілька (WEB_CONCURRENCY > 1), інакше memory (квота кожного воркера окремо)
+BULK_QUOTA_STORE = os.getenv("BULK_QUOTA_STORE", "auto")
+# Лічильник запущених задач живе стільки після останньої зміни: воркер міг упасти, не викликавши finish_job
+BULK_JOB_TTL = float(os.getenv("BULK_JOB_TTL", "3600"))
+SWAP_FAILED = object()
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+
+class BulkQuota:
+    # Token bucket на користувача: capacity посилань, що поповнюються рівномірно за window секунд.
+    # Стан у процесі — для одного воркера; для кількох див. SQLBulkQuota
+    def __init__(self, capacity: int, window: float, max_concurrent: int):
+        self.capacity = capacity
+        self.window = window
+        self.max_concurrent = max_concurrent
+        self._state = {}
+        self._lock = Lock()
+
+    async def _swap(self, key: str, step, ttl: float):
+        # step(state, now) -> (result, new_state)
+        with self._lock:
+            result, self._state[key] = step(self._state.get(key), time.time())
+            return result
+
+    def _refill(self, state, now: float) -> float:
+        tokens, updated = state or (self.capacity, now)
+        return min(self.capacity, tokens + (now - updated) * self.capacity / self.window)
+
+    async def remaining(self, user_id: int) -> int:
+        return int(await self._swap(f"bulk:{user_id}", lambda state, now: (self._refill(state, now), state),
+                                    self.window))
+
+    async def consume(self, user_id: int, count: int) -> int:
+        # Повертає, скільки з count посилань вкладається у квоту
+        def step(state, now):
+            tokens = self._refill(state, now)
+            granted = min(count, int(tokens))
+            return granted, (tokens - granted, now)
+
+        return await self._swap(f"bulk:{user_id}", step, self.window)
+
+    async def start_job(self, user_id: int):
+        def step(running, now):
+            running = running or 0
+            if running >= self.max_concurrent:
+                return False, running
+            return True, running + 1
+
+        if not await self._swap(f"bulkjobs:{user_id}", step, BULK_JOB_TTL):
+            raise HTTPException(status_code=429, detail="Another bulk job is already running")
+
+    async def finish_job(self, user_id: int):
+        await self._swap(f"bulkjobs:{user_id}", lambda running, now: (None, max(0, (running or 1) - 1)), BULK_JOB_TTL)
+
+
+class JobStreamingResponse(StreamingResponse):
+    # Звільняє слот start_job, хоч би як закінчилась відповідь: finally генератора не виконається,
+    # якщо клієнт відключився або відправка впала ще до першої ітерації
+    def __init__(self, content, quota: BulkQuota, user_id: int, **kwargs):
+        super().__init__(content, **kwargs)
+        self.quota = quota
+        self.user_id = user_id
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.quota.finish_job(self.user_id)
+
+
+class SQLBulkQuota(BulkQuota):
+    # Спільна для всіх воркерів квота: стан у rate_limit_state через той самий compare-and-swap, що й ratelimit.SQLStore
+    def __init__(self, capacity: int, window: float, max_concurrent: int, session_factory=None):
+        super().__init__(capacity, window, max_concurrent)
+        self.store = ratelimit.SQLStore(session_factory or AsyncSessionLocal)
+
+    async def _swap(self, key: str, step, ttl: float):
+        def sql_step(value, now):
+            state = json.loads(value) if value is not None else None
+            result, new_state = step(state, now)
+            if new_state == state:
+                return result, None, None
+            return result, json.dumps(new_state), now + ttl
+
+        result = await self.store.swap(key, sql_step, SWAP_FAILED)
+        if result is SWAP_FAILED:
+            raise HTTPException(status_code=429, detail="Bulk quota is busy, try again")
+        return result
+
+
+def build_quota(name: str) -> BulkQuota:
+    if ratelimit.shared_state_default(name) == "sql":
+        return SQLBulkQuota(capacity=BULK_QUOTA_LINKS, window=BULK_QUOTA_WINDOW, max_concurrent=BULK_MAX_CONCURRENT)
+    return BulkQuota(capacity=BULK_QUOTA_LINKS, window=BULK_QUOTA_WINDOW, max_concurrent=BULK_MAX_CONCURRENT)
+
+
+bulk_quota = build_quota(BULK_QUOTA_STORE)
+
+
+def parse_item(item):
+    if isinstance(item, dict):
+        return item.get("target_url")
+    return item
+
+
+async def iter_ndjson(chunks):
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+async def iter_list(items):
+    for item in items:
+        yield item
+
+
+async def shorten_stream(db: AsyncSession, user_id: int, items, quota: BulkQuota = bulk_quota):
+    # items — async-ітератор рядків або {"target_url": ...}; на виході по одному dict на вхідний елемент
+    index = 0
+    batch = []
+
+    async def flush(batch, start):
+        checked = validate_urls([parse_item(item) for item in batch])
+        valid = [(i, url) for i, (url, error) in enumerate(checked) if error is None]
+        granted = await quota.consume(user_id, len(valid))
+        keys = await crud.create_db_urls_bulk(db, [url for _, url in valid[:granted]], user_id) if granted else []
+        created = {i: key for (i, _), key in zip(valid, keys)}
+
+        results = []
+        for i, (url, error) in enumerate(checked):
+            result = {"index": start + i, "target_url": url or parse_item(batch[i])}
+            if error is not None:
+                result["error"] = error
+            elif i in created:
+                result["short_key"] = created[i]
+                result["short_url"] = short_url(created[i])
+            else:
+                result["error"] = "Bulk quota exceeded"
+            results.append(result)
+        return results
+
+    async for item in items:
+        if index >= BULK_MAX_ITEMS:
+            yield {"index": index, "error": f"Too many items, limit is {BULK_MAX_ITEMS}"}
+            break
+        batch.append(item)
+        index += 1
+        if len(batch) >= BULK_CHUNK_SIZE:
+            for result in await flush(batch, index - len(batch)):
+                yield result
+            batch = []
+
+    if batch:
+        for result in await flush(batch, index - len(batch)):
+            yield result
+
+
+async def main_cli():
+    parser = argparse.ArgumentParser(description="Bulk-shorten URLs for a user, results as NDJSON on stdout")
+    parser.add_argument("username")
+    parser.add_argument("file", nargs="?", help="JSON array or one URL / JSON object per line (default: stdin)")
+    args = parser.parse_args()
+
+    source = open(args.file, encoding="utf-8") if args.file else sys.stdin
+    with source:
+        text = source.read()
+    if text.lstrip().startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) if line.lstrip().startswith(("{", '"')) else line.strip()
+                 for line in text.splitlines() if line.strip()]
+
+    async with AsyncSessionLocal() as db:
+        user = await crud.get_user_by_username(db, args.username)
+        if user is None:
+            sys.exit(f"User {args.username} not found")
+        # CLI — операторський інструмент, квота йому не потрібна
+        unlimited = BulkQuota(capacity=len(items), window=1, max_concurrent=1)
+        async for result in shorten_stream(db, user.id, iter_list(items), quota=unlimited):
+            print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main_cli())
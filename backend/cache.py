@@ -0,0 +1,133 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import timezone
+from threading import Lock
+from typing import NamedTuple, Optional
+
+URL_CACHE_SIZE = int(os.getenv("URL_CACHE_SIZE", "10000"))
+URL_CACHE_TTL = float(os.getenv("URL_CACHE_TTL", "300"))
+URL_NEGATIVE_CACHE_SIZE = int(os.getenv("URL_NEGATIVE_CACHE_SIZE", "10000"))
+URL_NEGATIVE_CACHE_TTL = float(os.getenv("URL_NEGATIVE_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key, value, ttl: float = None):
+        # ttl — для записів, що живуть інакше, ніж решта кешу
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item else None
+
+    def pop_matching(self, predicate) -> int:
+        with self._lock:
+            stale = [key for key, (value, _) in self._data.items() if predicate(key, value)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_MISSING = object()
+
+
+class LinkTarget(NamedTuple):
+    # Усе, що потрібно редиректу, щоб вирішити без запиту в базу
+    full_url: str
+    scan_status: Optional[str]
+    # POSIX timestamp (UTC) або None
+    expires_at: Optional[float] = None
+    max_clicks: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row):
+        # row: full_url, scan_status, expires_at (naive UTC), max_clicks
+        expires_at = row.expires_at.replace(tzinfo=timezone.utc).timestamp() if row.expires_at else None
+        return cls(row.full_url, row.scan_status, expires_at, row.max_clicks)
+
+    def expired(self, now: float) -> bool:
+        return self.expires_at is not None and self.expires_at <= now
+
+
+# short_key -> LinkTarget для гарячих редиректів
+url_cache = TTLCache(maxsize=URL_CACHE_SIZE, ttl=URL_CACHE_TTL)
+# short_key, яких немає в базі (щоб сканування неіснуючих ключів не било по БД)
+missing_url_cache = TTLCache(maxsize=URL_NEGATIVE_CACHE_SIZE, ttl=URL_NEGATIVE_CACHE_TTL)
+
+# ("token", jwt) / ("tg", telegram_id) -> (auth.Principal, exp токена)
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+def invalidate_url(short_key: str):
+    url_cache.pop(short_key)
+    missing_url_cache.pop(short_key)
+
+
+def invalidate_user(user_id: int):
+    principal_cache.pop_matching(lambda key, value: value[0].id == user_id)
+
+
+def stats() -> dict:
+    return {
+        "urls": url_cache.stats(),
+        "missing_urls": missing_url_cache.stats(),
+        "principals": principal_cache.stats(),
+    }
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from threading import Lock
+
+from sqlalchemy import case, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import AsyncSessionLocal
+
+CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", "5"))
+CLICK_FLUSH_THRESHOLD = int(os.getenv("CLICK_FLUSH_THRESHOLD", "1000"))
+CLICK_FLUSH_BATCH = 500
+
+
+class ClickBuffer:
+    def __init__(self, flush_interval: float, flush_threshold: int):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending = defaultdict(int)
+        self._pending_total = 0
+        self._lock = Lock()
+        self._wakeup = asyncio.Event()
+        self.flushed_clicks = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+
+    def add(self, short_key: str, count: int = 1):
+        with self._lock:
+            self._pending[short_key] += count
+            self._pending_total += count
+            full = self._pending_total >= self.flush_threshold
+        if full:
+            self._wakeup.set()
+
+    def pending(self, short_key: str) -> int:
+        with self._lock:
+            return self._pending.get(short_key, 0)
+
+    def discard(self, short_key: str):
+        with self._lock:
+            self._pending_total -= self._pending.pop(short_key, 0)
+
+    def drain(self) -> dict:
+        with self._lock:
+            deltas, self._pending = self._pending, defaultdict(int)
+            self._pending_total = 0
+        return deltas
+
+    async def flush(self, db: AsyncSession) -> int:
+        deltas = self.drain()
+        if not deltas:
+            return 0
+
+        started = time.perf_counter()
+        items = list(deltas.items())
+        try:
+            for i in range(0, len(items), CLICK_FLUSH_BATCH):
+                batch = dict(items[i:i + CLICK_FLUSH_BATCH])
+                # UPDATE urls SET clicks = clicks + CASE short_key WHEN ... END WHERE short_key IN (...)
+                await db.execute(
+                    update(models.URL)
+                    .where(models.URL.short_key.in_(batch))
+                    .values(clicks=models.URL.clicks + case(batch, value=models.URL.short_key, else_=0))
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            self.failed_flushes += 1
+            for key, delta in items:
+                self.add(key, delta)
+            raise
+
+        flushed = sum(deltas.values())
+        self.flushed_clicks += flushed
+        self.flushes += 1
+        self.last_flush_seconds = time.perf_counter() - started
+        return flushed
+
+    async def flush_now(self) -> int:
+        async with AsyncSessionLocal() as db:
+            return await self.flush(db)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush_now()
+            except Exception as e:
+                print(f"Click flush failed: {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending_keys = len(self._pending)
+            pending_clicks = self._pending_total
+        return {
+            "pending_keys": pending_keys,
+            "pending_clicks": pending_clicks,
+            "flushed_clicks": self.flushed_clicks,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_seconds": round(self.last_flush_seconds, 6),
+        }
+
+
+click_buffer = ClickBuffer(flush_interval=CLICK_FLUSH_INTERVAL, flush_threshold=CLICK_FLUSH_THRESHOLD)
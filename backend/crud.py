@@ -1,72 +1,307 @@
-import random
-import string
+import os
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
 
 import auth
+import cache
+import clicks
+import invalidation
+import keys
 import models
+import scanner
 import schemas
-from qr_creater import generate_qr_base64
+from database import release_connection, replicas, upsert
+from utils import url_hash
 
+BULK_INSERT_CHUNK = 1000
+# Скільки разів видати новий ключ, якщо виданий уже зайнятий
+KEY_COLLISION_RETRIES = 5
+# Скільки секунд пам'ятати Idempotency-Key з /shorten
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
 
-def generate_short_key(length: int = 5):
-    chars = string.ascii_letters + string.digits
-    return "".join(random.choice(chars) for _ in range(length))
+# Легкі колонки для списків: без qr_code та інших важких полів
+URL_LIST_COLUMNS = (
+    models.URL.id, models.URL.full_url, models.URL.short_key, models.URL.clicks, models.URL.created_at,
+    models.URL.scan_status, models.URL.expires_at, models.URL.max_clicks,
+)
+REDIRECT_COLUMNS = (models.URL.full_url, models.URL.scan_status, models.URL.expires_at, models.URL.max_clicks)
+URL_SORT_COLUMNS = {"created_at": models.URL.created_at, "clicks": models.URL.clicks}
 
 
-def create_db_url(db: Session, url_address: str, user_id: int):
-    if not url_address.startswith("https://") and not url_address.startswith("https://"):
+def with_scheme(url_address: str):
+    if not url_address.startswith("http://") and not url_address.startswith("https://"):
         url_address = "https://" + url_address
-    random_key = generate_short_key()
-    shortened_url = f"127.0.0.1/{random_key}"
-    qr_base64 = generate_qr_base64(shortened_url)
-    db_url = models.URL(full_url=url_address, short_key=random_key, owner_id=user_id, qr_code=qr_base64)
-    db.add(db_url)
-    db.commit()
-    db.refresh(db_url)
+    return url_address
+
+
+async def get_url_by_hash(db: AsyncSession, user_id: int, target_hash: str):
+    return await db.scalar(
+        select(models.URL)
+        .options(defer(models.URL.qr_code))
+        .where(models.URL.owner_id == user_id, models.URL.url_hash == target_hash)
+    )
+
+
+async def create_db_url(db: AsyncSession, url_address: str, user_id: int, expires_at=None, max_clicks: int = None):
+    url_address = with_scheme(url_address)
+    # Той самий (канонічно) URL того самого власника — повертаємо наявне посилання.
+    # Посилання з терміном життя або лімітом кліків завжди окремі: їх не можна видати замість звичайного
+    target_hash = None
+    if expires_at is None and max_clicks is None:
+        target_hash = url_hash(url_address)
+        existing = await get_url_by_hash(db, user_id, target_hash)
+        if existing is not None:
+            return existing
+
+    for attempt in range(KEY_COLLISION_RETRIES):
+        short_key = await keys.key_allocator.allocate(db)
+        # QR більше не зберігається в рядку, він рендериться на льоту через GET /qr/{short_key}
+        db_url = models.URL(full_url=url_address, short_key=short_key, owner_id=user_id, url_hash=target_hash,
+                            expires_at=expires_at, max_clicks=max_clicks)
+        db.add(db_url)
+        try:
+            await db.commit()
+            break
+        except IntegrityError:
+            await db.rollback()
+            # Паралельний повтор того самого запиту встиг першим
+            existing = await get_url_by_hash(db, user_id, target_hash) if target_hash else None
+            if existing is not None:
+                return existing
+            # Інакше зайнятий сам short_key (напр. ключ зі старим секретом скремблінгу) — беремо наступний
+            if attempt + 1 == KEY_COLLISION_RETRIES:
+                raise
+    await db.refresh(db_url)
+    replicas.mark_write(user_id)
+    cache.missing_url_cache.pop(short_key)
+    # Перевірка репутації йде у фоні, /shorten на неї не чекає
+    scanner.scan_queue.enqueue(short_key, url_address)
     return db_url
 
-def update_db_clicks(db: Session, db_url: models.URL):
-    db_url.clicks += 1
-    db.commit()
-    db.refresh(db_url)
 
-def get_db_url_by_key(db: Session, url_key: str):
-    return db.query(models.URL).filter(models.URL.short_key == url_key).first()
+async def get_keys_by_hash(db: AsyncSession, user_id: int, hashes: list) -> dict:
+    found = {}
+    for i in range(0, len(hashes), BULK_INSERT_CHUNK):
+        found.update((await db.execute(
+            select(models.URL.url_hash, models.URL.short_key)
+            .where(models.URL.owner_id == user_id, models.URL.url_hash.in_(hashes[i:i + BULK_INSERT_CHUNK]))
+        )).all())
+    return found
+
+
+async def create_db_urls_bulk(db: AsyncSession, url_addresses: list, user_id: int):
+    # short_key для кожного вхідного URL; дублікати (в запиті і вже наявні) отримують один ключ
+    url_addresses = [with_scheme(url_address) for url_address in url_addresses]
+    hashes = [url_hash(url_address) for url_address in url_addresses]
+    existing = await get_keys_by_hash(db, user_id, list(set(hashes)))
+
+    new = {}
+    for url_address, target_hash in zip(url_addresses, hashes):
+        if target_hash not in existing:
+            new.setdefault(target_hash, url_address)
+    # Один multi-row INSERT ... VALUES (...), (...) на чанк. Рядки, які паралельний запит
+    # вставив між SELECT і INSERT, пропускаються і перечитуються нижче; ті, чий short_key
+    # виявився зайнятим, отримують нові ключі в наступному проході
+    inserted = []
+    for _ in range(KEY_COLLISION_RETRIES):
+        if not new:
+            break
+        short_keys = await keys.key_allocator.allocate_many(db, len(new))
+        rows = [
+            {"full_url": url_address, "short_key": short_key, "owner_id": user_id, "url_hash": target_hash}
+            for (target_hash, url_address), short_key in zip(new.items(), short_keys)
+        ]
+        for i in range(0, len(rows), BULK_INSERT_CHUNK):
+            await db.execute(upsert(db, models.URL).values(rows[i:i + BULK_INSERT_CHUNK]).on_conflict_do_nothing())
+        await db.commit()
+        replicas.mark_write(user_id)
+        existing.update(await get_keys_by_hash(db, user_id, list(new)))
+        inserted.extend(row for row in rows if existing.get(row["url_hash"]) == row["short_key"])
+        new = {target_hash: url_address for target_hash, url_address in new.items() if target_hash not in existing}
+    if new:
+        raise RuntimeError(f"Could not allocate free short keys for {len(new)} URLs")
+    for row in inserted:
+        cache.missing_url_cache.pop(row["short_key"])
+        scanner.scan_queue.enqueue(row["short_key"], row["full_url"])
+    return [existing[target_hash] for target_hash in hashes]
+
+
+async def get_db_url_by_key(db: AsyncSession, url_key: str):
+    return await db.scalar(select(models.URL).where(models.URL.short_key == url_key))
+
+
+async def fetch_redirect_row(db: AsyncSession, url_key: str):
+    return (await db.execute(select(*REDIRECT_COLUMNS).where(models.URL.short_key == url_key))).first()
+
+
+async def get_redirect_target(db: AsyncSession, url_key: str, primary: AsyncSession = None):
+    # cache.LinkTarget або None; в url_cache лежить той самий LinkTarget.
+    # db може бути реплікою: промах перепитується в primary, бо щойно створене посилання могло ще не доїхати
+    target = cache.url_cache.get(url_key)
+    if target is not None:
+        return target
+    if url_key in cache.missing_url_cache:
+        return None
+
+    row = await fetch_redirect_row(db, url_key)
+    if row is None and primary is not None and primary.bind is not db.bind:
+        row = await fetch_redirect_row(primary, url_key)
+    if row is None:
+        cache.missing_url_cache.set(url_key, True)
+        return None
+
+    target = cache.LinkTarget.from_row(row)
+    cache.url_cache.set(url_key, target)
+    return target
+
+
+async def consume_click(db: AsyncSession, url_key: str) -> bool:
+    # Для посилань з max_clicks: лічильник у базі інкрементується атомарно лише поки є ліміт,
+    # тож воркери не перевищать його разом. Останній клік одразу робить посилання простроченим для sweeper
+    clicks = func.coalesce(models.URL.clicks, 0)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    result = await db.execute(
+        update(models.URL)
+        .where(models.URL.short_key == url_key, clicks < models.URL.max_clicks)
+        .values(
+            clicks=clicks + 1,
+            expires_at=case((clicks + 1 >= models.URL.max_clicks, now), else_=models.URL.expires_at),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if result.rowcount != 1:
+        cache.url_cache.pop(url_key)
+        return False
+    return True
+
+
+async def get_full_url_by_key(db: AsyncSession, url_key: str):
+    target = await get_redirect_target(db, url_key)
+    return target.full_url if target is not None else None
+
+
+async def get_user_url(db: AsyncSession, url_key: str, user_id: int):
+    return await db.scalar(
+        select(models.URL)
+        .options(defer(models.URL.qr_code))
+        .where(models.URL.short_key == url_key, models.URL.owner_id == user_id)
+    )
+
+
+async def list_user_urls(
+        db: AsyncSession,
+        user_id: int,
+        limit: int,
+        sort: str = "-created_at",
+        after: tuple = None,
+        search: str = None,
+        min_clicks: int = None,
+        created_after=None,
+        created_before=None,
+):
+    # Keyset-пагінація по (sort_column, id): кожна сторінка — один index range scan
+    descending = sort.startswith("-")
+    column = URL_SORT_COLUMNS[sort.lstrip("-")]
+
+    stmt = select(*URL_LIST_COLUMNS).where(models.URL.owner_id == user_id)
+    if search:
+        stmt = stmt.where(models.URL.full_url.contains(search, autoescape=True))
+    if min_clicks is not None:
+        stmt = stmt.where(models.URL.clicks >= min_clicks)
+    if created_after is not None:
+        stmt = stmt.where(models.URL.created_at >= created_after)
+    if created_before is not None:
+        stmt = stmt.where(models.URL.created_at < created_before)
+    if after is not None:
+        position = tuple_(column, models.URL.id)
+        stmt = stmt.where(position < tuple_(*after) if descending else position > tuple_(*after))
+
+    order = (column.desc(), models.URL.id.desc()) if descending else (column.asc(), models.URL.id.asc())
+    rows = (await db.execute(stmt.order_by(*order).limit(limit + 1))).all()
+    return rows[:limit], len(rows) > limit
 
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_click_rollups(db: AsyncSession, url_key: str, granularity: str, since):
+    result = await db.execute(
+        select(models.ClickRollup.bucket_start, models.ClickRollup.clicks)
+        .where(
+            models.ClickRollup.short_key == url_key,
+            models.ClickRollup.granularity == granularity,
+            models.ClickRollup.bucket_start >= since,
+        )
+        .order_by(models.ClickRollup.bucket_start)
+    )
+    return result.all()
 
-def get_user_by_tg_id(db: Session, telegram_id: int):
-    return db.query(models.User).filter(models.User.telegram_id == telegram_id).first()
 
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(models.User).where(models.User.username == username))
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_pwd = auth.get_password_hash(user.password)
-    db_user = models.User(username=user.username, hashed_password=hashed_pwd)
+
+async def get_user_by_tg_id(db: AsyncSession, telegram_id: int):
+    return await db.scalar(select(models.User).where(models.User.telegram_id == telegram_id))
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    # bcrypt триває сотні мс — з'єднання після перевірки username не тримаємо
+    await release_connection(db)
+    hashed_pwd = await auth.get_password_hash_async(user.password)
+    db_user = models.User(username=user.username, hashed_password=hashed_pwd,
+                          telegram_id=getattr(user, "telegram_id", None))
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
-def delete_db_url(db: Session, short_key: str, user_id: int):
-    db_url = db.query(models.URL).filter(
-        models.URL.short_key == short_key,
-        models.URL.owner_id == user_id
-    ).first()
+async def delete_db_url(db: AsyncSession, short_key: str, user_id: int):
+    db_url = await get_user_url(db, short_key, user_id)
 
     if db_url:
-        db.delete(db_url)
-        db.commit()
+        await db.delete(db_url)
+        # Історія кліків іде разом із посиланням: ключ не повинен дістатися комусь зі старою статистикою
+        await db.execute(delete(models.ClickEvent).where(models.ClickEvent.short_key == short_key))
+        await db.execute(delete(models.ClickRollup).where(models.ClickRollup.short_key == short_key))
+        db.add(models.URLTombstone(short_key=short_key, deleted_at=datetime.now(timezone.utc).replace(tzinfo=None)))
+        await invalidation.bus.publish(db, invalidation.URL_GONE, [short_key])
+        await db.commit()
+        replicas.mark_write(user_id)
+        cache.invalidate_url(short_key)
+        # Відстала репліка ще може віддати видалений рядок — одразу пам'ятаємо, що його немає
+        cache.missing_url_cache.set(short_key, True)
+        clicks.click_buffer.discard(short_key)
         return True
     return False
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(models.User).filter(models.User.username == username).first()
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username(db, username)
     if not user:
         return False
-    if not auth.verify_password(password, user.hashed_password):
+    if not await auth.verify_password_async(password, user.hashed_password):
         return False
-    return user
\ No newline at end of file
+    return user
+
+
+
+async def get_idempotency_record(db: AsyncSession, user_id: int, key: str, ttl: float):
+    record = await db.get(models.IdempotencyKey, (user_id, key))
+    expired_before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=ttl)
+    if record is not None and record.created_at < expired_before:
+        await db.delete(record)
+        await db.commit()
+        return None
+    return record
+
+
+async def save_idempotency_key(db: AsyncSession, user_id: int, key: str, request_hash: str, short_key: str):
+    await db.execute(upsert(db, models.IdempotencyKey).values(
+        owner_id=user_id, key=key, request_hash=request_hash, short_key=short_key,
+        created_at=datetime.now(timezone.utc).replace(tzinfo=None),
+    ).on_conflict_do_nothing())
+    await db.commit()
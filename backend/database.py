@@ -1,8 +1,21 @@
+import asyncio
+import itertools
+import math
 import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event, inspect, make_url, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+
+from cache import TTLCache
 
 load_dotenv()
 
@@ -10,9 +23,122 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL not found in environment variables!")
 
-engine = create_engine(DATABASE_URL)
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# Пул на один процес: воркерів * (DB_POOL_SIZE + DB_MAX_OVERFLOW) має вміщатися в max_connections Postgres
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") not in ("0", "false", "False", "")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Зовнішній пулер (pgbouncer, transaction mode): свій пул вимкнено, prepared statements не кешуються
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") not in ("0", "false", "False", "")
+
+# Репліки тільки для читань (редиректи, списки посилань); через кому, порожньо — усе на primary
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+REPLICA_HEALTH_TIMEOUT = float(os.getenv("REPLICA_HEALTH_TIMEOUT", "2"))
+# Скільки секунд після власної зміни користувач читає з primary (read-your-writes)
+REPLICA_READ_YOUR_WRITES = float(os.getenv("REPLICA_READ_YOUR_WRITES", "5"))
+# Після запису відповідь несе unix-час, до якого клієнт читає з primary (заголовок і cookie).
+# Клієнт повертає його з наступними запитами, тож read-your-writes працює між воркерами й інстансами
+PRIMARY_UNTIL_HEADER = "X-Primary-Until"
+PRIMARY_UNTIL_COOKIE = "primary_until"
+# Моменти записів поточного запиту; список ставить ReadYourWrites, доповнює ReplicaRouter.mark_write
+request_writes: ContextVar = ContextVar("request_writes", default=None)
+
+
+def engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    backend, driver = parsed.get_backend_name(), parsed.get_driver_name()
+    options = {"pool_pre_ping": DB_POOL_PRE_PING and not DB_PGBOUNCER, "pool_recycle": DB_POOL_RECYCLE}
+    connect_args = {}
+
+    if DB_PGBOUNCER:
+        options["poolclass"] = NullPool
+        if driver == "asyncpg":
+            connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+    elif not (backend == "sqlite" and parsed.database in (None, "", ":memory:")):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+
+    # Через pgbouncer параметри сесії не переживають транзакцію — там SET LOCAL (див. set_statement_timeout)
+    if backend == "postgresql" and DB_STATEMENT_TIMEOUT_MS and not DB_PGBOUNCER:
+        if driver == "asyncpg":
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        else:
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+def set_statement_timeout(engine):
+    target = getattr(engine, "sync_engine", engine)
+    if target.dialect.name != "postgresql" or not DB_STATEMENT_TIMEOUT_MS or not DB_PGBOUNCER:
+        return
+
+    @event.listens_for(target, "begin")
+    def _set_local_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
+
+pool_usage = {}
+
+
+def track_pool(engine, name: str):
+    # Скільки з'єднань зайнято зараз і в піку — для підбору кількості воркерів
+    target = getattr(engine, "sync_engine", engine)
+    usage = pool_usage[name] = {"engine": target, "checked_out": 0, "high_water": 0, "checkouts": 0}
+
+    @event.listens_for(target, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        usage["checked_out"] += 1
+        usage["checkouts"] += 1
+        usage["high_water"] = max(usage["high_water"], usage["checked_out"])
+
+    @event.listens_for(target, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        usage["checked_out"] -= 1
+
+
+def pool_stats() -> dict:
+    stats = {"pgbouncer": DB_PGBOUNCER}
+    for name, usage in pool_usage.items():
+        pool = usage["engine"].pool
+        row = {key: value for key, value in usage.items() if key != "engine"}
+        row["pool"] = type(pool).__name__
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + DB_MAX_OVERFLOW
+            row.update(size=pool.size(), idle=pool.checkedin(), overflow=max(pool.overflow(), 0), capacity=capacity,
+                       saturation=round(usage["checked_out"] / capacity, 3))
+        stats[name] = row
+    return stats
+
+
+# Синхронний engine лишається для create_all і скриптів
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+set_statement_timeout(engine)
+set_statement_timeout(async_engine)
+track_pool(async_engine, "async")
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 class Base(DeclarativeBase):
     pass
 
@@ -22,3 +148,191 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    # AsyncSession бере з'єднання з пулу лише на першому запиті, тож ендпоінт,
+    # що впав на валідації, пул не чіпає
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+class ReplicaRouter:
+    # Читання round-robin по здорових репліках; primary — якщо реплік немає, всі впали
+    # або користувач щойно щось змінив і репліка могла ще не наздогнати
+    def __init__(self, primary, replicas, read_your_writes: float = REPLICA_READ_YOUR_WRITES,
+                 health_interval: float = REPLICA_HEALTH_INTERVAL, health_timeout: float = REPLICA_HEALTH_TIMEOUT):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.healthy = list(self.replicas)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.sticky_seconds = read_your_writes
+        # Той самий воркер бачить свої записи і без маркера від клієнта (бот, клієнти без cookie)
+        self.recent_writers = TTLCache(maxsize=100_000, ttl=read_your_writes)
+        self._sessionmakers = {
+            engine: async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+            for engine in [primary, *self.replicas]
+        }
+        self._round_robin = itertools.count()
+        self.reads = {"primary": 0, "replica": 0}
+        self.read_your_writes = 0
+        self.failures = 0
+
+    def mark_write(self, user_id):
+        if not self.replicas:
+            return
+        if user_id is not None:
+            self.recent_writers.set(user_id, True)
+        writes = request_writes.get()
+        if writes is not None:
+            writes.append(time.time() + self.sticky_seconds)
+
+    def engine_for(self, user_id=None, primary_until: float = 0.0):
+        healthy = self.healthy
+        if not healthy:
+            self.reads["primary"] += 1
+            return self.primary
+        if primary_until > time.time() or (user_id is not None and user_id in self.recent_writers):
+            self.read_your_writes += 1
+            self.reads["primary"] += 1
+            return self.primary
+        self.reads["replica"] += 1
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def mark_failed(self, engine):
+        if engine in self.healthy:
+            self.failures += 1
+            self.healthy = [replica for replica in self.healthy if replica is not engine]
+
+    def report_error(self, engine, error: Exception):
+        # Для ендпоінтів, що самі ловлять винятки: помилка з'єднання з реплікою виводить її з ротації
+        if isinstance(error, (OperationalError, InterfaceError, OSError)) and engine is not self.primary:
+            self.mark_failed(engine)
+
+    @asynccontextmanager
+    async def session(self, user_id=None, primary_until: float = 0.0):
+        engine = self.engine_for(user_id, primary_until)
+        try:
+            async with self._sessionmakers[engine]() as db:
+                yield db
+        except (OperationalError, InterfaceError, OSError):
+            # Репліка недоступна: до наступної health-перевірки читаємо з інших або з primary
+            self.mark_failed(engine)
+            raise
+
+    async def _ping(self, engine) -> bool:
+        async def select_one():
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        try:
+            await asyncio.wait_for(select_one(), timeout=self.health_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def check(self):
+        results = await asyncio.gather(*(self._ping(engine) for engine in self.replicas))
+        self.healthy = [engine for engine, ok in zip(self.replicas, results) if ok]
+
+    async def run(self):
+        if not self.replicas:
+            return
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check()
+
+    async def close(self):
+        for engine in self.replicas:
+            await engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy": len(self.healthy),
+            "reads": dict(self.reads),
+            "read_your_writes": self.read_your_writes,
+            "failures": self.failures,
+        }
+
+
+replica_engines = [
+    create_async_engine(to_async_url(url), **engine_options(to_async_url(url))) for url in DATABASE_REPLICA_URLS
+]
+for number, replica_engine in enumerate(replica_engines):
+    set_statement_timeout(replica_engine)
+    track_pool(replica_engine, f"replica{number}")
+replicas = ReplicaRouter(async_engine, replica_engines)
+
+
+def primary_until(request) -> float:
+    value = request.headers.get(PRIMARY_UNTIL_HEADER) or request.cookies.get(PRIMARY_UNTIL_COOKIE)
+    try:
+        return float(value) if value else 0.0
+    except ValueError:
+        return 0.0
+
+
+class ReadYourWrites:
+    # ASGI-шар: якщо запит щось записав, відповідь повертає клієнту маркер PRIMARY_UNTIL
+    def __init__(self, app, router: ReplicaRouter = None):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        router = self.router or replicas
+        if scope["type"] != "http" or not router.replicas:
+            return await self.app(scope, receive, send)
+        writes = []
+        token = request_writes.set(writes)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and writes:
+                until = f"{max(writes):.3f}"
+                cookie = (f"{PRIMARY_UNTIL_COOKIE}={until}; Max-Age={math.ceil(router.sticky_seconds)}; "
+                          "Path=/; HttpOnly; SameSite=Lax")
+                message = {**message, "headers": [
+                    *message.get("headers", []),
+                    (PRIMARY_UNTIL_HEADER.lower().encode(), until.encode()),
+                    (b"set-cookie", cookie.encode()),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_writes.reset(token)
+
+
+async def get_replica_db(request: Request):
+    async with replicas.session(primary_until=primary_until(request)) as db:
+        yield db
+
+
+async def release_connection(db):
+    # Повертає з'єднання в пул перед довгою роботою без БД (bcrypt, зовнішній HTTP).
+    # Завантажені об'єкти лишаються доступними, наступний запит візьме нове з'єднання
+    if db.in_transaction() and not (db.new or db.dirty or db.deleted):
+        await db.close()
+
+
+def upsert(db, model):
+    # INSERT ... ON CONFLICT з потрібного діалекту (Postgres або SQLite)
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def add_missing_columns(engine, metadata):
+    # create_all не додає нові nullable-колонки в уже створені таблиці
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable or column.primary_key:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
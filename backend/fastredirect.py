@@ -0,0 +1,119 @@
+import math
+import os
+import re
+import time
+
+from sqlalchemy import bindparam, select
+from starlette.requests import Request
+
+import analytics
+import cache
+import clicks
+import database
+import keys
+import models
+import ratelimit
+import scanner
+import snapshot
+
+REDIRECT_FAST_PATH = os.getenv("REDIRECT_FAST_PATH", "1") not in ("0", "false", "False", "")
+REDIRECT_STATUS = int(os.getenv("REDIRECT_STATUS", "307"))
+# Порожньо — без заголовка. Довгий max-age ховає повторні кліки від статистики
+REDIRECT_CACHE_CONTROL = os.getenv("REDIRECT_CACHE_CONTROL", "")
+
+KEY_PATTERN = re.compile(r"^/([A-Za-z0-9]{1,32})$")
+counters = {"served": 0, "fallbacks": 0}
+
+LOOKUP = select(
+    models.URL.full_url, models.URL.scan_status, models.URL.expires_at, models.URL.max_clicks,
+).where(models.URL.short_key == bindparam("key"))
+
+
+def redirect_headers(full_url: str) -> list:
+    headers = [(b"location", snapshot.location(full_url).encode("latin-1")), (b"content-length", b"0")]
+    if REDIRECT_CACHE_CONTROL:
+        headers.append((b"cache-control", REDIRECT_CACHE_CONTROL.encode("latin-1")))
+    return headers
+
+
+async def fetch(engine, short_key: str):
+    async with engine.connect() as conn:
+        return (await conn.execute(LOOKUP, {"key": short_key})).first()
+
+
+async def lookup(short_key: str):
+    # Той самий url_cache, що й у crud.get_redirect_target, але без ORM-сесії
+    target = cache.url_cache.get(short_key)
+    if target is not None or short_key in cache.missing_url_cache:
+        return target
+    engine = database.replicas.engine_for()
+    try:
+        row = await fetch(engine, short_key)
+    except Exception as e:
+        if engine is database.async_engine:
+            raise
+        # Репліка недоступна: виводимо її з ротації і читаємо з primary
+        database.replicas.report_error(engine, e)
+        row = None
+    if row is None and engine is not database.async_engine:
+        # Щойно створене посилання могло ще не доїхати до репліки
+        row = await fetch(database.async_engine, short_key)
+    if row is None:
+        cache.missing_url_cache.set(short_key, True)
+        return None
+    target = cache.LinkTarget.from_row(row)
+    cache.url_cache.set(short_key, target)
+    return target
+
+
+class RedirectFastPath:
+    # Сирий ASGI-шар перед FastAPI: GET /{short_key} для чистого посилання обслуговується
+    # тут, без DI, сесії і Pydantic. Все інше (404, blocked, flagged, прострочені, з лімітом кліків,
+    # помилки) — у звичайний роут
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not REDIRECT_FAST_PATH or scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        match = KEY_PATTERN.match(scope["path"])
+        if match is None or match.group(1) in keys.RESERVED_KEYS:
+            return await self.app(scope, receive, send)
+
+        short_key = match.group(1)
+        scope["metrics_route"] = "/{short_key}"
+        try:
+            target = await lookup(short_key)
+        except Exception:
+            target = None
+        if (target is None or target.scan_status in (scanner.BLOCKED, scanner.FLAGGED)
+                or target.max_clicks is not None or target.expired(time.time())):
+            counters["fallbacks"] += 1
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        limiter = ratelimit.limiter
+        if limiter.enabled:
+            policy = limiter.policies["redirect"]
+            decision = await limiter.hit("redirect", ratelimit.client_identity(request, policy.scope))
+            if not decision.allowed:
+                body = b'{"detail":"Too Many Requests"}'
+                await send({"type": "http.response.start", "status": 429, "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(math.ceil(decision.retry_after)).encode()),
+                ]})
+                await send({"type": "http.response.body", "body": body})
+                return
+
+        clicks.click_buffer.add(short_key)
+        analytics.click_events.push(short_key, request.headers.get("referer"), request.headers.get("user-agent"))
+        counters["served"] += 1
+        await send({
+            "type": "http.response.start", "status": REDIRECT_STATUS, "headers": redirect_headers(target.full_url),
+        })
+        await send({"type": "http.response.body", "body": b""})
+
+
+def stats() -> dict:
+    return {"enabled": REDIRECT_FAST_PATH, **counters}
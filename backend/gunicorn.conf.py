@@ -0,0 +1,26 @@
+import os
+
+# Pre-fork запуск API: gunicorn -c gunicorn.conf.py main:app
+# Майстер один раз імпортує застосунок і робить main.preload(), воркери форкаються вже прогрітими
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# setdefault: RATE_LIMIT_STORE=auto і BULK_QUOTA_STORE=auto бачать ту саму кількість воркерів
+workers = int(os.environ.setdefault("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") not in ("0", "false", "False", "")
+# Новий воркер при падінні/рестарті теж стартує з fork, без повторного імпорту
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+
+def when_ready(server):
+    if preload_app:
+        import main
+
+        main.preload()
+
+
+def post_fork(server, worker):
+    # Майстер не відкриває з'єднань, але пули не повинні переходити у воркер навіть випадково
+    import database
+
+    database.engine.dispose(close=False)
+    database.async_engine.sync_engine.dispose(close=False)
@@ -0,0 +1,34 @@
+import os
+from typing import TYPE_CHECKING
+
+import metrics
+
+if TYPE_CHECKING:
+    import httpx
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+
+_client = None
+
+
+def get_client() -> "httpx.AsyncClient":
+    # Один пул з'єднань на процес замість нового AsyncClient (і TLS handshake) на кожен запит.
+    # httpx імпортується тут, при першому виклику, а не на старті
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+
+        _client = metrics.instrument_client(httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        ))
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
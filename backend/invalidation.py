@@ -0,0 +1,282 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, event, func, insert, make_url, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import clicks
+import models
+from database import DATABASE_URL, AsyncSessionLocal
+
+# auto — postgres, якщо основна база Postgres, інакше memory (один процес); sql — опитування таблиці
+# invalidation_events (SQLite з кількома воркерами); off — без шини
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "auto")
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "voidlink_invalidation")
+# LISTEN тримає окреме з'єднання напряму з Postgres: через pgbouncer у transaction mode воно не працює
+INVALIDATION_DATABASE_URL = os.getenv("INVALIDATION_DATABASE_URL") or DATABASE_URL
+INVALIDATION_POLL_INTERVAL = float(os.getenv("INVALIDATION_POLL_INTERVAL", "0.05"))
+# Скільки секунд зберігати події в таблиці для sql; воркер, що відстав більше, скидає кеш повністю
+INVALIDATION_RETENTION = float(os.getenv("INVALIDATION_RETENTION", "60"))
+INVALIDATION_RECONNECT_DELAY = float(os.getenv("INVALIDATION_RECONNECT_DELAY", "1"))
+# Як часто перевіряти, що LISTEN-з'єднання живе, сек
+INVALIDATION_KEEPALIVE = float(os.getenv("INVALIDATION_KEEPALIVE", "15"))
+# pg_notify обмежує payload 8000 байтами
+MAX_PAYLOAD = 7000
+
+# Події: g — посилання видалене (або прострочене), s — новий вердикт сканера (key=status),
+# p — змінився користувач (username, пароль, telegram_id)
+URL_GONE, SCAN_STATUS, USER = "g", "s", "p"
+
+
+def encode(origin: str, events: list) -> list:
+    # "origin sent_at_ms g:key,g:key2,p:42", кілька payload, якщо подій багато
+    header = f"{origin} {int(time.time() * 1000)} "
+    payloads, chunk = [], []
+    size = len(header)
+    for item in events:
+        if chunk and size + len(item) + 1 > MAX_PAYLOAD:
+            payloads.append(header + ",".join(chunk))
+            chunk, size = [], len(header)
+        chunk.append(item)
+        size += len(item) + 1
+    if chunk:
+        payloads.append(header + ",".join(chunk))
+    return payloads
+
+
+def decode(payload: str) -> tuple:
+    origin, sent_at, events = payload.split(" ", 2)
+    return origin, int(sent_at), [item.split(":", 1) for item in events.split(",")]
+
+
+def apply_event(kind: str, value: str):
+    if kind == URL_GONE:
+        cache.invalidate_url(value)
+        # Відстала репліка ще може віддати видалений рядок
+        cache.missing_url_cache.set(value, True)
+        clicks.click_buffer.discard(value)
+    elif kind == SCAN_STATUS:
+        short_key, _, status = value.partition("=")
+        target = cache.url_cache.get(short_key)
+        if target is not None:
+            cache.url_cache.set(short_key, target._replace(scan_status=status))
+    elif kind == USER:
+        cache.invalidate_user(int(value))
+
+
+def flush_all():
+    cache.url_cache.clear()
+    cache.missing_url_cache.clear()
+    cache.principal_cache.clear()
+
+
+class MemoryTransport:
+    # Один процес (тести, локальна розробка): доставка підписникам після коміту транзакції публікатора
+    name = "memory"
+
+    def __init__(self):
+        self._queues = []
+
+    async def publish(self, db: AsyncSession, payloads: list):
+        # Після rollback подія не повинна дочекатися наступного, вже чужого коміту цієї ж сесії
+        pending = [True]
+
+        def deliver(session):
+            if not pending[0]:
+                return
+            pending[0] = False
+            for queue in self._queues:
+                for payload in payloads:
+                    queue.put_nowait(payload)
+
+        def discard(session):
+            pending[0] = False
+
+        event.listen(db.sync_session, "after_commit", deliver, once=True)
+        event.listen(db.sync_session, "after_rollback", discard, once=True)
+
+    async def listen(self, on_payload, on_ready):
+        queue = asyncio.Queue()
+        self._queues.append(queue)
+        try:
+            on_ready()
+            while True:
+                on_payload(await queue.get())
+        finally:
+            self._queues.remove(queue)
+
+
+class SQLTransport:
+    # Події — рядки invalidation_events у транзакції запису; підписники опитують таблицю за id.
+    # Для SQLite (один записувач); у Postgres порядок id не гарантує порядок комітів — там postgres
+    name = "sql"
+
+    def __init__(self, session_factory=AsyncSessionLocal, poll_interval: float = INVALIDATION_POLL_INTERVAL,
+                 retention: float = INVALIDATION_RETENTION):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.retention = retention
+
+    async def publish(self, db: AsyncSession, payloads: list):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        await db.execute(insert(models.InvalidationEvent), [{"payload": p, "created_at": now} for p in payloads])
+
+    async def listen(self, on_payload, on_ready):
+        table = models.InvalidationEvent
+        async with self.session_factory() as db:
+            last_id = await db.scalar(select(func.max(table.id))) or 0
+        on_ready()
+        polled_at = pruned_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if time.monotonic() - polled_at > self.retention:
+                # Процес стояв довше, ніж живуть події: частину могли вже прибрати
+                raise ConnectionError("invalidation poll fell behind retention")
+            async with self.session_factory() as db:
+                rows = (await db.execute(
+                    select(table.id, table.payload).where(table.id > last_id).order_by(table.id).limit(1000)
+                )).all()
+                if time.monotonic() - pruned_at > self.retention:
+                    expired = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=self.retention)
+                    await db.execute(delete(table).where(table.created_at < expired))
+                    await db.commit()
+                    pruned_at = time.monotonic()
+            polled_at = time.monotonic()
+            for event_id, payload in rows:
+                last_id = event_id
+                on_payload(payload)
+
+
+class PostgresTransport:
+    # NOTIFY у транзакції запису (доставляється лише після коміту), LISTEN на окремому asyncpg-з'єднанні
+    name = "postgres"
+
+    def __init__(self, url: str = INVALIDATION_DATABASE_URL, channel: str = INVALIDATION_CHANNEL,
+                 keepalive: float = INVALIDATION_KEEPALIVE):
+        self.dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.keepalive = keepalive
+
+    async def publish(self, db: AsyncSession, payloads: list):
+        for payload in payloads:
+            await db.execute(select(func.pg_notify(self.channel, payload)))
+
+    async def listen(self, on_payload, on_ready):
+        import asyncpg
+
+        conn = await asyncpg.connect(self.dsn)
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda _: lost.set())
+        try:
+            await conn.add_listener(self.channel, lambda _conn, _pid, _channel, payload: on_payload(payload))
+            on_ready()
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    # Напіввідкрите TCP-з'єднання саме не закриється: перевіряємо запитом
+                    await asyncio.wait_for(conn.execute("SELECT 1"), timeout=self.keepalive)
+            raise ConnectionError("invalidation listener connection lost")
+        finally:
+            if not conn.is_closed():
+                conn.terminate()
+
+
+class InvalidationBus:
+    def __init__(self, transport, origin: str = None, reconnect_delay: float = INVALIDATION_RECONNECT_DELAY):
+        self.transport = transport
+        # Свої події процес уже застосував після коміту — їх пропускаємо.
+        # Без явного origin він свій у кожного процесу: bus створюється при імпорті, до fork воркерів
+        self._origin = origin
+        self._origin_pid = os.getpid() if origin else None
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self.published = 0
+        self.received = 0
+        self.own = 0
+        self.malformed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_delay_ms = 0.0
+
+    @property
+    def origin(self) -> str:
+        pid = os.getpid()
+        if self._origin_pid != pid:
+            self._origin = f"{pid:x}{uuid.uuid4().hex[:6]}"
+            self._origin_pid = pid
+        return self._origin
+
+    async def publish(self, db: AsyncSession, kind: str, values):
+        # У транзакції виклику, до commit: інші процеси дізнаються лише про закомічені зміни
+        values = [str(value) for value in values]
+        if self.transport is None or not values:
+            return
+        await self.transport.publish(db, encode(self.origin, [f"{kind}:{value}" for value in values]))
+        self.published += len(values)
+
+    def handle(self, payload: str):
+        try:
+            origin, sent_at, events = decode(payload)
+            if origin == self.origin:
+                self.own += 1
+                return
+            for kind, value in events:
+                apply_event(kind, value)
+        except ValueError:
+            self.malformed += 1
+            return
+        self.received += len(events)
+        self.last_delay_ms = max(0.0, time.time() * 1000 - sent_at)
+
+    def _on_ready(self):
+        # Поки підписки не було, події могли пройти повз: локальний кеш скидаємо повністю
+        flush_all()
+        self.flushes += 1
+        self.connected = True
+
+    async def run(self):
+        if self.transport is None:
+            return
+        while True:
+            try:
+                await self.transport.listen(self.handle, self._on_ready)
+            except Exception as e:
+                self.failures += 1
+                print(f"Invalidation bus listener failed: {e}")
+            self.connected = False
+            await asyncio.sleep(self.reconnect_delay)
+
+    def stats(self) -> dict:
+        return {
+            "transport": self.transport.name if self.transport else None,
+            "origin": self.origin,
+            "connected": self.connected,
+            "published": self.published,
+            "received": self.received,
+            "own": self.own,
+            "malformed": self.malformed,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "last_delay_ms": round(self.last_delay_ms, 1),
+        }
+
+
+def build_transport(name: str):
+    if name == "auto":
+        backend = make_url(DATABASE_URL).get_backend_name() if DATABASE_URL else None
+        name = "postgres" if backend == "postgresql" else "memory"
+    if name == "off":
+        return None
+    if name == "postgres":
+        return PostgresTransport()
+    if name == "sql":
+        return SQLTransport()
+    return MemoryTransport()
+
+
+bus = InvalidationBus(build_transport(INVALIDATION_BUS))
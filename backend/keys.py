@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import os
+import secrets
+import string
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+ALPHABET = string.ascii_letters + string.digits
+BASE = len(ALPHABET)
+
+# Старі ключі були випадковими з 5 символів, тож нові починаються з 6 і не можуть з ними збігтися
+KEY_MIN_LENGTH = int(os.getenv("KEY_MIN_LENGTH", "6"))
+KEY_BLOCK_SIZE = int(os.getenv("KEY_BLOCK_SIZE", "1000"))
+KEY_SCRAMBLE = os.getenv("KEY_SCRAMBLE", "1") not in ("0", "false", "False", "")
+# Лише початкове значення: секрет зберігається в key_sequences при першій видачі ключів і далі береться
+# звідти, тож зміна змінної (чи ротація SECRET_KEY) не перемішує вже видані ключі з новими
+KEY_SCRAMBLE_SECRET = os.getenv("KEY_SCRAMBLE_SECRET")
+# Чим скремблювалися ключі до того, як секрет почав зберігатися в базі
+LEGACY_SCRAMBLE_SECRET = KEY_SCRAMBLE_SECRET or os.getenv("SECRET_KEY") or "voidlink"
+# Видавати повторно ключі прострочених посилань (sweeper.py). Карантин — щоб старі QR і роздруківки
+# встигли "померти", перш ніж ключ почне вести на чуже посилання
+KEY_RECYCLE = os.getenv("KEY_RECYCLE", "0") not in ("0", "false", "False", "")
+KEY_RECYCLE_AFTER = float(os.getenv("KEY_RECYCLE_AFTER", str(30 * 86400)))
+# Якщо вільних ключів немає, наступна перевірка таблиці не раніше ніж через стільки секунд
+KEY_RECYCLE_RECHECK = 60
+
+SEQUENCE_NAME = "urls"
+
+# Ключі, які перекриваються однорівневими роутами API
+RESERVED_KEYS = {"docs", "redoc", "token", "register", "shorten", "metrics", "internal"}
+
+
+def base62_encode(number: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        number, rem = divmod(number, BASE)
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def base62_decode(key: str) -> int:
+    number = 0
+    for char in key:
+        number = number * BASE + ALPHABET.index(char)
+    return number
+
+
+class KeyCodec:
+    # id -> ключ. Ключі довжини L покривають наступні 62^L id, тож довжина
+    # росте сама, коли простір заповнюється. Скремблінг — афінна бієкція
+    # всередині кожної довжини (x * a + b) mod 62^L: ключі не йдуть підряд,
+    # але це не криптографія. secret=None — взяти збережений у key_sequences (KeyAllocator)
+    def __init__(self, min_length: int, scramble: bool, secret: str = None):
+        self.min_length = min_length
+        self.scramble = scramble
+        self.secret = secret
+        self._params = {}
+
+    def _band(self, number: int):
+        length, offset = self.min_length, 0
+        while number >= offset + BASE ** length:
+            offset += BASE ** length
+            length += 1
+        return length, number - offset
+
+    def use_secret(self, secret: str):
+        if secret != self.secret:
+            self.secret = secret
+            self._params = {}
+
+    def _affine(self, length: int):
+        params = self._params.get(length)
+        if params is None:
+            if self.secret is None:
+                raise RuntimeError("Key scramble secret is not loaded yet")
+            space = BASE ** length
+            digest = hashlib.sha256(f"{self.secret}:{length}".encode()).digest()
+            a = int.from_bytes(digest[:16], "big") % space
+            b = int.from_bytes(digest[16:], "big") % space
+            # a має бути взаємно простим з 62^L = 2^L * 31^L
+            a |= 1
+            while a % 31 == 0:
+                a = (a + 2) % space
+            params = self._params[length] = (a, b)
+        return params
+
+    def encode(self, number: int) -> str:
+        length, index = self._band(number)
+        if self.scramble:
+            a, b = self._affine(length)
+            index = (index * a + b) % BASE ** length
+        return base62_encode(index, length)
+
+
+class KeyAllocator:
+    def __init__(self, codec: KeyCodec, block_size: int, recycle: bool = False):
+        self.codec = codec
+        self.block_size = block_size
+        self.recycle = recycle
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+        self._recycled_empty_until = 0.0
+        self.blocks_reserved = 0
+        self.keys_issued = 0
+        self.keys_recycled = 0
+
+    async def _reserve(self, db: AsyncSession, count: int):
+        # Окрема транзакція на тому ж engine: блок id має бути закомічений
+        # незалежно від того, чи закомітить свою транзакцію виклик
+        async with AsyncSession(db.bind) as seq_db:
+            table = models.KeySequence
+            row = (await seq_db.execute(
+                update(table)
+                .where(table.name == SEQUENCE_NAME)
+                .values(next_id=table.next_id + count)
+                .returning(table.next_id, table.scramble_secret)
+            )).first()
+            if row is None:
+                secret = self.codec.secret or KEY_SCRAMBLE_SECRET or secrets.token_urlsafe(32)
+                try:
+                    await seq_db.execute(
+                        insert(table).values(name=SEQUENCE_NAME, next_id=count, scramble_secret=secret)
+                    )
+                    end = count
+                except IntegrityError:
+                    # Інший воркер створив рядок паралельно
+                    await seq_db.rollback()
+                    return await self._reserve(db, count)
+            else:
+                end, secret = row
+                if secret is None:
+                    # База з часів до збереження секрету: фіксуємо той, яким уже видано ключі
+                    await seq_db.execute(
+                        update(table)
+                        .where(table.name == SEQUENCE_NAME, table.scramble_secret.is_(None))
+                        .values(scramble_secret=self.codec.secret or LEGACY_SCRAMBLE_SECRET)
+                    )
+                    secret = await seq_db.scalar(select(table.scramble_secret).where(table.name == SEQUENCE_NAME))
+            await seq_db.commit()
+        if self.codec.secret is None:
+            self.codec.use_secret(secret)
+        self.blocks_reserved += 1
+        return end - count, end
+
+    async def allocate_ids(self, db: AsyncSession, count: int = 1) -> list:
+        async with self._lock:
+            ids = []
+            while len(ids) < count:
+                if self._next >= self._end:
+                    self._next, self._end = await self._reserve(db, max(self.block_size, count - len(ids)))
+                take = min(self._end - self._next, count - len(ids))
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+            return ids
+
+    async def take_recycled(self, db: AsyncSession, count: int) -> list:
+        # У транзакції виклику: якщо вона відкотиться, ключі повернуться в пул
+        if not self.recycle or time.monotonic() < self._recycled_empty_until:
+            return []
+        table = models.RecycledKey
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        available = select(table.short_key).where(table.available_at <= now).order_by(table.available_at).limit(count)
+        keys = list((await db.execute(
+            delete(table).where(table.short_key.in_(available)).returning(table.short_key)
+        )).scalars())
+        if len(keys) < count:
+            self._recycled_empty_until = time.monotonic() + KEY_RECYCLE_RECHECK
+        self.keys_recycled += len(keys)
+        return keys
+
+    async def allocate_many(self, db: AsyncSession, count: int) -> list:
+        keys = await self.take_recycled(db, count)
+        while len(keys) < count:
+            for number in await self.allocate_ids(db, count - len(keys)):
+                key = self.codec.encode(number)
+                if key not in RESERVED_KEYS:
+                    keys.append(key)
+        self.keys_issued += len(keys)
+        return keys
+
+    async def allocate(self, db: AsyncSession) -> str:
+        return (await self.allocate_many(db, 1))[0]
+
+    def stats(self) -> dict:
+        return {
+            "block_size": self.block_size,
+            "blocks_reserved": self.blocks_reserved,
+            "keys_issued": self.keys_issued,
+            "keys_recycled": self.keys_recycled,
+            "ids_left_in_block": self._end - self._next,
+            "next_key_length": self.codec._band(self._next)[0],
+        }
+
+
+key_allocator = KeyAllocator(
+    KeyCodec(min_length=KEY_MIN_LENGTH, scramble=KEY_SCRAMBLE),
+    block_size=KEY_BLOCK_SIZE,
+    recycle=KEY_RECYCLE,
+)
@@ -1,102 +1,161 @@
-from typing import List, Optional
-import httpx
+import asyncio
+import gc
+import json
+from contextlib import asynccontextmanager, suppress
+from typing import List, Literal, Optional
 import os
-from fastapi import Depends, FastAPI, HTTPException, Header
+import time
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi_throttle import RateLimiter
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
-from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
 
+import analytics
 import auth
+import bulk
+import cache
+import clicks
 import crud
+import fastredirect
+import hashing
+import metrics
+import http_client
+import invalidation
 import models
+import qr_creater
+import ratelimit
+import reporting
+import reputation
+import scanner
 import schemas
-from database import engine, get_db
-from utils import validate_url, get_url_id
-
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="URL Shortener Pro", redirect_slashes=False)
+import sweeper
+from database import (PRIMARY_UNTIL_HEADER, ReadYourWrites, async_engine, engine, get_async_db, get_replica_db,
+                      pool_stats, release_connection, replicas)
+from utils import validate_url, short_url, encode_cursor, decode_cursor, url_hash
+
+# Локальна розробка і бенчмарки: накотити схему в lifespan замість окремого python migrations.py
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "0") not in ("0", "false", "False", "")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MIGRATE_ON_STARTUP:
+        import migrations
+
+        await asyncio.to_thread(migrations.upgrade)
+    background = [
+        asyncio.create_task(clicks.click_buffer.run()),
+        asyncio.create_task(analytics.click_events.run()),
+        asyncio.create_task(scanner.scan_queue.run()),
+        asyncio.create_task(reporting.error_reporter.run()),
+        asyncio.create_task(ratelimit.limiter.run()),
+        asyncio.create_task(replicas.run()),
+        asyncio.create_task(sweeper.expiry_sweeper.run()),
+        asyncio.create_task(invalidation.bus.run()),
+    ]
+    yield
+    for task in background:
+        task.cancel()
+    for task in background:
+        with suppress(asyncio.CancelledError):
+            await task
+    # Не втрачаємо кліки, які ще не дійшли до бази
+    await clicks.click_buffer.flush_now()
+    await analytics.click_events.flush_all()
+    hashing.password_hasher.shutdown()
+    await reputation.reputation_service.close()
+    await ratelimit.limiter.close()
+    await reporting.error_reporter.flush(force=True)
+    await http_client.close()
+    await replicas.close()
+
+
+router = APIRouter()
 
 origins = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=origins,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-async def send_error_to_dev_telegram(error_report):
-    tg_id = os.getenv("TG_ID")
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    tg_url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {
-            "chat_id": tg_id,
-            "text": error_report,
-            "parse_mode": "Markdown"
-        }
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(tg_url, json=payload)
-        except Exception as e:
-            print(f"Ошибка отправки лога в Telegram: {e}")
+async def log_test(e: Exception, endpoint: str):
+    # Тільки ставить помилку в чергу: дайджест у Telegram шле фоновий error_reporter
+    reporting.error_reporter.report(e, endpoint)
+
+
+QR_CACHE_MAX_AGE = int(os.getenv("QR_CACHE_MAX_AGE", "86400"))
+# /my-urls?include_qr=true: не більше стільки рядків на сторінку, решта — за курсором
+MY_URLS_QR_LIMIT = int(os.getenv("MY_URLS_QR_LIMIT", "50"))
+
+
+async def url_infos(db_urls: list, include_qr: bool = False) -> List[schemas.URLInfo]:
+    # clicks з бази + ще не записані кліки з буфера
+    infos = [
+        schemas.URLInfo(
+            id=db_url.id,
+            full_url=db_url.full_url,
+            short_key=db_url.short_key,
+            clicks=(db_url.clicks or 0) + clicks.click_buffer.pending(db_url.short_key),
+            created_at=db_url.created_at,
+            scan_status=db_url.scan_status,
+            expires_at=db_url.expires_at,
+            max_clicks=db_url.max_clicks,
+        )
+        for db_url in db_urls
+    ]
+    if include_qr and infos:
+        # Рендер QR — CPU-робота: одним викликом у потоці, щоб не блокувати event loop
+        codes = await asyncio.to_thread(
+            lambda: [qr_creater.generate_qr_base64(short_url(info.short_key)) for info in infos]
+        )
+        for info, code in zip(infos, codes):
+            info.qr_code = code
+    return infos
 
 
-async def log_test(e: Exception, endpoint: str):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    error_report = (
-        f"❌ **VoidLink Error**\n"
-        f"**Endpoint:** {endpoint}\n"
-        f"**Error details:** `{str(e)}`"
-        f"**Timestamp:** `{timestamp}`"
-    )
-    await send_error_to_dev_telegram(error_report)
+async def url_info(db_url: models.URL, include_qr: bool = False) -> schemas.URLInfo:
+    return (await url_infos([db_url], include_qr))[0]
 
 
 # AUTH ЕНДПОІНТИ
-@app.post("/register", response_model=schemas.UserInfo, tags=["Users"], summary="Register a new user",
-          dependencies=[Depends(RateLimiter(times=3, seconds=600))])
-async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+@router.post("/register", response_model=schemas.UserInfo, tags=["Users"], summary="Register a new user",
+          dependencies=[Depends(ratelimit.RateLimit("register"))])
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     try:
 
         if not user.username or not user.password:
             raise HTTPException(status_code=400, detail="Password or username is required.")
 
 
-        db_user = crud.get_user_by_username(db, username=user.username)
+        db_user = await crud.get_user_by_username(db, username=user.username)
         if db_user:
             raise HTTPException(status_code=400, detail="User already exists")
 
-        return crud.create_user(db=db, user=user)
+        return await crud.create_user(db=db, user=user)
 
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="User already exists")
 
     except HTTPException as http_exc:
         raise http_exc
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         await log_test(e, endpoint="/register")
         raise HTTPException(
             status_code=500,
             detail="Something went wrong on our side. The developer has been notified."
         )
 
-@app.post("/token", tags=["Users"], summary="Login", dependencies=[Depends(RateLimiter(times=3, seconds=60))]) ## login
-async def login(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+@router.post("/token", tags=["Users"], summary="Login", dependencies=[Depends(ratelimit.RateLimit("login"))]) ## login
+async def login(db: AsyncSession = Depends(get_async_db), form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        user = crud.get_user_by_username(db, username=form_data.username)
-        if not user or not auth.verify_password(form_data.password, user.hashed_password):
+        user = await crud.get_user_by_username(db, username=form_data.username)
+        await release_connection(db)
+        if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
         access_token = auth.create_access_token(data={"sub": user.username})
@@ -112,28 +171,36 @@ async def login(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestF
             detail="Something went wrong on our side. The developer has been notified."
         )
 
-@app.post("/user/change-password", tags=["Users"], summary="Change password", dependencies=[Depends(RateLimiter(times=3, seconds=900))])
+@router.post("/user/change-password", tags=["Users"], summary="Change password",
+             dependencies=[Depends(ratelimit.user_rate_limit("change_password", auth.get_current_user))])
 async def change_password(
         data: schemas.PasswordChange,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(auth.get_current_user)
 ):
     try:
-        if not auth.verify_password(data.old_password, current_user.hashed_password):
+        await release_connection(db)
+        if not await auth.verify_password_async(data.old_password, current_user.hashed_password):
             raise HTTPException(status_code=401, detail="Invalid current password")
 
-        if auth.verify_password(data.new_password, current_user.hashed_password):
+        # Старий пароль уже перевірений, тож другий bcrypt для нового не потрібен
+        if data.new_password == data.old_password:
             raise HTTPException(status_code=400, detail="New password cannot be the same as the old one")
 
-        current_user.hashed_password = auth.get_password_hash(data.new_password)
-        db.commit()
+        hashed_password = await auth.get_password_hash_async(data.new_password)
+        db.add(current_user)
+        current_user.hashed_password = hashed_password
+        await invalidation.bus.publish(db, invalidation.USER, [current_user.id])
+        await db.commit()
+        replicas.mark_write(current_user.id)
+        cache.invalidate_user(current_user.id)
         return {"message": "Password updated successfully"}
 
     except HTTPException as http_exc:
         raise http_exc
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         await log_test(e, endpoint="/user/change-password")
         raise HTTPException(
             status_code=500,
@@ -141,15 +208,15 @@ async def change_password(
         )
 
 
-@app.post("/user/change-username", tags=["Users"], summary="Change username",
-          dependencies=[Depends(RateLimiter(times=3, seconds=600))])
+@router.post("/user/change-username", tags=["Users"], summary="Change username",
+             dependencies=[Depends(ratelimit.user_rate_limit("change_username", auth.get_current_user))])
 async def change_username(
         data: schemas.UsernameChange,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(auth.get_current_user)
 ):
     try:
-        user_exists = db.query(models.User).filter(models.User.username == data.new_username).first()
+        user_exists = await crud.get_user_by_username(db, username=data.new_username)
 
         if user_exists:
             raise HTTPException(status_code=400, detail="Username already taken")
@@ -158,14 +225,17 @@ async def change_username(
             raise HTTPException(status_code=400, detail="Invalid username")
 
         current_user.username = data.new_username
-        db.commit()
+        await invalidation.bus.publish(db, invalidation.USER, [current_user.id])
+        await db.commit()
+        replicas.mark_write(current_user.id)
+        cache.invalidate_user(current_user.id)
         return {"status": "success", "new_username": current_user.username}
 
     except HTTPException as http_exc:
         raise http_exc
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         await log_test(e, endpoint="/user/change-username")
         raise HTTPException(
             status_code=500,
@@ -175,99 +245,231 @@ async def change_username(
 
 # URL ЕНДПОІНТИ
 
-@app.post(
+@router.post(
     "/shorten",
     response_model=schemas.URLInfo,
+    response_model_exclude_none=True,
     tags=["Url"],
     summary="Shorten URL",
-    dependencies=[Depends(RateLimiter(times=1, seconds=300))]
+    dependencies=[Depends(ratelimit.user_rate_limit("shorten", auth.get_principal))]
 )
 async def create_url(
     url: schemas.URLCreate,
-    db: Session = Depends(get_db),
-    x_telegram_id: Optional[str] = Header(None, alias="X-Telegram-ID"),
-    token: Optional[str] = Depends(auth.oauth2_scheme)
+    db: AsyncSession = Depends(get_async_db),
+    user: auth.Principal = Depends(auth.get_principal),
+    include_qr: bool = False,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
 ):
     try:
-        user = None
-        if x_telegram_id:
-            user = db.query(models.User).filter(models.User.telegram_id == int(x_telegram_id)).first()
+        safe_url = validate_url(url.target_url)
+        expires_at = url.expires_at
+        if expires_at is not None:
+            # Колонка naive UTC
+            if expires_at.tzinfo is not None:
+                expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+            if expires_at <= datetime.now(timezone.utc).replace(tzinfo=None):
+                raise HTTPException(status_code=400, detail="expires_at must be in the future")
+        if idempotency_key:
+            request_hash = url_hash(crud.with_scheme(safe_url))
+            record = await crud.get_idempotency_record(db, user.id, idempotency_key, crud.IDEMPOTENCY_KEY_TTL)
+            if record is not None:
+                if record.request_hash != request_hash:
+                    raise HTTPException(status_code=422,
+                                        detail="Idempotency-Key was already used with a different URL")
+                db_url = await crud.get_user_url(db, url_key=record.short_key, user_id=user.id)
+                if db_url is not None:
+                    return await url_info(db_url, include_qr=include_qr)
+
+        db_url = await crud.create_db_url(db=db, url_address=safe_url, user_id=user.id, expires_at=expires_at,
+                                          max_clicks=url.max_clicks)
+        if idempotency_key:
+            await crud.save_idempotency_key(db, user.id, idempotency_key, request_hash, db_url.short_key)
+        return await url_info(db_url, include_qr=include_qr)
+
+    except HTTPException as http_exc:
+        raise http_exc
+
+    except Exception as e:
+        await log_test(e, endpoint="/create_url")
+        raise HTTPException(
+            status_code=500,
+            detail="Something went wrong on our side. The developer has been notified."
+        )
 
-        if not user and token:
-            user = auth.get_current_user(db, token)
 
-        if not user:
-            raise HTTPException(status_code=401, detail="Unauthorized")
 
-        safe_url = validate_url(url.target_url)
-        return crud.create_db_url(db=db, url_address=safe_url, user_id=user.id)
+@router.post("/shorten/bulk", tags=["Url"], summary="Shorten many URLs (JSON array or NDJSON stream)")
+async def create_urls_bulk(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user: auth.Principal = Depends(auth.get_principal)
+):
+    try:
+        # Тіло дочитується до відповіді: StreamingResponse сам слухає receive() на disconnect
+        try:
+            if request.headers.get("content-type", "").split(";")[0].strip() in bulk.NDJSON_TYPES:
+                body = [item async for item in bulk.iter_ndjson(request.stream())]
+            else:
+                body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if len(body) > bulk.BULK_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Too many items, limit is {bulk.BULK_MAX_ITEMS}")
+
+        await bulk.bulk_quota.start_job(user.id)
 
     except HTTPException as http_exc:
         raise http_exc
 
     except Exception as e:
-        await log_test(e, endpoint="/create_url")
+        await log_test(e, endpoint="/shorten/bulk")
         raise HTTPException(
             status_code=500,
             detail="Something went wrong on our side. The developer has been notified."
         )
 
+    async def results():
+        try:
+            async for result in bulk.shorten_stream(db, user.id, bulk.iter_list(body)):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            await db.rollback()
+            await log_test(e, endpoint="/shorten/bulk")
+            yield json.dumps({"error": "Something went wrong on our side. The developer has been notified."}) + "\n"
 
+    return bulk.JobStreamingResponse(results(), bulk.bulk_quota, user.id, media_type="application/x-ndjson")
 
-@app.get("/my-urls", response_model=List[schemas.URLInfo], tags=["Url"])
+
+@router.get("/my-urls", response_model=List[schemas.URLInfo], response_model_exclude_none=True, tags=["Url"])
 async def list_my_urls(
-        db: Session = Depends(get_db),
-        x_telegram_id: Optional[str] = Header(None, alias="X-Telegram-ID"),
-        token: Optional[str] = Depends(auth.oauth2_scheme)
+        response: Response,
+        db: AsyncSession = Depends(auth.get_principal_read_db),
+        user: auth.Principal = Depends(auth.get_principal),
+        include_qr: bool = False,
+        limit: int = Query(100, ge=1, le=1000),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor з попередньої сторінки"),
+        sort: Literal["created_at", "-created_at", "clicks", "-clicks"] = "-created_at",
+        q: Optional[str] = Query(None, max_length=200, description="Підрядок цільового URL"),
+        min_clicks: Optional[int] = Query(None, ge=0),
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None
 ):
-    print(f"DEBUG: X-Telegram-ID from header: {x_telegram_id}")
     try:
-        if x_telegram_id:
-            user = db.query(models.User).filter(models.User.telegram_id == int(x_telegram_id)).first()
-            print(f"DEBUG: Found user in DB: {user}")
-            if user:
-                return user.urls
-
-        if token:
-            user = auth.get_current_user(db, token)
-            return user.urls
+        after = None
+        if cursor:
+            try:
+                value, last_id = decode_cursor(cursor)
+                sort_value = datetime.fromisoformat(value) if sort.lstrip("-") == "created_at" else int(value)
+                after = (sort_value, int(last_id))
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        if include_qr:
+            limit = min(limit, MY_URLS_QR_LIMIT)
+        rows, has_more = await crud.list_user_urls(
+            db,
+            user_id=user.id,
+            limit=limit,
+            sort=sort,
+            after=after,
+            search=q,
+            min_clicks=min_clicks,
+            created_after=created_after,
+            created_before=created_before,
+        )
+        if has_more:
+            last = rows[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor([getattr(last, sort.lstrip("-")), last.id])
+        return await url_infos(rows, include_qr)
 
     except HTTPException as http_exc:
         raise http_exc
 
     except Exception as e:
+        replicas.report_error(db.bind, e)
         await log_test(e, endpoint="/my-urls")
         raise HTTPException(
             status_code=500,
             detail="Something went wrong on our side. The developer has been notified."
         )
 
-@app.get("/{short_key}", tags=["Url"], summary="Check redirect", dependencies=[Depends(RateLimiter(times=3, seconds=600))])
-async def redirect(short_key: str, db: Session = Depends(get_db)):
+@router.get("/metrics", tags=["Internal"], summary="Prometheus metrics", include_in_schema=False,
+            dependencies=[Depends(auth.require_internal_token)])
+async def prometheus_metrics():
+    content, media_type = metrics.render()
+    return Response(content=content, media_type=media_type)
+
+
+@router.get("/internal/stats", tags=["Internal"], summary="Cache hit/miss statistics",
+            dependencies=[Depends(auth.require_internal_token)])
+async def internal_stats():
+    return {
+        "cache": cache.stats(),
+        "clicks": clicks.click_buffer.stats(),
+        "password_hasher": hashing.password_hasher.stats(),
+        "qr_cache": qr_creater.qr_cache.stats(),
+        "click_events": analytics.click_events.stats(),
+        "reputation": reputation.reputation_service.stats(),
+        "scanner": scanner.scan_queue.stats(),
+        "error_reporter": reporting.error_reporter.stats(),
+        "rate_limit": ratelimit.limiter.stats(),
+        "redirect_fast_path": fastredirect.stats(),
+        "db_pool": pool_stats(),
+        "replicas": replicas.stats(),
+        "sweeper": sweeper.expiry_sweeper.stats(),
+        "invalidation": invalidation.bus.stats(),
+    }
+
+
+@router.get("/{short_key}", tags=["Url"], summary="Check redirect",
+            dependencies=[Depends(ratelimit.RateLimit("redirect"))])
+async def redirect(short_key: str, request: Request, confirm: bool = False,
+                   db: AsyncSession = Depends(get_async_db), read_db: AsyncSession = Depends(get_replica_db)):
     try:
-        db_url = crud.get_db_url_by_key(db, url_key=short_key)
-        if db_url:
-            crud.update_db_clicks(db, db_url)
-            return RedirectResponse(db_url.full_url)
+        target = await crud.get_redirect_target(read_db, url_key=short_key, primary=db)
+        if target is None:
+            raise HTTPException(status_code=404, detail="URL not found")
+
+        # Вердикт і термін життя вже в кеші/рядку, жодних зовнішніх запитів на шляху редиректу
+        full_url, scan_status = target.full_url, target.scan_status
+        if target.expired(time.time()):
+            raise HTTPException(status_code=410, detail="This link has expired")
+        if scan_status == scanner.BLOCKED:
+            raise HTTPException(status_code=403, detail="This link has been blocked as malicious")
+        if scan_status == scanner.FLAGGED and not confirm:
+            return HTMLResponse(scanner.interstitial_page(short_key, full_url),
+                                headers={"Cache-Control": "no-store"})
+
+        if target.max_clicks is None:
+            clicks.click_buffer.add(short_key)
+        elif not await crud.consume_click(db, short_key):
+            raise HTTPException(status_code=410, detail="This link has reached its click limit")
+        analytics.click_events.push(short_key, request.headers.get("referer"), request.headers.get("user-agent"))
+        cache_control = fastredirect.REDIRECT_CACHE_CONTROL
+        headers = {"Cache-Control": cache_control} if cache_control else None
+        return RedirectResponse(full_url, status_code=fastredirect.REDIRECT_STATUS, headers=headers)
 
     except HTTPException as http_exc:
         raise http_exc
 
     except Exception as e:
+        replicas.report_error(read_db.bind, e)
         await log_test(e, endpoint="/{short_key}")
         raise HTTPException(
             status_code=500,
             detail="Something went wrong on our side. The developer has been notified."
         )
 
-@app.delete("/my-urls/{short_key}", tags=["Url"], summary="Delete short url")
+@router.delete("/my-urls/{short_key}", tags=["Url"], summary="Delete short url")
 async def delete_url(
     short_key: str,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     try:
-        crud.delete_db_url(db, short_key, current_user.id)
+        await crud.delete_db_url(db, short_key, current_user.id)
         return {"message": "Deleted successfully"}
 
     except HTTPException as http_exc:
@@ -279,26 +481,105 @@ async def delete_url(
             status_code=500,
             detail="Something went wrong on our side. The developer has been notified."
         )
-@app.get("/my-urls/{short_key}", response_model=schemas.URLInfo, tags=["Url"], summary="Get short url statistic and information")
-async def get_url_info(short_key: str, db: Session = Depends(get_db), current_user=Depends(auth.get_current_user)):
+@router.get("/my-urls/{short_key}", response_model=schemas.URLInfo, response_model_exclude_none=True, tags=["Url"],
+         summary="Get short url statistic and information")
+async def get_url_info(
+        short_key: str,
+        include_qr: bool = False,
+        db: AsyncSession = Depends(auth.get_current_principal_read_db),
+        current_user: auth.Principal = Depends(auth.get_current_principal)
+):
     try:
-        db_url = db.query(models.URL).filter(
-            models.URL.short_key == short_key,
-            models.URL.owner_id == current_user.id
-        ).first()
-        return db_url
+        db_url = await crud.get_user_url(db, url_key=short_key, user_id=current_user.id)
+        if db_url is None:
+            raise HTTPException(status_code=404, detail="URL not found")
+        return await url_info(db_url, include_qr=include_qr)
 
     except HTTPException as http_exc:
         raise http_exc
 
     except Exception as e:
+        replicas.report_error(db.bind, e)
         await log_test(e, endpoint="get /my-urls/{short_key}")
         raise HTTPException(
             status_code=500,
             detail="Something went wrong on our side. The developer has been notified."
         )
 
-@app.post("/check_url", summary="Check URL", tags=["Url"])
+@router.get("/my-urls/{short_key}/stats", tags=["Url"], summary="Click time series for a short url")
+async def get_url_stats(
+        short_key: str,
+        stats_range: Literal["1h", "24h", "7d", "30d"] = Query("24h", alias="range"),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: auth.Principal = Depends(auth.get_current_principal)
+):
+    try:
+        if await crud.get_user_url(db, url_key=short_key, user_id=current_user.id) is None:
+            raise HTTPException(status_code=404, detail="URL not found")
+
+        # Тільки агрегати: ціна запиту не залежить від кількості сирих кліків
+        duration, granularity = analytics.STATS_RANGES[stats_range]
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        since = analytics.GRANULARITIES[granularity](now - duration)
+        buckets = await crud.get_click_rollups(db, url_key=short_key, granularity=granularity, since=since)
+        return {
+            "short_key": short_key,
+            "range": stats_range,
+            "granularity": granularity,
+            "total": sum(count for _, count in buckets),
+            "buckets": [{"start": start, "clicks": count} for start, count in buckets],
+        }
+
+    except HTTPException as http_exc:
+        raise http_exc
+
+    except Exception as e:
+        await log_test(e, endpoint="get /my-urls/{short_key}/stats")
+        raise HTTPException(
+            status_code=500,
+            detail="Something went wrong on our side. The developer has been notified."
+        )
+
+
+@router.get("/qr/{short_key}", tags=["Url"], summary="QR code for a short url")
+async def get_qr(
+        short_key: str,
+        size: int = Query(10, ge=1, le=40, description="Розмір одного модуля QR у пікселях"),
+        image_format: Literal["png", "svg"] = Query("png", alias="format"),
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        if await crud.get_full_url_by_key(db, url_key=short_key) is None:
+            raise HTTPException(status_code=404, detail="URL not found")
+
+        data = short_url(short_key)
+        headers = {
+            "ETag": qr_creater.qr_etag(data, size, image_format),
+            "Cache-Control": f"public, max-age={QR_CACHE_MAX_AGE}",
+        }
+        if if_none_match == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+
+        cache_key = (data, size, image_format)
+        image = qr_creater.qr_cache.get(cache_key)
+        if image is None:
+            image = await asyncio.to_thread(qr_creater.render_qr, data, size, image_format)
+            qr_creater.qr_cache.set(cache_key, image)
+        return Response(content=image, media_type=qr_creater.QR_MEDIA_TYPES[image_format], headers=headers)
+
+    except HTTPException as http_exc:
+        raise http_exc
+
+    except Exception as e:
+        await log_test(e, endpoint="/qr/{short_key}")
+        raise HTTPException(
+            status_code=500,
+            detail="Something went wrong on our side. The developer has been notified."
+        )
+
+
+@router.post("/check_url", summary="Check URL", tags=["Url"])
 async def check_url(payload: schemas.CheckURL):
     if payload.target_url in ["http://", "https://", "http:", "https:", "https:/", "http:/"]:
         raise HTTPException(status_code=400, detail="Invalid URL.")
@@ -312,27 +593,17 @@ async def check_url(payload: schemas.CheckURL):
     except ValueError:
         raise HTTPException(status_code=400, detail=f"Invalid URL: {payload.target_url}")
 
-    url_id = get_url_id(safe_url)
-    headers = {
-        "x-apikey": os.getenv("VT_KEY"),
-    }
-    if not headers["x-apikey"]:
+    if not reputation.reputation_service.api_key:
         raise HTTPException(status_code=401, detail="Where is api key bro?")
     else:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"https://www.virustotal.com/api/v3/urls/{url_id}",
-                    headers=headers
-                )
-                result = response.json()
-                stats = result['data']['attributes']['last_analysis_stats']
-                return {
-                    "url": payload.target_url,
-                    "malicious_votes": stats['malicious'],
-                    "suspicious_votes": stats['suspicious'],
-                    "is_safe": stats['malicious'] == 0
-                }
+            verdict = await reputation.reputation_service.check(safe_url)
+            return {
+                "url": payload.target_url,
+                "malicious_votes": verdict.malicious,
+                "suspicious_votes": verdict.suspicious,
+                "is_safe": verdict.is_safe
+            }
 
         except HTTPException as http_exc:
             raise http_exc
@@ -345,6 +616,50 @@ async def check_url(payload: schemas.CheckURL):
             )
 
 
+def create_app() -> FastAPI:
+    # Без побічних ефектів: ні з'єднань з базою, ні DDL — лише збірка застосунку. Фонові задачі стартують у lifespan
+    app = FastAPI(title="URL Shortener Pro", redirect_slashes=False, lifespan=lifespan)
+    app.include_router(router)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # Курсор пагінації /my-urls і маркер read-your-writes — у заголовках; без цього браузер
+        # не дасть фронтенду їх прочитати
+        expose_headers=["X-Next-Cursor", PRIMARY_UNTIL_HEADER],
+    )
+    app.add_middleware(ReadYourWrites)
+    # Зовнішній шар: чисті редиректи віддаються до CORS, DI і роутингу FastAPI
+    app.add_middleware(fastredirect.RedirectFastPath)
+    # Найзовнішній: міряє і fast path, і звичайні роути
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(engine)
+    metrics.instrument_engine(async_engine)
+    return app
+
+
+def preload():
+    # Pre-fork (gunicorn --preload, див. gunicorn.conf.py): лінивий імпорт і прогрів робляться один раз
+    # у майстрі, воркери отримують готові сторінки через copy-on-write замість того, щоб кожен повторював це сам
+    import httpx  # noqa: F401
+    import jose.jwt  # noqa: F401
+    import PIL.PngImagePlugin  # noqa: F401
+    import qrcode.image.svg  # noqa: F401
+
+    # Бекенд bcrypt у passlib вантажиться при першому хешуванні — завантажуємо без самого хешу
+    hashing.get_pwd_context().handler().get_backend()
+    app.openapi()
+    # Об'єкти, створені до fork, більше не скануються GC — інакше перший же збір у воркері
+    # торкнеться їхніх заголовків і скопіює сторінки
+    gc.collect()
+    gc.freeze()
+
+
+app = create_app()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,169 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from sqlalchemy import event
+
+# Запити, довші за поріг (мс), пишуться в лог разом зі списком SQL; 0 — вимкнено
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", "0"))
+METRICS_SLOW_MAX_QUERIES = int(os.getenv("METRICS_SLOW_MAX_QUERIES", "50"))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements per request", ["route"], buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per request", ["route"], buckets=LATENCY_BUCKETS,
+)
+QUERY_SECONDS = Histogram("db_query_duration_seconds", "Single SQL statement latency", buckets=LATENCY_BUCKETS)
+SPAN_SECONDS = Histogram("span_duration_seconds", "Timed sections (bcrypt, QR, ...)", ["span"], buckets=LATENCY_BUCKETS)
+OUTBOUND_SECONDS = Histogram(
+    "outbound_http_duration_seconds", "Outbound HTTP time to response headers", ["host", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+SLOW_REQUESTS = Counter("http_slow_requests_total", "Requests over METRICS_SLOW_REQUEST_MS", ["route"])
+RATE_LIMIT_FAIL_OPEN = Counter(
+    "rate_limit_fail_open_total", "Rate limit checks let through without a decision", ["policy", "reason"],
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "spans", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = {}
+        self.statements = [] if METRICS_SLOW_REQUEST_MS else None
+
+
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+
+@contextmanager
+def span(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_SECONDS.labels(name).observe(elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.spans[name] = stats.spans.get(name, 0.0) + elapsed
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    QUERY_SECONDS.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if stats.statements is not None and len(stats.statements) < METRICS_SLOW_MAX_QUERIES:
+            stats.statements.append((elapsed, statement))
+
+
+def instrument_engine(engine):
+    # Працює і для sync engine, і для AsyncEngine (через його sync_engine)
+    target = getattr(engine, "sync_engine", engine)
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+async def _on_request(request):
+    request.extensions["started"] = time.perf_counter()
+
+
+async def _on_response(response):
+    started = response.request.extensions.get("started")
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    OUTBOUND_SECONDS.labels(response.request.url.host, str(response.status_code)).observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        name = f"http:{response.request.url.host}"
+        stats.spans[name] = stats.spans.get(name, 0.0) + elapsed
+
+
+def instrument_client(client):
+    client.event_hooks["request"].append(_on_request)
+    client.event_hooks["response"].append(_on_response)
+    return client
+
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Шляхи, що не дійшли до роутера (fast path редиректів, 404), без сирого path у мітках
+    return scope.get("metrics_route", "unmatched")
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = route_label(scope)
+            REQUEST_SECONDS.labels(scope["method"], route, status).observe(elapsed)
+            REQUEST_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_DB_SECONDS.labels(route).observe(stats.db_seconds)
+            if METRICS_SLOW_REQUEST_MS and elapsed * 1000 >= METRICS_SLOW_REQUEST_MS:
+                SLOW_REQUESTS.labels(route).inc()
+                log_slow_request(scope, route, status, elapsed, stats)
+
+
+def log_slow_request(scope, route: str, status: str, elapsed: float, stats: RequestStats):
+    spans = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in stats.spans.items())
+    lines = [
+        f"SLOW {scope['method']} {scope['path']} route={route} status={status} total={elapsed * 1000:.1f}ms "
+        f"db={stats.db_seconds * 1000:.1f}ms queries={stats.queries} {spans}".rstrip()
+    ]
+    for seconds, statement in stats.statements or ():
+        lines.append(f"  {seconds * 1000:7.2f}ms  {' '.join(statement.split())[:300]}")
+    print("\n".join(lines))
+
+
+def render() -> tuple:
+    # З кількома воркерами uvicorn метрики збираються з PROMETHEUS_MULTIPROC_DIR
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,38 @@
+import argparse
+
+from sqlalchemy import inspect
+
+import models
+from database import add_missing_columns, engine
+
+# Схема оновлюється окремим кроком перед стартом воркерів (python migrations.py), а не при імпорті main.py:
+# імпорт не ходить у базу, а N воркерів не виконують DDL одночасно
+
+
+def create_missing_indexes(engine, metadata) -> list:
+    # create_all не додає нові індекси до вже створених таблиць
+    inspector = inspect(engine)
+    created = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    created.append(index.name)
+    return created
+
+
+def upgrade(bind=engine) -> list:
+    models.Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind, models.Base.metadata)
+    return create_missing_indexes(bind, models.Base.metadata)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create missing tables, columns and indexes")
+    parser.parse_args()
+    created = upgrade()
+    print(f"Schema is up to date ({len(created)} new indexes{': ' + ', '.join(created) if created else ''})")
@@ -1,6 +1,8 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, BigInteger
+from sqlalchemy import (
+    BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, String, UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 
 from database import Base
@@ -17,12 +19,127 @@ class User(Base):
 
 class URL(Base):
     __tablename__ = "urls"
+    # Під keyset-пагінацію /my-urls: WHERE owner_id = ? ORDER BY created_at, id
+    # (owner_id, url_hash): повторний /shorten того самого URL — один index probe замість нового рядка
+    __table_args__ = (
+        Index("ix_urls_owner_id_created_at", "owner_id", "created_at", "id"),
+        # /my-urls?sort=clicks: keyset-пагінація по (clicks, id) в межах власника
+        Index("ix_urls_owner_id_clicks", "owner_id", "clicks", "id"),
+        Index("ux_urls_owner_id_url_hash", "owner_id", "url_hash", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     full_url = Column(String)
     short_key = Column(String, unique=True, index=True)
     clicks = Column(Integer, default=0)
     qr_code = Column(String, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # naive UTC: колонка без timezone, а asyncpg не приймає aware datetime для неї
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="urls")
+    # Вердикт фонового сканування (scanner.py): pending -> scanning -> clean / unknown / flagged / blocked / error
+    scan_status = Column(String(10), nullable=True, default="pending", index=True)
+    malicious_votes = Column(Integer, nullable=True)
+    suspicious_votes = Column(Integer, nullable=True)
+    scanned_at = Column(DateTime, nullable=True)
+    # utils.url_hash канонічної форми; NULL у рядків, створених до дедуплікації
+    url_hash = Column(String(32), nullable=True)
+    # Обмеження життя посилання; прострочені рядки прибирає sweeper.py по індексу expires_at
+    expires_at = Column(DateTime, nullable=True, index=True)
+    max_clicks = Column(Integer, nullable=True)
 
+
+class KeySequence(Base):
+    # Лічильник для видачі блоків id під short_key (див. keys.py)
+    __tablename__ = "key_sequences"
+    name = Column(String, primary_key=True)
+    next_id = Column(BigInteger, nullable=False, default=0)
+    # Секрет скремблінгу ключів: задається один раз разом з рядком і далі не змінюється
+    scramble_secret = Column(String, nullable=True)
+
+
+class ClickEvent(Base):
+    # Append-only журнал кліків, пишеться батчами з analytics.py
+    __tablename__ = "click_events"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    short_key = Column(String, index=True, nullable=False)
+    clicked_at = Column(DateTime, index=True, nullable=False)
+    referrer = Column(String, nullable=True)
+    user_agent_family = Column(String, nullable=True)
+    country = Column(String(2), nullable=True)
+
+
+class ClickRollup(Base):
+    # Агрегати кліків по хвилинах / годинах / днях, саме з них читає /stats
+    __tablename__ = "click_rollups"
+    __table_args__ = (UniqueConstraint("short_key", "granularity", "bucket_start"),)
+    id = Column(Integer, primary_key=True)
+    short_key = Column(String, nullable=False)
+    granularity = Column(String(6), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    clicks = Column(Integer, nullable=False, default=0)
+
+
+class UrlVerdict(Base):
+    # Персистентний кеш вердиктів VirusTotal, ключ — VT url id (utils.get_url_id)
+    __tablename__ = "url_verdicts"
+    url_id = Column(String, primary_key=True)
+    malicious = Column(Integer, nullable=False, default=0)
+    suspicious = Column(Integer, nullable=False, default=0)
+    known = Column(Boolean, nullable=False, default=True)
+    checked_at = Column(DateTime, nullable=False)
+
+
+class RateLimitState(Base):
+    # Стан rate limiter для RATE_LIMIT_STORE=sql (див. ratelimit.py)
+    __tablename__ = "rate_limit_state"
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False, index=True)
+
+
+class IdempotencyKey(Base):
+    # Idempotency-Key з /shorten: повтор з тим самим ключем віддає те саме посилання
+    __tablename__ = "idempotency_keys"
+    owner_id = Column(Integer, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(32), nullable=False)
+    short_key = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+class ArchivedURL(Base):
+    # Прострочені посилання при SWEEP_MODE=archive
+    __tablename__ = "urls_archive"
+    id = Column(Integer, primary_key=True)
+    full_url = Column(String)
+    short_key = Column(String, nullable=False, index=True)
+    owner_id = Column(Integer, index=True)
+    clicks = Column(Integer)
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime)
+    max_clicks = Column(Integer)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class RecycledKey(Base):
+    # Звільнені sweeper'ом short_key, які після карантину знову видає keys.py (KEY_RECYCLE=1)
+    __tablename__ = "recycled_keys"
+    short_key = Column(String, primary_key=True)
+    available_at = Column(DateTime, nullable=False, index=True)
+
+
+class URLTombstone(Base):
+    # Видалені посилання (crud.delete_db_url, sweeper.py): delta-експорт snapshot.py бере видалення
+    # звідси з моменту останнього експорту, а не порівнює всі ключі таблиці. Старі прибирає sweeper
+    __tablename__ = "url_tombstones"
+    id = Column(Integer, primary_key=True)
+    short_key = Column(String, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, index=True)
+
+
+class InvalidationEvent(Base):
+    # Журнал подій інвалідації кешу для INVALIDATION_BUS=sql (див. invalidation.py)
+    __tablename__ = "invalidation_events"
+    id = Column(Integer, primary_key=True)
+    payload = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
@@ -1,15 +1,56 @@
 import base64
+import hashlib
+import os
 from io import BytesIO
 
-import qrcode
+import metrics
+from cache import TTLCache
+
+QR_RENDER_CACHE_SIZE = int(os.getenv("QR_RENDER_CACHE_SIZE", "512"))
+QR_RENDER_CACHE_TTL = float(os.getenv("QR_RENDER_CACHE_TTL", "3600"))
+
+QR_MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+# (data, box_size, format) -> bytes
+qr_cache = TTLCache(maxsize=QR_RENDER_CACHE_SIZE, ttl=QR_RENDER_CACHE_TTL)
+
+
+def render_qr(data: str, box_size: int = 10, image_format: str = "png") -> bytes:
+    # qrcode і Pillow потрібні лише для QR — не тягнемо їх в імпорт застосунку
+    import qrcode
+    from qrcode.image.svg import SvgPathImage
+
+    with metrics.span("qr_render"):
+        qr = qrcode.QRCode(box_size=box_size, border=2)
+        qr.add_data(data)
+        qr.make(fit=True)
+
+        buffered = BytesIO()
+        if image_format == "svg":
+            qr.make_image(image_factory=SvgPathImage).save(buffered)
+        else:
+            qr.make_image(fill_color="black", back_color="white").save(buffered, format="PNG")
+        return buffered.getvalue()
+
+
+def get_qr(data: str, box_size: int = 10, image_format: str = "png") -> bytes:
+    key = (data, box_size, image_format)
+    image = qr_cache.get(key)
+    if image is None:
+        image = render_qr(data, box_size, image_format)
+        qr_cache.set(key, image)
+    return image
+
+
+def qr_etag(data: str, box_size: int, image_format: str) -> str:
+    # QR детермінований, тож ETag можна порахувати без рендеру
+    digest = hashlib.blake2b(f"{data}|{box_size}|{image_format}".encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
 
 
 def generate_qr_base64(data: str) -> str:
-    qr = qrcode.QRCode(box_size=10, border=2)
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    return f"data:image/png;base64,{base64.b64encode(buffered.getvalue()).decode()}"
\ No newline at end of file
+    with metrics.span("qr_base64"):
+        return f"data:image/png;base64,{base64.b64encode(get_qr(data)).decode()}"
@@ -0,0 +1,443 @@
+import asyncio
+import math
+import os
+import time
+from threading import Lock
+from typing import NamedTuple
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+import models
+from database import AsyncSessionLocal
+
+# memory — стан у процесі (кожен воркер рахує окремо, тож N воркерів пропускають у N разів більше);
+# sql / redis — спільний для всіх воркерів
+# auto — sql, якщо воркерів кілька (WEB_CONCURRENCY > 1), інакше memory
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "auto")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") not in ("0", "false", "False", "")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") not in ("0", "false", "False", "")
+RATE_LIMIT_PRUNE_INTERVAL = float(os.getenv("RATE_LIMIT_PRUNE_INTERVAL", "300"))
+SQL_CAS_ATTEMPTS = 5
+# Політики, що перевіряються на кожному редиректі: при RATE_LIMIT_STORE=sql вони лишаються в процесі
+# (redis — теж спільний), бо редирект не повинен ходити в базу. Перевизначення: RATE_LIMIT_STORE_<ПОЛІТИКА>
+HOT_PATH_POLICIES = ("redirect",)
+
+
+class Policy(NamedTuple):
+    limit: int
+    period: float
+    algorithm: str = "gcra"  # gcra | sliding
+    scope: str = "ip"  # ip | user
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+def parse_policy(value: str, default: Policy) -> Policy:
+    # "limit/period[/algorithm[/scope]]", напр. RATE_LIMIT_REDIRECT=600/60/gcra/ip
+    if not value:
+        return default
+    parts = value.split("/")
+    return Policy(
+        limit=int(parts[0]),
+        period=float(parts[1]),
+        algorithm=parts[2] if len(parts) > 2 else default.algorithm,
+        scope=parts[3] if len(parts) > 3 else default.scope,
+    )
+
+
+DEFAULT_POLICIES = {
+    "register": Policy(3, 600, "sliding", "ip"),
+    "login": Policy(3, 60, "sliding", "ip"),
+    "change_password": Policy(3, 900, "sliding", "user"),
+    "change_username": Policy(3, 600, "sliding", "user"),
+    "shorten": Policy(1, 300, "gcra", "user"),
+    # Редиректи — публічний трафік: велика ємність, тільки від флуду з однієї адреси
+    "redirect": Policy(600, 60, "gcra", "ip"),
+}
+
+POLICIES = {
+    name: parse_policy(os.getenv(f"RATE_LIMIT_{name.upper()}", ""), default)
+    for name, default in DEFAULT_POLICIES.items()
+}
+
+
+def gcra_step(tat, now: float, policy: Policy):
+    # GCRA: один float на ключ (theoretical arrival time). limit запитів підряд,
+    # далі рівномірно по одному кожні period / limit секунд
+    interval = policy.period / policy.limit
+    tat = max(tat if tat is not None else now, now)
+    new_tat = tat + interval
+    allow_at = new_tat - policy.period
+    if now < allow_at:
+        return Decision(False, 0, allow_at - now), None
+    return Decision(True, int((policy.period - (new_tat - now)) / interval), 0.0), new_tat
+
+
+def sliding_step(state, now: float, policy: Policy):
+    # Sliding window counter: лічильники поточного і попереднього вікна,
+    # попереднє зважується часткою, що ще потрапляє у ковзне вікно
+    window = int(now // policy.period)
+    last_window, current, previous = state if state is not None else (window, 0, 0)
+    if last_window == window - 1:
+        current, previous = 0, current
+    elif last_window < window - 1:
+        current, previous = 0, 0
+
+    elapsed = now - window * policy.period
+    estimate = previous * (1 - elapsed / policy.period) + current
+    if estimate + 1 > policy.limit:
+        if current + 1 > policy.limit:
+            retry_after = policy.period - elapsed
+        else:
+            retry_after = policy.period * (1 - (policy.limit - 1 - current) / previous) - elapsed
+        return Decision(False, 0, max(retry_after, 0.0)), None
+    return Decision(True, int(policy.limit - estimate - 1), 0.0), (window, current + 1, previous)
+
+
+STEPS = {"gcra": gcra_step, "sliding": sliding_step}
+
+
+def state_ttl(policy: Policy) -> float:
+    # Після цього часу стан ключа нічим не відрізняється від відсутнього
+    return policy.period * (2 if policy.algorithm == "sliding" else 1)
+
+
+class MemoryStore:
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._state = {}
+        self._lock = Lock()
+
+    async def hit(self, key: str, policy: Policy) -> Decision:
+        now = time.time()
+        with self._lock:
+            state, _ = self._state.get(key, (None, 0))
+            decision, new_state = STEPS[policy.algorithm](state, now, policy)
+            if new_state is not None:
+                self._state[key] = (new_state, now + state_ttl(policy))
+                if len(self._state) > self.max_keys:
+                    self._prune(now)
+        return decision
+
+    def _prune(self, now: float) -> int:
+        expired = [key for key, (_, expires_at) in self._state.items() if expires_at <= now]
+        for key in expired:
+            del self._state[key]
+        return len(expired)
+
+    async def prune(self) -> int:
+        with self._lock:
+            return self._prune(time.time())
+
+
+def encode_state(state) -> str:
+    return repr(state) if not isinstance(state, tuple) else ":".join(map(str, state))
+
+
+def decode_state(value: str):
+    if value is None:
+        return None
+    if ":" in value:
+        return tuple(int(part) for part in value.split(":"))
+    return float(value)
+
+
+class StoreContention(Exception):
+    # CAS так і не пройшов за SQL_CAS_ATTEMPTS спроб: рішення немає, запит пропускаємо
+    pass
+
+
+class SQLStore:
+    # Стан у таблиці rate_limit_state; оновлення compare-and-swap по старому значенню,
+    # тож воркери не перезаписують один одного
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self.conflicts = 0
+
+    async def hit(self, key: str, policy: Policy) -> Decision:
+        def step(value, now):
+            decision, new_state = STEPS[policy.algorithm](decode_state(value), now, policy)
+            if new_state is None:
+                return decision, None, None
+            return decision, encode_state(new_state), now + state_ttl(policy)
+
+        decision = await self.swap(key, step)
+        if decision is None:
+            raise StoreContention(key)
+        return decision
+
+    async def swap(self, key: str, step, default=None):
+        # step(value, now) -> (result, new_value, expires_at); new_value None — нічого не записувати.
+        # Те саме compare-and-swap і для інших спільних лічильників (bulk.SQLBulkQuota)
+        table = models.RateLimitState
+        async with self.session_factory() as db:
+            for _ in range(SQL_CAS_ATTEMPTS):
+                now = time.time()
+                row = (await db.execute(select(table.state, table.expires_at).where(table.key == key))).first()
+                value = row.state if row is not None and row.expires_at > now else None
+                result, new_value, expires_at = step(value, now)
+                if new_value is None:
+                    return result
+
+                values = {"state": new_value, "expires_at": expires_at}
+                try:
+                    if row is None:
+                        await db.execute(insert(table).values(key=key, **values))
+                        swapped = True
+                    else:
+                        updated = await db.execute(
+                            update(table).where(table.key == key, table.state == row.state).values(**values)
+                        )
+                        swapped = updated.rowcount == 1
+                    await db.commit()
+                except IntegrityError:
+                    await db.rollback()
+                    swapped = False
+                if swapped:
+                    return result
+                self.conflicts += 1
+        return default
+
+    async def prune(self) -> int:
+        async with self.session_factory() as db:
+            table = models.RateLimitState
+            result = await db.execute(delete(table).where(table.expires_at <= time.time()))
+            await db.commit()
+            return result.rowcount
+
+
+# Обидва скрипти атомарні на сервері Redis і беруть час з TIME, а не з годинника воркера
+GCRA_SCRIPT = """
+local period, limit = tonumber(ARGV[1]), tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval = period / limit
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if now < allow_at then
+    return {0, 0, tostring(allow_at - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, math.floor((period - (new_tat - now)) / interval), '0'}
+"""
+
+SLIDING_SCRIPT = """
+local period, limit = tonumber(ARGV[1]), tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local window = math.floor(now / period)
+local s = redis.call('HMGET', KEYS[1], 'w', 'c', 'p')
+local w, c, p = tonumber(s[1]) or window, tonumber(s[2]) or 0, tonumber(s[3]) or 0
+if w == window - 1 then
+    p = c
+    c = 0
+elseif w < window - 1 then
+    p = 0
+    c = 0
+end
+local elapsed = now - window * period
+local estimate = p * (1 - elapsed / period) + c
+if estimate + 1 > limit then
+    local retry = period - elapsed
+    if c + 1 <= limit then
+        retry = period * (1 - (limit - 1 - c) / p) - elapsed
+    end
+    return {0, 0, tostring(math.max(retry, 0))}
+end
+redis.call('HSET', KEYS[1], 'w', window, 'c', c + 1, 'p', p)
+redis.call('PEXPIRE', KEYS[1], math.ceil(2 * period * 1000))
+return {1, math.floor(limit - estimate - 1), '0'}
+"""
+
+
+class RedisStore:
+    def __init__(self, client, prefix: str = "rl:"):
+        self.client = client
+        self.prefix = prefix
+        self._scripts = {
+            "gcra": client.register_script(GCRA_SCRIPT),
+            "sliding": client.register_script(SLIDING_SCRIPT),
+        }
+
+    @classmethod
+    def from_url(cls, url: str):
+        import redis.asyncio
+
+        return cls(redis.asyncio.Redis.from_url(url))
+
+    async def hit(self, key: str, policy: Policy) -> Decision:
+        allowed, remaining, retry_after = await self._scripts[policy.algorithm](
+            keys=[self.prefix + key], args=[policy.period, policy.limit]
+        )
+        return Decision(bool(allowed), int(remaining), float(retry_after))
+
+    async def prune(self) -> int:
+        # Ключі мають TTL, Redis прибирає їх сам
+        return 0
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def shared_state_default(name: str) -> str:
+    # Той самий WEB_CONCURRENCY, що читають gunicorn.conf.py і uvicorn --workers
+    if name != "auto":
+        return name
+    return "sql" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "memory"
+
+
+def build_store(name: str):
+    name = shared_state_default(name)
+    if name == "sql":
+        return SQLStore()
+    if name == "redis":
+        return RedisStore.from_url(RATE_LIMIT_REDIS_URL)
+    return MemoryStore()
+
+
+def policy_store_name(policy_name: str, default: str = RATE_LIMIT_STORE) -> str:
+    explicit = os.getenv(f"RATE_LIMIT_STORE_{policy_name.upper()}")
+    if explicit:
+        return shared_state_default(explicit)
+    default = shared_state_default(default)
+    if policy_name in HOT_PATH_POLICIES and default == "sql":
+        return "memory"
+    return default
+
+
+def build_stores(policies: dict, default: str = RATE_LIMIT_STORE) -> tuple:
+    # (сховище за замовчуванням, {політика: сховище}); однакові назви — один об'єкт (один пул Redis)
+    built = {}
+
+    def get(name):
+        if name not in built:
+            built[name] = build_store(name)
+        return built[name]
+
+    default_store = get(shared_state_default(default))
+    return default_store, {name: get(policy_store_name(name, default)) for name in policies}
+
+
+class RateLimiter:
+    def __init__(self, store, policies: dict, enabled: bool = True, stores: dict = None):
+        self.store = store
+        # Окремі сховища для частини політик, решта — store
+        self.stores = stores or {}
+        self.policies = policies
+        self.enabled = enabled
+        self.checks = 0
+        self.rejected = 0
+        self.errors = 0
+        self.contended = 0
+        self.total_seconds = 0.0
+
+    def _all_stores(self) -> list:
+        unique = {id(store): store for store in (self.store, *self.stores.values())}
+        return list(unique.values())
+
+    async def hit(self, name: str, identity: str) -> Decision:
+        policy = self.policies[name]
+        started = time.perf_counter()
+        try:
+            decision = await self.stores.get(name, self.store).hit(f"{name}:{identity}", policy)
+        except StoreContention:
+            # Не відмовляємо запиту, до якого ліміт так і не застосувався
+            self.contended += 1
+            metrics.RATE_LIMIT_FAIL_OPEN.labels(name, "contention").inc()
+            decision = Decision(True, policy.limit, 0.0)
+        except Exception as e:
+            # Сховище недоступне — пропускаємо запит, а не кладемо весь API
+            self.errors += 1
+            metrics.RATE_LIMIT_FAIL_OPEN.labels(name, "error").inc()
+            print(f"Rate limit store failed: {e}")
+            decision = Decision(True, policy.limit, 0.0)
+        self.checks += 1
+        self.total_seconds += time.perf_counter() - started
+        if not decision.allowed:
+            self.rejected += 1
+        return decision
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(RATE_LIMIT_PRUNE_INTERVAL)
+            for store in self._all_stores():
+                try:
+                    await store.prune()
+                except Exception as e:
+                    print(f"Rate limit prune failed: {e}")
+
+    async def close(self):
+        for store in self._all_stores():
+            if hasattr(store, "close"):
+                await store.close()
+
+    def stats(self) -> dict:
+        return {
+            "store": type(self.store).__name__,
+            "policy_stores": {name: type(store).__name__ for name, store in self.stores.items()},
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "contended": self.contended,
+            "avg_check_ms": round(self.total_seconds / self.checks * 1000, 4) if self.checks else 0.0,
+        }
+
+
+default_store, policy_stores = build_stores(POLICIES)
+limiter = RateLimiter(default_store, POLICIES, enabled=RATE_LIMIT_ENABLED, stores=policy_stores)
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def client_identity(request: Request, scope: str, user_id: int = None) -> str:
+    # Лише id вже автентифікованого користувача: заголовки клієнт може міняти на кожен запит
+    if scope == "user" and user_id is not None:
+        return f"user:{user_id}"
+    return "ip:" + client_ip(request)
+
+
+async def enforce(rate_limiter: RateLimiter, name: str, request: Request, response: Response, user_id: int = None):
+    if not rate_limiter.enabled:
+        return
+    policy = rate_limiter.policies[name]
+    decision = await rate_limiter.hit(name, client_identity(request, policy.scope, user_id))
+    if not decision.allowed:
+        raise HTTPException(status_code=429, detail="Too Many Requests",
+                            headers={"Retry-After": str(math.ceil(decision.retry_after))})
+    response.headers["X-RateLimit-Limit"] = str(policy.limit)
+    response.headers["X-RateLimit-Remaining"] = str(decision.remaining)
+
+
+class RateLimit:
+    # FastAPI-залежність для scope ip: dependencies=[Depends(RateLimit("register"))]
+    def __init__(self, name: str, rate_limiter: RateLimiter = None):
+        self.name = name
+        self.rate_limiter = rate_limiter
+
+    async def __call__(self, request: Request, response: Response):
+        await enforce(self.rate_limiter or limiter, self.name, request, response)
+
+
+def user_rate_limit(name: str, principal_dependency, rate_limiter: RateLimiter = None):
+    # Для scope user: та сама залежність автентифікації, що й в ендпоінта (FastAPI виконає її один раз),
+    # dependencies=[Depends(user_rate_limit("shorten", auth.get_principal))]
+    async def check(request: Request, response: Response, principal=Depends(principal_dependency)):
+        await enforce(rate_limiter or limiter, name, request, response, principal.id)
+
+    return check
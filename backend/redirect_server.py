@@ -0,0 +1,110 @@
+import json
+import os
+import re
+import time
+
+import snapshot
+
+# Окремий процес редиректів: без SQLAlchemy, Postgres і FastAPI, тільки mmap-снапшот (snapshot.py)
+SNAPSHOT_RELOAD_INTERVAL = float(os.getenv("SNAPSHOT_RELOAD_INTERVAL", "2"))
+# Основний застосунок для всього, чого немає в снапшоті або що потребує перевірки (flagged, blocked).
+# Порожньо — такі ключі отримують 404
+SNAPSHOT_FALLBACK_URL = os.getenv("SNAPSHOT_FALLBACK_URL", "").rstrip("/")
+REDIRECT_STATUS = int(os.getenv("REDIRECT_STATUS", "307"))
+REDIRECT_CACHE_CONTROL = os.getenv("REDIRECT_CACHE_CONTROL", "")
+
+KEY_PATTERN = re.compile(r"^/([A-Za-z0-9]{1,32})$")
+CACHE_HEADERS = [(b"cache-control", REDIRECT_CACHE_CONTROL.encode("latin-1"))] if REDIRECT_CACHE_CONTROL else []
+
+
+class SnapshotRedirectApp:
+    def __init__(self, directory: str, reload_interval: float = SNAPSHOT_RELOAD_INTERVAL,
+                 fallback_url: str = SNAPSHOT_FALLBACK_URL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.fallback_url = fallback_url
+        self.snapshot = None
+        self._manifest_mtime = None
+        self._checked_at = 0.0
+        self.counters = {"served": 0, "fallbacks": 0, "not_found": 0, "reloads": 0}
+
+    def reload(self, force: bool = False):
+        # Дешевий stat маніфесту раз на reload_interval; заміна посилання на Snapshot атомарна для запитів
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(os.path.join(self.directory, snapshot.MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        try:
+            loaded = snapshot.load(self.directory)
+        except (OSError, ValueError) as e:
+            # Експортер саме замінює файли: лишаємо старий снапшот до наступної перевірки
+            print(f"Snapshot reload failed: {e}")
+            return
+        self.snapshot, self._manifest_mtime = loaded, mtime
+        self.counters["reloads"] += 1
+
+    async def _send(self, send, status: int, headers: list, body: bytes = b""):
+        headers = [*headers, (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    self.reload(force=True)
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        self.reload()
+        path = scope["path"]
+        if path == "/healthz":
+            body = json.dumps({
+                "generation": self.snapshot.generation if self.snapshot else None,
+                "deltas": len(self.snapshot.deltas) if self.snapshot else 0,
+                **self.counters,
+            }).encode()
+            return await self._send(send, 200 if self.snapshot else 503, [(b"content-type", b"application/json")], body)
+
+        match = KEY_PATTERN.match(path)
+        entry = self.snapshot.get(match.group(1)) if match and self.snapshot else None
+        if entry is not None and entry[0] == snapshot.REDIRECT:
+            self.counters["served"] += 1
+            headers = [(b"location", entry[1].encode("latin-1")), *CACHE_HEADERS]
+            return await self._send(send, REDIRECT_STATUS, headers)
+        if match and self.fallback_url:
+            # Нове (ще не в delta) або flagged/blocked посилання — рішення за основним застосунком
+            self.counters["fallbacks"] += 1
+            target = f"{self.fallback_url}{path}"
+            if scope.get("query_string"):
+                target += "?" + scope["query_string"].decode("latin-1")
+            return await self._send(send, 307, [(b"location", target.encode("latin-1"))])
+        self.counters["not_found"] += 1
+        await self._send(send, 404, [(b"content-type", b"application/json")], b'{"detail":"URL not found"}')
+
+
+app = SnapshotRedirectApp(snapshot.SNAPSHOT_DIR)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve redirects from a snapshot directory")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    uvicorn.run("redirect_server:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
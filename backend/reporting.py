@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+
+import http_client
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+# Як часто відправляється дайджест; це ж і стеля: не більше одного повідомлення за інтервал
+ERROR_REPORT_INTERVAL = float(os.getenv("ERROR_REPORT_INTERVAL", "10"))
+# Та сама помилка (endpoint + тип винятку) репортиться не частіше ніж раз за cooldown, решта рахується
+ERROR_REPORT_COOLDOWN = float(os.getenv("ERROR_REPORT_COOLDOWN", "300"))
+# Скільки різних помилок тримаємо до відправки; понад це нові відкидаються
+ERROR_REPORT_QUEUE_SIZE = int(os.getenv("ERROR_REPORT_QUEUE_SIZE", "100"))
+TELEGRAM_MESSAGE_LIMIT = 4000
+
+
+class ErrorReporter:
+    def __init__(self, interval: float, cooldown: float, maxsize: int):
+        self.interval = interval
+        self.cooldown = cooldown
+        self.maxsize = maxsize
+        self._pending = OrderedDict()
+        self._last_sent = {}
+        self._lock = Lock()
+        self.reported = 0
+        self.dropped = 0
+        self.sent_messages = 0
+        self.failed_sends = 0
+
+    def report(self, e: Exception, endpoint: str):
+        # Викликається з обробника помилок ендпоінта: без I/O і без очікування
+        key = (endpoint, type(e).__name__)
+        with self._lock:
+            self.reported += 1
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry["count"] += 1
+                entry["last_seen"] = datetime.now()
+                return
+            if len(self._pending) >= self.maxsize:
+                self.dropped += 1
+                return
+            self._pending[key] = {"detail": str(e), "count": 1, "last_seen": datetime.now()}
+
+    def take_ready(self, force: bool = False) -> list:
+        # Помилки, для яких cooldown минув; решта лишаються і накопичують лічильник
+        now = time.monotonic()
+        with self._lock:
+            ready = [
+                key for key in self._pending
+                if force or now - self._last_sent.get(key, float("-inf")) >= self.cooldown
+            ]
+            for key in ready:
+                self._last_sent[key] = now
+            return [(key, self._pending.pop(key)) for key in ready]
+
+    def digest(self, entries: list) -> list:
+        blocks = []
+        for (endpoint, error_type), entry in entries:
+            repeated = f" (x{entry['count']})" if entry["count"] > 1 else ""
+            detail = entry["detail"].replace("`", "'")[:500]
+            blocks.append(
+                f"**Endpoint:** {endpoint}{repeated}\n"
+                f"**Error:** {error_type}: `{detail}`\n"
+                f"**Timestamp:** `{entry['last_seen'].strftime('%Y-%m-%d %H:%M:%S')}`"
+            )
+
+        messages, current = [], "❌ **VoidLink Error**"
+        for block in blocks:
+            if len(current) + len(block) + 2 > TELEGRAM_MESSAGE_LIMIT:
+                messages.append(current)
+                current = "❌ **VoidLink Error** (cont.)"
+            current += "\n\n" + block
+        messages.append(current)
+        return messages
+
+    async def send(self, text: str):
+        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        chat_id = os.getenv("TG_ID")
+        if not token or not chat_id:
+            print(text)
+            return
+        try:
+            await http_client.get_client().post(
+                f"{TELEGRAM_API_URL}/bot{token}/sendMessage",
+                json={"chat_id": chat_id, "text": text, "parse_mode": "Markdown"},
+            )
+            self.sent_messages += 1
+        except Exception as e:
+            self.failed_sends += 1
+            print(f"Ошибка отправки лога в Telegram: {e}")
+
+    async def flush(self, force: bool = False) -> int:
+        entries = self.take_ready(force)
+        if entries:
+            for text in self.digest(entries):
+                await self.send(text)
+        return len(entries)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "reported": self.reported,
+            "dropped": self.dropped,
+            "sent_messages": self.sent_messages,
+            "failed_sends": self.failed_sends,
+        }
+
+
+error_reporter = ErrorReporter(
+    interval=ERROR_REPORT_INTERVAL,
+    cooldown=ERROR_REPORT_COOLDOWN,
+    maxsize=ERROR_REPORT_QUEUE_SIZE,
+)
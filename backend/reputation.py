@@ -0,0 +1,213 @@
+import asyncio
+import contextvars
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, NamedTuple
+
+from fastapi import HTTPException
+
+import metrics
+import models
+from cache import TTLCache
+from database import AsyncSessionLocal, upsert
+from utils import get_url_id
+
+if TYPE_CHECKING:
+    import httpx
+
+VT_API_URL = os.getenv("VT_API_URL", "https://www.virustotal.com/api/v3").rstrip("/")
+VT_TIMEOUT = float(os.getenv("VT_TIMEOUT", "10"))
+# Публічний ключ VT: 4 запити на хвилину
+VT_RATE_PER_MINUTE = float(os.getenv("VT_RATE_PER_MINUTE", "4"))
+VT_BURST = int(os.getenv("VT_BURST", "4"))
+# Скільки запит готовий чекати на вільний слот квоти, інакше 503
+VT_MAX_WAIT = float(os.getenv("VT_MAX_WAIT", "20"))
+VT_VERDICT_TTL = int(os.getenv("VT_VERDICT_TTL", "86400"))
+# URL, якого VT ще не бачив, перевіряємо знову раніше
+VT_UNKNOWN_TTL = int(os.getenv("VT_UNKNOWN_TTL", "3600"))
+VT_CACHE_SIZE = int(os.getenv("VT_CACHE_SIZE", "10000"))
+
+
+class Verdict(NamedTuple):
+    malicious: int
+    suspicious: int
+    known: bool
+
+    @property
+    def is_safe(self) -> bool:
+        return self.malicious == 0
+
+
+class TokenBucket:
+    # Видає слоти рівномірно: rate на секунду, не більше capacity підряд.
+    # Слот резервується під lock (токени йдуть у мінус), а чекають на нього вже без lock:
+    # черга лишається FIFO, а запит з малим max_wait не стоїть за довгими очікуваннями сканера
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited_seconds = 0.0
+        self.rejected = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, max_wait: float):
+        async with self._lock:
+            self._refill(time.monotonic())
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if wait > max_wait:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="URL check quota exhausted, try again later",
+                                    headers={"Retry-After": str(int(wait) + 1)})
+            self._tokens -= 1
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Зарезервований слот повертаємо наступним у черзі
+                async with self._lock:
+                    self._tokens += 1
+                raise
+            self.waited_seconds += wait
+
+
+class ReputationService:
+    def __init__(self, api_url: str, api_key: str, bucket: TokenBucket, verdict_ttl: int, unknown_ttl: int,
+                 cache_size: int, max_wait: float = VT_MAX_WAIT, session_factory=AsyncSessionLocal,
+                 transport: "httpx.AsyncBaseTransport" = None, timeout: float = VT_TIMEOUT):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.bucket = bucket
+        self.verdict_ttl = verdict_ttl
+        self.unknown_ttl = unknown_ttl
+        self.max_wait = max_wait
+        self.session_factory = session_factory
+        self.transport = transport
+        self.timeout = timeout
+        # Кожен запис живе від свого checked_at стільки, скільки відповідає результату (ttl_for)
+        self.verdicts = TTLCache(maxsize=cache_size, ttl=verdict_ttl)
+        self._client = None
+        self._in_flight = {}
+        self.db_hits = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.timed_out = 0
+
+    def ttl_for(self, known: bool) -> int:
+        return self.verdict_ttl if known else self.unknown_ttl
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        # Один клієнт на процес: keep-alive з'єднання замість TLS handshake на кожен запит
+        if self._client is None:
+            import httpx
+
+            self._client = metrics.instrument_client(httpx.AsyncClient(
+                base_url=self.api_url,
+                headers={"x-apikey": self.api_key or ""},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+                transport=self.transport,
+            ))
+        return self._client
+
+    async def check(self, url: str, max_wait: float = None) -> Verdict:
+        url_id = get_url_id(url)
+        verdict = self.verdicts.get(url_id)
+        if verdict is not None:
+            return verdict
+
+        # Single-flight: паралельні перевірки одного URL чекають на один запит
+        task = self._in_flight.get(url_id)
+        if task is None:
+            # Задача спільна для всіх, хто чекає: SQL і спани не повинні писатися в статистику запиту-ініціатора
+            context = contextvars.copy_context()
+            context.run(metrics.current_request.set, None)
+            task = self._in_flight[url_id] = asyncio.get_running_loop().create_task(
+                self._resolve(url_id, max_wait), context=context
+            )
+            task.add_done_callback(lambda _: self._in_flight.pop(url_id, None))
+        else:
+            self.coalesced += 1
+        # Задачу міг почати сканер з довгим SCAN_MAX_WAIT: кожен чекає не довше за свій max_wait
+        # (плюс сам запит до VT), далі — "невідомо", без кешування.
+        # shield: відміна чи таймаут одного запиту не скасовує перевірку для інших
+        wait = (self.max_wait if max_wait is None else max_wait) + self.timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), wait)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return Verdict(0, 0, False)
+
+    async def _resolve(self, url_id: str, max_wait: float = None) -> Verdict:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with self.session_factory() as db:
+            row = await db.get(models.UrlVerdict, url_id)
+        if row is not None:
+            remaining = (row.checked_at + timedelta(seconds=self.ttl_for(row.known)) - now).total_seconds()
+            if remaining > 0:
+                self.db_hits += 1
+                verdict = Verdict(row.malicious, row.suspicious, row.known)
+                self.verdicts.set(url_id, verdict, ttl=remaining)
+                return verdict
+
+        # Очікування квоти і запит до VT — без відкритої сесії: з'єднання з пулу тут не потрібне
+        verdict = await self._fetch(url_id, max_wait)
+        async with self.session_factory() as db:
+            stmt = upsert(db, models.UrlVerdict).values(
+                url_id=url_id, malicious=verdict.malicious, suspicious=verdict.suspicious,
+                known=verdict.known, checked_at=now,
+            )
+            await db.execute(stmt.on_conflict_do_update(
+                index_elements=["url_id"],
+                set_={key: stmt.excluded[key] for key in ("malicious", "suspicious", "known", "checked_at")},
+            ))
+            await db.commit()
+        self.verdicts.set(url_id, verdict, ttl=self.ttl_for(verdict.known))
+        return verdict
+
+    async def _fetch(self, url_id: str, max_wait: float = None) -> Verdict:
+        await self.bucket.acquire(self.max_wait if max_wait is None else max_wait)
+        self.upstream_calls += 1
+        response = await self.client.get(f"/urls/{url_id}")
+        if response.status_code == 404:
+            # VT ще не аналізував цей URL
+            return Verdict(0, 0, False)
+        if response.status_code == 429:
+            raise HTTPException(status_code=503, detail="URL check quota exhausted, try again later",
+                                headers={"Retry-After": "60"})
+        response.raise_for_status()
+        stats = response.json()["data"]["attributes"]["last_analysis_stats"]
+        return Verdict(stats["malicious"], stats["suspicious"], True)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.verdicts.stats(),
+            "db_hits": self.db_hits,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "timed_out": self.timed_out,
+            "in_flight": len(self._in_flight),
+            "quota_waited_seconds": round(self.bucket.waited_seconds, 3),
+            "quota_rejected": self.bucket.rejected,
+        }
+
+
+reputation_service = ReputationService(
+    api_url=VT_API_URL,
+    api_key=os.getenv("VT_KEY"),
+    bucket=TokenBucket(rate=VT_RATE_PER_MINUTE / 60, capacity=VT_BURST),
+    verdict_ttl=VT_VERDICT_TTL,
+    unknown_ttl=VT_UNKNOWN_TTL,
+    cache_size=VT_CACHE_SIZE,
+)
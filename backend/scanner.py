@@ -0,0 +1,283 @@
+import asyncio
+import html
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from urllib.parse import urlparse
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import invalidation
+import models
+import reputation
+from database import AsyncSessionLocal
+
+# virustotal | stub | off; без VT_KEY сканування вимкнене
+SCAN_CHECKER = os.getenv("SCAN_CHECKER", "virustotal" if os.getenv("VT_KEY") else "off")
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "2"))
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "20"))
+SCAN_QUEUE_SIZE = int(os.getenv("SCAN_QUEUE_SIZE", "10000"))
+SCAN_POLL_INTERVAL = float(os.getenv("SCAN_POLL_INTERVAL", "30"))
+SCAN_MAX_ATTEMPTS = int(os.getenv("SCAN_MAX_ATTEMPTS", "3"))
+# Воркер може чекати на квоту VT значно довше, ніж інтерактивний /check_url
+SCAN_MAX_WAIT = float(os.getenv("SCAN_MAX_WAIT", "600"))
+# Рядок у scanning довше цього (процес упав посеред перевірки) refill повертає в pending
+SCAN_CLAIM_TIMEOUT = float(os.getenv("SCAN_CLAIM_TIMEOUT", "900"))
+# Від скількох malicious-голосів посилання блокується, а не показує попередження
+SCAN_BLOCK_MALICIOUS = int(os.getenv("SCAN_BLOCK_MALICIOUS", "3"))
+SCAN_STUB_BLOCKED = os.getenv("SCAN_STUB_BLOCKED", "")
+SCAN_STUB_FLAGGED = os.getenv("SCAN_STUB_FLAGGED", "")
+
+PENDING = "pending"
+# Рядок уже взяв у роботу один з процесів (scanned_at — час, коли взяв)
+SCANNING = "scanning"
+CLEAN = "clean"
+UNKNOWN = "unknown"
+FLAGGED = "flagged"
+BLOCKED = "blocked"
+ERROR = "error"
+
+
+def verdict_status(verdict: reputation.Verdict) -> str:
+    if verdict.malicious >= SCAN_BLOCK_MALICIOUS:
+        return BLOCKED
+    if verdict.malicious or verdict.suspicious:
+        return FLAGGED
+    return CLEAN if verdict.known else UNKNOWN
+
+
+class StubChecker:
+    # Локальний checker без мережі: вердикт за списками хостів
+    def __init__(self, blocked_hosts: set, flagged_hosts: set):
+        self.blocked_hosts = blocked_hosts
+        self.flagged_hosts = flagged_hosts
+
+    async def check(self, url: str, max_wait: float = None) -> reputation.Verdict:
+        host = urlparse(url).hostname or ""
+        if host in self.blocked_hosts:
+            return reputation.Verdict(SCAN_BLOCK_MALICIOUS, 0, True)
+        if host in self.flagged_hosts:
+            return reputation.Verdict(0, 1, True)
+        return reputation.Verdict(0, 0, True)
+
+
+def parse_hosts(value: str) -> set:
+    return {host.strip() for host in value.split(",") if host.strip()}
+
+
+def build_checker(name: str):
+    if name == "virustotal":
+        return reputation.reputation_service
+    if name == "stub":
+        return StubChecker(parse_hosts(SCAN_STUB_BLOCKED), parse_hosts(SCAN_STUB_FLAGGED))
+    return None
+
+
+class ScanQueue:
+    def __init__(self, checker, workers: int, batch_size: int, maxsize: int, poll_interval: float):
+        self.checker = checker
+        self.workers = workers
+        self.batch_size = batch_size
+        self.maxsize = maxsize
+        self.poll_interval = poll_interval
+        self._items = deque()
+        self._queued = set()
+        self._lock = Lock()
+        self._wakeup = asyncio.Event()
+        # Воркери черги запущені лише в API-процесі; бот чи CLI лишають рядок pending для refill
+        self.running = False
+        self.scanned = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+        self.statuses = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.checker is not None
+
+    def enqueue(self, short_key: str, full_url: str, attempts: int = 0) -> bool:
+        # Викликається з /shorten: тільки append, перевірка йде у воркерах.
+        # Що не влізло в чергу, лишається pending у базі і підтягнеться в refill
+        if not self.enabled or not self.running:
+            return False
+        with self._lock:
+            if short_key in self._queued and not attempts:
+                return False
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                return False
+            self._items.append((short_key, full_url, attempts))
+            self._queued.add(short_key)
+        self._wakeup.set()
+        return True
+
+    def take(self, limit: int) -> list:
+        with self._lock:
+            return [self._items.popleft() for _ in range(min(limit, len(self._items)))]
+
+    async def refill(self, db: AsyncSession) -> int:
+        # Посилання, які ще не перевірені (черга переповнилась або процес перезапускався).
+        # refill іде в кожному воркері: хто саме перевіряє рядок, вирішує claim у scan_batch
+        table = models.URL.__table__
+        stale = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=SCAN_CLAIM_TIMEOUT)
+        await db.execute(
+            update(table).where(table.c.scan_status == SCANNING, table.c.scanned_at < stale).values(scan_status=PENDING)
+        )
+        await db.commit()
+        rows = (await db.execute(
+            select(models.URL.short_key, models.URL.full_url)
+            .where(models.URL.scan_status == PENDING)
+            .order_by(models.URL.id)
+            .limit(self.maxsize)
+        )).all()
+        return sum(self.enqueue(short_key, full_url) for short_key, full_url in rows)
+
+    async def claim(self, db: AsyncSession, batch: list) -> list:
+        # Атомарно pending -> scanning: рядок, який уже взяв інший процес, пропускаємо.
+        # Повторні спроби (attempts > 0) вже наші
+        fresh = [short_key for short_key, _, attempts in batch if not attempts]
+        claimed = set()
+        if fresh:
+            table = models.URL.__table__
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            claimed = set((await db.execute(
+                update(table)
+                .where(table.c.short_key.in_(fresh), table.c.scan_status == PENDING)
+                .values(scan_status=SCANNING, scanned_at=now)
+                .returning(table.c.short_key)
+            )).scalars())
+            await db.commit()
+        skipped = [short_key for short_key in fresh if short_key not in claimed]
+        if skipped:
+            self.skipped += len(skipped)
+            with self._lock:
+                for short_key in skipped:
+                    self._queued.discard(short_key)
+        return [item for item in batch if item[2] or item[0] in claimed]
+
+    async def scan_batch(self, db: AsyncSession, batch: list) -> int:
+        batch = await self.claim(db, batch)
+        if not batch:
+            return 0
+        verdicts = await asyncio.gather(
+            *[self.checker.check(full_url, max_wait=SCAN_MAX_WAIT) for _, full_url, _ in batch],
+            return_exceptions=True,
+        )
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = []
+        for (short_key, full_url, attempts), verdict in zip(batch, verdicts):
+            if isinstance(verdict, Exception):
+                self.failed += 1
+                if attempts + 1 < SCAN_MAX_ATTEMPTS:
+                    with self._lock:
+                        self._queued.discard(short_key)
+                    self.enqueue(short_key, full_url, attempts + 1)
+                    continue
+                status, malicious, suspicious = ERROR, None, None
+            else:
+                status, malicious, suspicious = verdict_status(verdict), verdict.malicious, verdict.suspicious
+            rows.append({"b_key": short_key, "b_status": status, "b_malicious": malicious,
+                         "b_suspicious": suspicious, "b_scanned_at": now})
+
+        if rows:
+            table = models.URL.__table__
+            await db.execute(
+                update(table)
+                .where(table.c.short_key == bindparam("b_key"))
+                .values(scan_status=bindparam("b_status"), malicious_votes=bindparam("b_malicious"),
+                        suspicious_votes=bindparam("b_suspicious"), scanned_at=bindparam("b_scanned_at")),
+                rows,
+            )
+            changed = [f"{row['b_key']}={row['b_status']}" for row in rows]
+            await invalidation.bus.publish(db, invalidation.SCAN_STATUS, changed)
+            await db.commit()
+        with self._lock:
+            for row in rows:
+                self._queued.discard(row["b_key"])
+        for row in rows:
+            # Новий вердикт одразу в кеш: перечитаний з відсталої репліки рядок міг би мати старий статус
+            target = cache.url_cache.get(row["b_key"])
+            if target is not None:
+                cache.url_cache.set(row["b_key"], target._replace(scan_status=row["b_status"]))
+            self.statuses[row["b_status"]] = self.statuses.get(row["b_status"], 0) + 1
+        self.scanned += len(rows)
+        return len(rows)
+
+    async def _worker(self, number: int):
+        while True:
+            batch = self.take(self.batch_size)
+            if not batch:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    if number == 0:
+                        try:
+                            async with AsyncSessionLocal() as db:
+                                await self.refill(db)
+                        except Exception as e:
+                            print(f"Scan refill failed: {e}")
+                continue
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.scan_batch(db, batch)
+            except Exception as e:
+                print(f"Scan batch failed: {e}")
+                with self._lock:
+                    for short_key, _, _ in batch:
+                        self._queued.discard(short_key)
+                await asyncio.sleep(self.poll_interval)
+
+    async def run(self):
+        if not self.enabled:
+            return
+        self.running = True
+        try:
+            async with AsyncSessionLocal() as db:
+                await self.refill(db)
+        except Exception as e:
+            print(f"Scan refill failed: {e}")
+        workers = [asyncio.create_task(self._worker(number)) for number in range(self.workers)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            self.running = False
+            for worker in workers:
+                worker.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "checker": type(self.checker).__name__ if self.enabled else None,
+            "queued": len(self._items),
+            "in_progress": len(self._queued) - len(self._items),
+            "scanned": self.scanned,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "statuses": dict(self.statuses),
+        }
+
+
+def interstitial_page(short_key: str, full_url: str) -> str:
+    target = html.escape(full_url)
+    return f"""<!doctype html>
+<html><head><meta charset="utf-8"><meta name="robots" content="noindex"><title>Warning</title></head>
+<body style="font-family: sans-serif; max-width: 40em; margin: 4em auto">
+<h1>This link may be unsafe</h1>
+<p>Security scanners flagged the destination of this short link as suspicious:</p>
+<p><code>{target}</code></p>
+<p><a href="/{html.escape(short_key)}?confirm=1" rel="nofollow">Continue anyway</a></p>
+</body></html>"""
+
+
+scan_queue = ScanQueue(
+    checker=build_checker(SCAN_CHECKER),
+    workers=SCAN_WORKERS,
+    batch_size=SCAN_BATCH_SIZE,
+    maxsize=SCAN_QUEUE_SIZE,
+    poll_interval=SCAN_POLL_INTERVAL,
+)
@@ -19,8 +19,10 @@ class UserInfo(BaseModel):
 
 class URLCreate(BaseModel):
     target_url: str
+    expires_at: Optional[datetime] = Field(None, description="Після цього моменту посилання віддає 410")
+    max_clicks: Optional[int] = Field(None, ge=1, description="Скільки переходів дозволено")
 
-class CheckURL(URLCreate):
+class CheckURL(BaseModel):
     target_url: HttpUrl = Field(..., description="Повинно бути валідне посилання")
 
 class URLInfo(BaseModel):
@@ -30,6 +32,9 @@ class URLInfo(BaseModel):
     clicks: int
     created_at: datetime
     qr_code: Optional[str] = None
+    scan_status: Optional[str] = None
+    expires_at: Optional[datetime] = None
+    max_clicks: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True)
 
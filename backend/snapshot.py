@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+# Після стількох delta-файлів наступний експорт робиться повним (компакція)
+SNAPSHOT_MAX_DELTAS = int(os.getenv("SNAPSHOT_MAX_DELTAS", "20"))
+# Перекриття вікон delta-експорту на випадок розбіжності годинників між серверами, сек
+SNAPSHOT_DELTA_OVERLAP = float(os.getenv("SNAPSHOT_DELTA_OVERLAP", "60"))
+
+# Формат файлу (little-endian):
+#   header  — magic, slot_count (степінь двійки), entry_count, generation, exported_at
+#   slots   — slot_count * (key_hash, record_offset, record_length); offset 0 — порожній слот
+#   records — flag, key_len, key, location (URL, вже екранований для заголовка Location)
+MAGIC = b"VLSNAP01"
+HEADER = struct.Struct("<8sIIQd")
+SLOT = struct.Struct("<QII")
+RECORD_HEAD = struct.Struct("<BB")
+
+REDIRECT, FALLBACK, DELETED = 0, 1, 2
+MANIFEST = "manifest.json"
+# Та сама екранізація Location, що й у starlette RedirectResponse
+LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;"
+
+
+def key_hash(key: bytes) -> int:
+    # Стабільний між процесами, на відміну від hash()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def location(full_url: str) -> str:
+    return quote(full_url, safe=LOCATION_SAFE)
+
+
+def write_table(path: str, entries: dict, generation: int, exported_at: float):
+    # entries: short_key -> (flag, location). Open addressing з лінійним пробуванням, заповнення <= 50%
+    slot_count = 8
+    while slot_count < len(entries) * 2:
+        slot_count <<= 1
+    mask = slot_count - 1
+    slots = [None] * slot_count
+    records = bytearray()
+    data_start = HEADER.size + slot_count * SLOT.size
+
+    for key, (flag, target) in entries.items():
+        key_bytes = key.encode("utf-8")
+        record = RECORD_HEAD.pack(flag, len(key_bytes)) + key_bytes + target.encode("utf-8")
+        offset = data_start + len(records)
+        records += record
+        h = key_hash(key_bytes)
+        i = h & mask
+        while slots[i] is not None:
+            i = (i + 1) & mask
+        slots[i] = (h, offset, len(record))
+
+    # Запис у тимчасовий файл і os.replace: читачі ніколи не бачать файл наполовину
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, slot_count, len(entries), generation, exported_at))
+        empty = SLOT.pack(0, 0, 0)
+        f.write(b"".join(SLOT.pack(*slot) if slot is not None else empty for slot in slots))
+        f.write(records)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotTable:
+    # Read-only mmap: сторінки файлу спільні для всіх воркерів через page cache
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slot_count, self.entry_count, self.generation, self.exported_at = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        self._mask = self.slot_count - 1
+
+    def get(self, key: str):
+        # (flag, location) або None; O(1): хеш -> слот -> порівняння ключа
+        key_bytes = key.encode("utf-8")
+        h = key_hash(key_bytes)
+        i = h & self._mask
+        data = self._mmap
+        while True:
+            slot_hash, offset, length = SLOT.unpack_from(data, HEADER.size + i * SLOT.size)
+            if offset == 0:
+                return None
+            if slot_hash == h:
+                flag, key_len = RECORD_HEAD.unpack_from(data, offset)
+                start = offset + RECORD_HEAD.size
+                if data[start:start + key_len] == key_bytes:
+                    return flag, data[start + key_len:offset + length].decode("utf-8")
+            i = (i + 1) & self._mask
+
+    def items(self):
+        data = self._mmap
+        for i in range(self.slot_count):
+            _, offset, length = SLOT.unpack_from(data, HEADER.size + i * SLOT.size)
+            if offset:
+                flag, key_len = RECORD_HEAD.unpack_from(data, offset)
+                start = offset + RECORD_HEAD.size
+                key = data[start:start + key_len].decode("utf-8")
+                yield key, flag, data[start + key_len:offset + length].decode("utf-8")
+
+    def close(self):
+        self._mmap.close()
+
+
+class Snapshot:
+    # Базовий файл плюс delta-файли поверх нього; новіша delta перекриває старіші
+    def __init__(self, base: SnapshotTable, deltas: list):
+        self.base = base
+        self.deltas = deltas
+        self._layers = [*reversed(deltas), base]
+
+    @property
+    def generation(self) -> int:
+        return self.base.generation
+
+    def get(self, key: str):
+        for table in self._layers:
+            entry = table.get(key)
+            if entry is not None:
+                return None if entry[0] == DELETED else entry
+        return None
+
+    def keys(self) -> set:
+        keys = set()
+        for table in [self.base, *self.deltas]:
+            for key, flag, _ in table.items():
+                if flag == DELETED:
+                    keys.discard(key)
+                else:
+                    keys.add(key)
+        return keys
+
+    def close(self):
+        for table in self._layers:
+            table.close()
+
+
+def read_manifest(directory: str):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(directory: str, manifest: dict):
+    path = os.path.join(directory, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def load(directory: str):
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    base = SnapshotTable(os.path.join(directory, manifest["base"]))
+    return Snapshot(base, [SnapshotTable(os.path.join(directory, name)) for name in manifest["deltas"]])
+
+
+def entry_for(full_url: str, scan_status, expires_at=None, max_clicks=None) -> tuple:
+    import scanner
+
+    # Flagged (інтерстиціал), blocked (403), посилання зі строком дії або лімітом кліків віддає основний застосунок
+    limited = expires_at is not None or max_clicks is not None
+    flag = FALLBACK if limited or scan_status in (scanner.BLOCKED, scanner.FLAGGED) else REDIRECT
+    return flag, location(full_url)
+
+
+def export_columns(models) -> tuple:
+    url = models.URL
+    return url.short_key, url.full_url, url.scan_status, url.expires_at, url.max_clicks
+
+
+def watermark(exported_at: float) -> datetime:
+    # Колонки created_at / scanned_at — naive UTC
+    since = exported_at - SNAPSHOT_DELTA_OVERLAP
+    return datetime.fromtimestamp(since, timezone.utc).replace(tzinfo=None)
+
+
+async def export_full(db, directory: str = SNAPSHOT_DIR) -> str:
+    from sqlalchemy import select
+
+    import models
+
+    os.makedirs(directory, exist_ok=True)
+    exported_at = time.time()
+    entries = {}
+    result = await db.stream(select(*export_columns(models)))
+    async for short_key, *row in result:
+        entries[short_key] = entry_for(*row)
+
+    previous = read_manifest(directory)
+    generation = previous["generation"] + 1 if previous else 1
+    name = f"base-{generation:06d}.snap"
+    write_table(os.path.join(directory, name), entries, generation, exported_at)
+    write_manifest(directory, {"generation": generation, "base": name, "deltas": [], "exported_at": exported_at})
+
+    # Старі покоління: процеси, що ще тримають їх mmap, дочитають з unlinked-файлу
+    for old in os.listdir(directory):
+        if old.endswith(".snap") and not old.startswith((f"base-{generation:06d}", f"delta-{generation:06d}")):
+            os.remove(os.path.join(directory, old))
+    return name
+
+
+async def export_delta(db, directory: str = SNAPSHOT_DIR):
+    # Нові та пересканані з минулого експорту посилання + надгробки для видалених (url_tombstones)
+    from sqlalchemy import or_, select
+
+    import models
+    from sweeper import URL_TOMBSTONE_TTL
+
+    manifest = read_manifest(directory)
+    if manifest is None or len(manifest["deltas"]) >= SNAPSHOT_MAX_DELTAS:
+        return await export_full(db, directory)
+
+    exported_at = time.time()
+    if exported_at - manifest["exported_at"] + SNAPSHOT_DELTA_OVERLAP > URL_TOMBSTONE_TTL:
+        # Частину надгробків за цей час sweeper міг уже прибрати
+        return await export_full(db, directory)
+
+    since = watermark(manifest["exported_at"])
+    tombstones = await db.execute(
+        select(models.URLTombstone.short_key).where(models.URLTombstone.deleted_at >= since)
+    )
+    entries = {short_key: (DELETED, "") for short_key in tombstones.scalars()}
+    # Ключ могли видалити й видати заново: живий рядок перекриває надгробок
+    rows = (await db.execute(
+        select(*export_columns(models))
+        .where(or_(models.URL.created_at >= since, models.URL.scanned_at >= since))
+    )).all()
+    entries.update((short_key, entry_for(*row)) for short_key, *row in rows)
+
+    manifest["exported_at"] = exported_at
+    if entries:
+        name = f"delta-{manifest['generation']:06d}-{len(manifest['deltas']) + 1:04d}.snap"
+        write_table(os.path.join(directory, name), entries, manifest["generation"], exported_at)
+        manifest["deltas"].append(name)
+    write_manifest(directory, manifest)
+    return name if entries else None
+
+
+async def main_cli():
+    from database import AsyncSessionLocal
+
+    parser = argparse.ArgumentParser(description="Export urls into a memory-mapped snapshot for redirect_server.py")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    parser.add_argument("--full", action="store_true", help="rebuild the base file instead of writing a delta")
+    parser.add_argument("--every", type=float, help="keep running, exporting a delta every N seconds")
+    args = parser.parse_args()
+
+    full = args.full
+    while True:
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            name = await (export_full(db, args.dir) if full else export_delta(db, args.dir))
+        print(f"{datetime.now(timezone.utc).isoformat()} {name or 'no changes'} "
+              f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+        if not args.every:
+            break
+        full = False
+        await asyncio.sleep(args.every)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_cli())
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import DateTime, bindparam, delete, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import clicks
+import crud
+import invalidation
+import keys
+import models
+from database import AsyncSessionLocal, upsert
+
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", "60"))
+# Рядків на одну транзакцію: короткі транзакції не тримають блокування і не роздувають WAL
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+# Не більше стількох батчів за прохід, решта — наступного разу
+SWEEP_MAX_BATCHES = int(os.getenv("SWEEP_MAX_BATCHES", "20"))
+# Пауза між батчами, щоб не забирати всю пропускну здатність бази
+SWEEP_BATCH_PAUSE = float(os.getenv("SWEEP_BATCH_PAUSE", "0.05"))
+# delete — прибрати посилання разом з подіями кліків; archive — спершу скопіювати в urls_archive
+# і залишити агрегати кліків (click_rollups) для статистики під archived_rollup_key
+SWEEP_MODE = os.getenv("SWEEP_MODE", "delete")
+# Скільки пам'ятати видалені ключі (url_tombstones) для delta-експорту snapshot.py, сек.
+# Експорт, що відстав більше, робиться повним
+URL_TOMBSTONE_TTL = float(os.getenv("URL_TOMBSTONE_TTL", str(7 * 86400)))
+
+
+def archived_rollup_key(url_id: int) -> str:
+    # Агрегати архівованого посилання — під id з urls_archive: ключ може знову видатися (KEY_RECYCLE),
+    # а ":" не буває в short_key
+    return f"archived:{url_id}"
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ExpirySweeper:
+    def __init__(self, interval: float, batch_size: int, max_batches: int, batch_pause: float, mode: str):
+        if mode not in ("delete", "archive"):
+            raise ValueError(f"SWEEP_MODE must be 'delete' or 'archive', got {mode!r}")
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.batch_pause = batch_pause
+        self.mode = mode
+        self.swept = 0
+        self.archived = 0
+        self.recycled = 0
+        self.idempotency_pruned = 0
+        self.tombstones_pruned = 0
+        self.batches = 0
+        self.runs = 0
+        self.failed_runs = 0
+        self.last_run_seconds = 0.0
+        self.last_run_rows = 0
+        self.lag_seconds = 0.0
+
+    async def sweep_batch(self, db: AsyncSession, now: datetime) -> int:
+        # Діапазонний скан по індексу ix_urls_expires_at; SKIP LOCKED — кілька воркерів не чекають один на одного
+        url = models.URL
+        rows = (await db.execute(
+            select(url.id, url.short_key)
+            .where(url.expires_at <= now)
+            .order_by(url.expires_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if not rows:
+            await db.rollback()
+            return 0
+
+        ids = [row.id for row in rows]
+        short_keys = [row.short_key for row in rows]
+        if self.mode == "archive":
+            archived = select(
+                url.id, url.full_url, url.short_key, url.owner_id, url.clicks,
+                url.created_at, url.expires_at, url.max_clicks, literal(now, DateTime),
+            ).where(url.id.in_(ids))
+            await db.execute(upsert(db, models.ArchivedURL).from_select(
+                ["id", "full_url", "short_key", "owner_id", "clicks",
+                 "created_at", "expires_at", "max_clicks", "archived_at"],
+                archived,
+            ).on_conflict_do_nothing())
+            rollups = models.ClickRollup.__table__
+            await db.execute(
+                update(rollups).where(rollups.c.short_key == bindparam("old_key"))
+                .values(short_key=bindparam("new_key")),
+                [{"old_key": row.short_key, "new_key": archived_rollup_key(row.id)} for row in rows],
+            )
+        else:
+            await db.execute(delete(models.ClickRollup).where(models.ClickRollup.short_key.in_(short_keys)))
+        await db.execute(delete(models.ClickEvent).where(models.ClickEvent.short_key.in_(short_keys)))
+        await db.execute(delete(url).where(url.id.in_(ids)))
+        await db.execute(insert(models.URLTombstone), [
+            {"short_key": short_key, "deleted_at": now} for short_key in short_keys
+        ])
+        if keys.key_allocator.recycle:
+            available_at = now + timedelta(seconds=keys.KEY_RECYCLE_AFTER)
+            await db.execute(upsert(db, models.RecycledKey).values([
+                {"short_key": short_key, "available_at": available_at} for short_key in short_keys
+            ]).on_conflict_do_nothing())
+            self.recycled += len(short_keys)
+        await invalidation.bus.publish(db, invalidation.URL_GONE, short_keys)
+        await db.commit()
+
+        for short_key in short_keys:
+            cache.invalidate_url(short_key)
+            cache.missing_url_cache.set(short_key, True)
+            clicks.click_buffer.discard(short_key)
+        self.swept += len(rows)
+        if self.mode == "archive":
+            self.archived += len(rows)
+        self.batches += 1
+        return len(rows)
+
+    async def prune_idempotency_keys(self, db: AsyncSession, now: datetime) -> int:
+        expired_before = now - timedelta(seconds=crud.IDEMPOTENCY_KEY_TTL)
+        result = await db.execute(
+            delete(models.IdempotencyKey).where(models.IdempotencyKey.created_at < expired_before)
+        )
+        await db.commit()
+        self.idempotency_pruned += result.rowcount or 0
+        return result.rowcount or 0
+
+    async def prune_tombstones(self, db: AsyncSession, now: datetime) -> int:
+        table = models.URLTombstone
+        result = await db.execute(
+            delete(table).where(table.deleted_at < now - timedelta(seconds=URL_TOMBSTONE_TTL))
+        )
+        await db.commit()
+        self.tombstones_pruned += result.rowcount or 0
+        return result.rowcount or 0
+
+    async def sweep(self, db: AsyncSession) -> int:
+        started = time.perf_counter()
+        now = utcnow()
+        oldest = (await db.execute(
+            select(func.min(models.URL.expires_at)).where(models.URL.expires_at <= now)
+        )).scalar()
+        self.lag_seconds = (now - oldest).total_seconds() if oldest else 0.0
+        await db.rollback()
+
+        swept = 0
+        for _ in range(self.max_batches):
+            count = await self.sweep_batch(db, now)
+            swept += count
+            if count < self.batch_size:
+                break
+            if self.batch_pause:
+                await asyncio.sleep(self.batch_pause)
+        await self.prune_idempotency_keys(db, now)
+        await self.prune_tombstones(db, now)
+
+        self.runs += 1
+        self.last_run_rows = swept
+        self.last_run_seconds = time.perf_counter() - started
+        return swept
+
+    async def sweep_now(self) -> int:
+        async with AsyncSessionLocal() as db:
+            return await self.sweep(db)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep_now()
+            except Exception as e:
+                self.failed_runs += 1
+                print(f"Expiry sweep failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "swept": self.swept,
+            "archived": self.archived,
+            "recycled": self.recycled,
+            "idempotency_pruned": self.idempotency_pruned,
+            "tombstones_pruned": self.tombstones_pruned,
+            "batches": self.batches,
+            "runs": self.runs,
+            "failed_runs": self.failed_runs,
+            "last_run_rows": self.last_run_rows,
+            "last_run_seconds": round(self.last_run_seconds, 6),
+            "rows_per_second": round(self.last_run_rows / self.last_run_seconds, 1) if self.last_run_seconds else 0.0,
+            "lag_seconds": round(self.lag_seconds, 3),
+        }
+
+
+expiry_sweeper = ExpirySweeper(
+    interval=SWEEP_INTERVAL,
+    batch_size=SWEEP_BATCH_SIZE,
+    max_batches=SWEEP_MAX_BATCHES,
+    batch_pause=SWEEP_BATCH_PAUSE,
+    mode=SWEEP_MODE,
+)
@@ -1,6 +1,16 @@
 from fastapi import HTTPException
-from urllib.parse import urlparse
+from urllib.parse import parse_qsl, urlencode, urlparse, urlsplit, urlunsplit
 import base64
+import hashlib
+import json
+import os
+
+SHORT_URL_BASE = os.getenv("SHORT_URL_BASE", "http://localhost:8000").rstrip("/")
+# Прибирати utm_* / gclid / fbclid перед порівнянням URL на дублікати. Вимкнено за замовчуванням:
+# посилання з різними utm_campaign — окремі кампанії, і кожна має власну статистику кліків
+URL_DROP_TRACKING_PARAMS = os.getenv("URL_DROP_TRACKING_PARAMS", "0") not in ("0", "false", "False", "")
+TRACKING_PARAMS = {"gclid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga", "_hsenc"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
 
 
 def validate_url(target_url: str):
@@ -11,13 +21,75 @@ def validate_url(target_url: str):
     blocked_hosts = ["127.0.0.1", "localhost", "0.0.0.0"]
     if parsed.hostname in blocked_hosts:
         raise HTTPException(status_code=400, detail="URL points to local network")
+    try:
+        parsed.port
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid URL port")
 
     return target_url
 
 
+def canonicalize_url(target_url: str) -> str:
+    # Канонічна форма лише для пошуку дублікатів; в базі і в редиректі лишається оригінальний URL
+    parts = urlsplit(target_url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    netloc = host
+    if parts.username is not None:
+        userinfo = parts.username + (f":{parts.password}" if parts.password is not None else "")
+        netloc = f"{userinfo}@{host}"
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += f":{parts.port}"
+
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    if URL_DROP_TRACKING_PARAMS:
+        params = [(name, value) for name, value in params
+                  if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS]
+    query = urlencode(sorted(params))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, parts.fragment))
+
+
+def url_hash(target_url: str) -> str:
+    # 128 біт blake2b від канонічної форми: ключ унікального індексу (owner_id, url_hash)
+    return hashlib.blake2b(canonicalize_url(target_url).encode("utf-8"), digest_size=16).hexdigest()
+
+
 def get_url_id(target_url: str):
     url_bytes = target_url.encode("utf-8")
-    base64_bytes = base64.b64encode(url_bytes)
+    # VT очікує URL-safe base64 без padding
+    base64_bytes = base64.urlsafe_b64encode(url_bytes)
     base64_url = base64_bytes.decode("utf-8")
 
-    return base64_url.strip("=")
\ No newline at end of file
+    return base64_url.strip("=")
+
+
+def short_url(short_key: str):
+    return f"{SHORT_URL_BASE}/{short_key}"
+
+
+def validate_urls(target_urls: list):
+    # Для bulk: замість HTTPException на першому ж поганому URL повертає (url, error) для кожного
+    results = []
+    for target_url in target_urls:
+        try:
+            if not isinstance(target_url, str) or not target_url:
+                raise HTTPException(status_code=400, detail="URL is required")
+            results.append((validate_url(target_url), None))
+        except HTTPException as e:
+            results.append((None, e.detail))
+        except ValueError:
+            results.append((None, "Invalid URL"))
+    return results
+
+
+def encode_cursor(values: list):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
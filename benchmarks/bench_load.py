@@ -0,0 +1,247 @@
+"""Mixed-load benchmark: throughput, latency percentiles and DB queries per endpoint.
+
+    python benchmarks/bench_load.py --seconds 10 --concurrency 32
+    python benchmarks/bench_load.py --target uvicorn --database-url postgresql://...
+    python benchmarks/bench_load.py --compare benchmarks/results/<baseline>.json
+
+Seeds --users users and --links links, then replays a weighted mix of
+redirects, shortens, /my-urls listings and logins. The default target runs
+the ASGI app in-process (httpx.ASGITransport) and also counts SQL queries
+per endpoint; --target uvicorn starts a local uvicorn on --database-url
+(SQLite in a temp dir by default) and measures over real HTTP. Results are
+written as JSON to --output, so runs on different commits can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import common
+from httpx import ASGITransport, AsyncClient, Limits
+
+PASSWORD = "bench-password-123"
+DEFAULT_MIX = "redirect=95,shorten=2,list=2,login=1"
+RESULTS_DIR = common.ROOT / "benchmarks" / "results"
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=common.ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def seed(client, users: int, links: int):
+    tokens = []
+    for i in range(users):
+        username = f"bench-load-{i}"
+        await client.post("/register", json={"username": username, "password": PASSWORD})
+        response = await client.post("/token", data={"username": username, "password": PASSWORD})
+        tokens.append((username, response.json()["access_token"]))
+
+    keys = []
+    per_user = max(1, links // users)
+    for username, token in tokens:
+        urls = [f"https://{username}.example.com/page/{n}" for n in range(per_user)]
+        response = await client.post("/shorten/bulk", json=urls, headers={"Authorization": f"Bearer {token}"})
+        keys.extend(json.loads(line)["short_key"] for line in response.text.splitlines() if line.strip())
+    return tokens, keys
+
+
+class Load:
+    def __init__(self, client, tokens, keys, mix, zipf, seed, counter=None):
+        self.client = client
+        self.tokens = tokens
+        self.keys = keys
+        self.counter = counter
+        self.random = random.Random(seed)
+        self.ops = list(mix)
+        self.weights = [mix[name] for name in self.ops]
+        # Популярність посилань нерівномірна: вага 1 / rank^zipf
+        self.key_weights = [1 / (rank + 1) ** zipf for rank in range(len(keys))]
+        self.samples = {name: [] for name in self.ops}
+        self.errors = {name: 0 for name in self.ops}
+
+    async def request(self, op: str):
+        username, token = self.random.choice(self.tokens)
+        auth = {"Authorization": f"Bearer {token}"}
+        if op == "redirect":
+            key = self.random.choices(self.keys, self.key_weights)[0]
+            return await self.client.get(f"/{key}", follow_redirects=False), (301, 302, 307, 308)
+        if op == "shorten":
+            url = f"https://{username}.example.com/new/{self.random.random()}"
+            return await self.client.post("/shorten", json={"target_url": url}, headers=auth), (200,)
+        if op == "list":
+            return await self.client.get("/my-urls", params={"limit": 20}, headers=auth), (200,)
+        if op == "login":
+            return await self.client.post("/token", data={"username": username, "password": PASSWORD}), (200,)
+        raise ValueError(f"Unknown op {op}")
+
+    async def worker(self, deadline: float):
+        while time.perf_counter() < deadline:
+            op = self.random.choices(self.ops, self.weights)[0]
+            if self.counter is not None:
+                self.counter.label.set(op)
+            started = time.perf_counter()
+            try:
+                response, expected = await self.request(op)
+                ok = response.status_code in expected
+            except Exception:
+                ok = False
+            self.samples[op].append(time.perf_counter() - started)
+            if not ok:
+                self.errors[op] += 1
+
+    async def run(self, seconds: float, concurrency: int) -> float:
+        started = time.perf_counter()
+        deadline = started + seconds
+        await asyncio.gather(*(self.worker(deadline) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+def report(load: Load, elapsed: float, queries: dict) -> dict:
+    endpoints = {}
+    for op in load.ops:
+        row = common.summarize(op, load.samples[op], elapsed)
+        row["errors"] = load.errors[op]
+        row["queries"] = queries.get(op) if queries is not None else None
+        row["queries_per_request"] = (
+            round(queries.get(op, 0) / row["requests"], 2) if queries is not None and row["requests"] else None
+        )
+        endpoints[op] = row
+    all_samples = [sample for op in load.ops for sample in load.samples[op]]
+    total = common.summarize("total", all_samples, elapsed)
+    total["errors"] = sum(load.errors.values())
+    if queries is not None:
+        total["background_queries"] = queries.get("background", 0)
+    return {"endpoints": endpoints, "total": total}
+
+
+async def run_inprocess(args, mix):
+    import database
+    import main
+
+    common.migrate()
+    common.disable_rate_limits(main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://bench") as client:
+            tokens, keys = await seed(client, args.users, args.links)
+            counter = common.QueryCounter(database.async_engine)
+            load = Load(client, tokens, keys, mix, args.zipf, args.seed, counter)
+            elapsed = await load.run(args.seconds, args.concurrency)
+            queries = dict(counter.counts)
+    return report(load, elapsed, queries)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(args, mix):
+    port = free_port()
+    env = dict(os.environ, RATE_LIMIT_ENABLED="0", SCAN_CHECKER="off")
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    # Як і в Dockerfile: схема окремим кроком до старту воркерів
+    await asyncio.to_thread(subprocess.run, [sys.executable, "migrations.py"], cwd=common.ROOT / "backend",
+                            env=env, check=True, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        cwd=common.ROOT / "backend", env=env,
+    )
+    try:
+        async with AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30,
+                               limits=Limits(max_connections=args.concurrency)) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/docs")
+                    break
+                except Exception:
+                    await asyncio.sleep(0.1)
+            tokens, keys = await seed(client, args.users, args.links)
+            load = Load(client, tokens, keys, mix, args.zipf, args.seed)
+            elapsed = await load.run(args.seconds, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return report(load, elapsed, None)
+
+
+def compare(current: dict, baseline: dict):
+    print(f"\ncompared with {baseline['commit']} ({baseline['timestamp']})")
+    print(f"{'endpoint':<12}{'rps':>12}{'Δ rps':>10}{'p99 ms':>12}{'Δ p99':>10}")
+    rows = dict(current["endpoints"], total=current["total"])
+    base_rows = dict(baseline["endpoints"], total=baseline["total"])
+    for name, row in rows.items():
+        base = base_rows.get(name)
+        if not base:
+            continue
+        rps_delta = (row["rps"] / base["rps"] - 1) * 100 if base["rps"] else 0.0
+        p99_delta = (row["p99_ms"] / base["p99_ms"] - 1) * 100 if base["p99_ms"] else 0.0
+        print(f"{name:<12}{row['rps']:>12}{rps_delta:>+9.1f}%{row['p99_ms']:>12}{p99_delta:>+9.1f}%")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--database-url", help="for --target uvicorn (default: temp SQLite)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="results JSON (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    runner = run_inprocess if args.target == "inprocess" else run_uvicorn
+    result = asyncio.run(runner(args, mix))
+
+    commit = git_commit()
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    result = {
+        "commit": commit,
+        "timestamp": timestamp,
+        "target": args.target,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "database_url")},
+        **result,
+    }
+
+    common.print_table(list(result["endpoints"].values()) + [result["total"]])
+    for name, row in result["endpoints"].items():
+        print(f"{name:<12} errors={row['errors']} queries/request={row['queries_per_request']}")
+
+    output = args.output or RESULTS_DIR / f"{timestamp}-{commit}-{args.target}.json"
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nresults: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,84 @@
+"""Redirect latency while a burst of logins is being processed.
+
+    python benchmarks/bench_login_redirect.py --seconds 5 --logins 8
+
+Runs three scenarios in-process against the ASGI app: redirects alone,
+redirects next to concurrent logins with bcrypt offloaded to the worker
+pool, and the same with bcrypt running inline on the event loop.
+"""
+import argparse
+import asyncio
+import time
+
+import common  # noqa: F401  (налаштовує sys.path і тимчасову базу)
+from httpx import ASGITransport, AsyncClient
+
+import hashing
+import main
+
+USERNAME = "bench-user"
+PASSWORD = "bench-password-123"
+
+
+async def seed(client):
+    await client.post("/register", json={"username": USERNAME, "password": PASSWORD})
+    token = (await client.post("/token", data={"username": USERNAME, "password": PASSWORD})).json()["access_token"]
+    response = await client.post("/shorten", json={"target_url": "https://example.com"},
+                                 headers={"Authorization": f"Bearer {token}"})
+    return response.json()["short_key"]
+
+
+async def redirect_loop(client, short_key, deadline, samples):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get(f"/{short_key}", follow_redirects=False)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 307, response.status_code
+        await asyncio.sleep(0)
+
+
+async def login_loop(client, deadline):
+    while time.perf_counter() < deadline:
+        await client.post("/token", data={"username": USERNAME, "password": PASSWORD})
+
+
+async def scenario(client, short_key, seconds, logins):
+    samples = []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(
+        redirect_loop(client, short_key, deadline, samples),
+        *(login_loop(client, deadline) for _ in range(logins)),
+    )
+    return samples, time.perf_counter() - started
+
+
+async def run(seconds, logins, workers):
+    common.migrate()
+    common.disable_rate_limits(main.app)
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        short_key = await seed(client)
+        rows = []
+
+        samples, elapsed = await scenario(client, short_key, seconds, 0)
+        rows.append(common.summarize("redirect only", samples, elapsed))
+
+        hashing.password_hasher = hashing.PasswordHasher(workers=workers, max_queue=hashing.PASSWORD_HASH_QUEUE)
+        samples, elapsed = await scenario(client, short_key, seconds, logins)
+        rows.append(common.summarize(f"redirect + {logins} logins (pool={workers})", samples, elapsed))
+
+        hashing.password_hasher = hashing.PasswordHasher(workers=0, max_queue=0)
+        samples, elapsed = await scenario(client, short_key, seconds, logins)
+        rows.append(common.summarize(f"redirect + {logins} logins (inline)", samples, elapsed))
+
+    common.print_table(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--logins", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=hashing.PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.logins, args.workers))
@@ -0,0 +1,72 @@
+"""Redirect throughput: raw ASGI fast path vs the full FastAPI route.
+
+    python benchmarks/bench_redirect.py --seconds 5 --concurrency 32
+
+Runs in-process against the ASGI app. Both scenarios hit the same cached
+short key, so the difference is the per-request framework overhead.
+"""
+import argparse
+import asyncio
+import time
+
+import common  # noqa: F401  (налаштовує sys.path і тимчасову базу)
+from httpx import ASGITransport, AsyncClient
+
+import fastredirect
+import main
+
+USERNAME = "bench-redirect"
+PASSWORD = "bench-password-123"
+
+
+async def seed(client):
+    await client.post("/register", json={"username": USERNAME, "password": PASSWORD})
+    token = (await client.post("/token", data={"username": USERNAME, "password": PASSWORD})).json()["access_token"]
+    response = await client.post("/shorten", json={"target_url": "https://example.com"},
+                                 headers={"Authorization": f"Bearer {token}"})
+    return response.json()["short_key"]
+
+
+async def worker(client, short_key, deadline, samples):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get(f"/{short_key}", follow_redirects=False)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == fastredirect.REDIRECT_STATUS, response.status_code
+
+
+async def scenario(client, short_key, seconds, concurrency):
+    samples = []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(client, short_key, deadline, samples) for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+async def run(seconds, concurrency):
+    common.migrate()
+    common.disable_rate_limits(main.app)
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        short_key = await seed(client)
+        await client.get(f"/{short_key}")  # прогріти url_cache
+        rows = []
+
+        fastredirect.REDIRECT_FAST_PATH = False
+        samples, elapsed = await scenario(client, short_key, seconds, concurrency)
+        rows.append(common.summarize("FastAPI route", samples, elapsed))
+
+        fastredirect.REDIRECT_FAST_PATH = True
+        samples, elapsed = await scenario(client, short_key, seconds, concurrency)
+        rows.append(common.summarize("ASGI fast path", samples, elapsed))
+
+    common.print_table(rows)
+    print(f"speedup: {rows[1]['rps'] / rows[0]['rps']:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.concurrency))
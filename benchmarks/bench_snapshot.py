@@ -0,0 +1,111 @@
+"""Redirects from the mmap snapshot vs the FastAPI route and the ASGI fast path.
+
+    python benchmarks/bench_snapshot.py --links 20000 --seconds 5 --concurrency 32
+
+Seeds --links links, exports them with snapshot.export_full and replays
+redirects over random keys against three in-process ASGI apps: the
+redirect() route (fast path off), the RedirectFastPath middleware and
+redirect_server.SnapshotRedirectApp. url_cache is warmed first (as long as
+--links fits URL_CACHE_SIZE), so the numbers compare framework and lookup
+overhead rather than cold SQLite reads. Also times a bare key lookup in the
+snapshot file.
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+import common  # noqa: F401  (налаштовує sys.path і тимчасову базу)
+from httpx import ASGITransport, AsyncClient
+
+import database
+import fastredirect
+import main
+import snapshot
+from redirect_server import SnapshotRedirectApp
+
+USERNAME = "bench-snapshot"
+PASSWORD = "bench-password-123"
+
+
+async def seed(client, links):
+    await client.post("/register", json={"username": USERNAME, "password": PASSWORD})
+    token = (await client.post("/token", data={"username": USERNAME, "password": PASSWORD})).json()["access_token"]
+    urls = [f"https://example.com/page/{n}" for n in range(links)]
+    response = await client.post("/shorten/bulk", json=urls, headers={"Authorization": f"Bearer {token}"})
+    return [json.loads(line)["short_key"] for line in response.text.splitlines() if line.strip()]
+
+
+async def worker(client, keys, deadline, samples, rng):
+    while time.perf_counter() < deadline:
+        short_key = rng.choice(keys)
+        started = time.perf_counter()
+        response = await client.get(f"/{short_key}", follow_redirects=False)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == fastredirect.REDIRECT_STATUS, response.status_code
+
+
+async def scenario(app, keys, seconds, concurrency):
+    samples = []
+    rng = random.Random(42)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        deadline = time.perf_counter() + seconds
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, keys, deadline, samples, rng) for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def lookup_cost(table, keys, rounds=200_000):
+    rng = random.Random(7)
+    sample = [rng.choice(keys) for _ in range(rounds)]
+    started = time.perf_counter()
+    for short_key in sample:
+        table.get(short_key)
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+async def run(links, seconds, concurrency):
+    common.migrate()
+    common.disable_rate_limits(main.app)
+    directory = tempfile.mkdtemp(prefix="voidlink-snapshot-")
+    async with main.app.router.lifespan_context(main.app):
+        async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://bench") as client:
+            keys = await seed(client, links)
+        async with database.AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            await snapshot.export_full(db, directory)
+            export_ms = (time.perf_counter() - started) * 1000
+
+        # Прогріти url_cache, щоб route і fast path порівнювались з кешем, а не з холодною базою
+        for short_key in keys:
+            await fastredirect.lookup(short_key)
+
+        rows = []
+        fastredirect.REDIRECT_FAST_PATH = False
+        samples, elapsed = await scenario(main.app, keys, seconds, concurrency)
+        rows.append(common.summarize("FastAPI route", samples, elapsed))
+
+        fastredirect.REDIRECT_FAST_PATH = True
+        samples, elapsed = await scenario(main.app, keys, seconds, concurrency)
+        rows.append(common.summarize("ASGI fast path", samples, elapsed))
+
+        snapshot_app = SnapshotRedirectApp(directory)
+        snapshot_app.reload(force=True)
+        samples, elapsed = await scenario(snapshot_app, keys, seconds, concurrency)
+        rows.append(common.summarize("snapshot redirect server", samples, elapsed))
+
+    common.print_table(rows)
+    print(f"speedup vs route: {rows[2]['rps'] / rows[0]['rps']:.2f}x, vs fast path: {rows[2]['rps'] / rows[1]['rps']:.2f}x")
+    print(f"export: {len(keys)} links in {export_ms:.0f} ms, "
+          f"lookup: {lookup_cost(snapshot_app.snapshot, keys):.2f} us/key")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--links", type=int, default=20000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(run(args.links, args.seconds, args.concurrency))
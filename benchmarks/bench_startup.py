@@ -0,0 +1,117 @@
+"""Cold start: import time, time to first response and the cost of main.preload().
+
+    python benchmarks/bench_startup.py --runs 7
+    python benchmarks/bench_startup.py --top 15
+
+Every measurement runs in a fresh interpreter, the way a new uvicorn worker or
+an autoscaled container starts. Reports the median of --runs for:
+importing the framework alone (the floor), `import main`, import plus
+lifespan startup plus the first request, and main.preload(). Also lists
+which heavy optional modules got imported by `import main` (should be none)
+and, with --top, the slowest imports from python -X importtime.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import common
+
+HEAVY_MODULES = ("httpx", "jose", "passlib", "qrcode", "PIL")
+
+SCENARIOS = {
+    "framework floor (fastapi + sqlalchemy)": """
+import time
+started = time.perf_counter()
+import fastapi, sqlalchemy.ext.asyncio  # noqa
+result = {"seconds": time.perf_counter() - started}
+""",
+    "import main": """
+import sys, time
+started = time.perf_counter()
+import main  # noqa
+result = {"seconds": time.perf_counter() - started, "heavy": [m for m in HEAVY if m in sys.modules]}
+""",
+    "import + startup + first request": """
+import asyncio, os, time
+started = time.perf_counter()
+import main
+from httpx import ASGITransport, AsyncClient
+
+async def first_request():
+    async with main.app.router.lifespan_context(main.app):
+        async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://bench") as client:
+            response = await client.get("/internal/stats", headers={"X-Internal-Token": os.environ["INTERNAL_TOKEN"]})
+            assert response.status_code == 200, response.status_code
+
+asyncio.run(first_request())
+result = {"seconds": time.perf_counter() - started}
+""",
+    "main.preload()": """
+import time
+import main
+started = time.perf_counter()
+main.preload()
+result = {"seconds": time.perf_counter() - started}
+""",
+}
+
+
+def run_snippet(code: str) -> dict:
+    script = f"HEAVY = {HEAVY_MODULES!r}\n{code}\nimport json\nprint(json.dumps(result))"
+    # /internal/stats закритий токеном
+    env = {**os.environ, "INTERNAL_TOKEN": os.environ.get("INTERNAL_TOKEN") or "bench"}
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=common.ROOT / "backend", env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int) -> list:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=common.ROOT / "backend",
+        env=dict(os.environ), capture_output=True, text=True, check=True,
+    ).stderr
+    # importtime друкує дочірні модулі перед батьківським: беремо рівень під " main", без site і вкладених
+    rows = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = len(name) - len(name.lstrip())
+        if depth == 1:
+            if name.strip() == "main":
+                break
+            rows = []
+        elif depth == 3:
+            rows.append((int(parts[1]) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run(runs: int, top: int):
+    common.migrate()
+    # Перший запуск прогріває .pyc, у вимірювання не йде
+    run_snippet(SCENARIOS["import main"])
+    print(f"{'scenario':<42}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for name, code in SCENARIOS.items():
+        results = [run_snippet(code) for _ in range(runs)]
+        ms = [r["seconds"] * 1000 for r in results]
+        print(f"{name:<42}{statistics.median(ms):>12.1f}{min(ms):>10.1f}{max(ms):>10.1f}")
+        if "heavy" in results[0]:
+            print(f"  heavy modules loaded by import main: {', '.join(results[0]['heavy']) or 'none'}")
+    if top:
+        print("\nslowest modules imported directly by main (cumulative ms):")
+        for ms, name in slowest_imports(top):
+            print(f"  {ms:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="also print the N slowest imports")
+    args = parser.parse_args()
+    run(args.runs, args.top)
@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "backend")]
+
+# Бенчмарки не повинні чіпати робочу базу: за замовчуванням тимчасовий SQLite
+_db_path = os.path.join(tempfile.mkdtemp(prefix="voidlink-bench-"), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_path}")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+
+def migrate():
+    # main.py більше не створює схему при імпорті
+    import migrations
+
+    migrations.upgrade()
+
+
+def disable_rate_limits(app):
+    import ratelimit
+
+    ratelimit.limiter.enabled = False
+
+
+class QueryCounter:
+    # Рахує SQL-запити на engine з розбивкою за міткою з contextvar (ендпоінт бенчмарку).
+    # ASGITransport виконує застосунок у задачі клієнта, тож мітка доходить до курсора
+    def __init__(self, engine):
+        import contextvars
+
+        from sqlalchemy import event
+
+        self.label = contextvars.ContextVar("bench_label", default="background")
+        self.counts = {}
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        label = self.label.get()
+        self.counts[label] = self.counts.get(label, 0) + 1
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, samples, elapsed):
+    ms = [s * 1000 for s in samples]
+    return {
+        "name": name,
+        "requests": len(samples),
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def print_table(rows):
+    print(f"{'scenario':<34}{'reqs':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for r in rows:
+        print(f"{r['name']:<34}{r['requests']:>8}{r['rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['max_ms']:>10}")
+
@@ -20,10 +20,21 @@ interface Link {
     clicks: number;
 }
 
+// Список віддається сторінками: наступна — за курсором із заголовка X-Next-Cursor, лише на вимогу
+const PAGE_SIZE = 30
+
+// Посилання, створене вже після завантаження сторінки, може прийти ще раз у наступній
+const mergeLinks = (current: Link[], page: Link[]) => {
+    const seen = new Set(current.map(l => l.id))
+    return [...current, ...page.filter(l => !seen.has(l.id))]
+}
+
 export default function Dashboard() {
     const [links, setLinks] = useState<Link[]>([])
     const [longUrl, setLongUrl] = useState("")
     const [loading, setLoading] = useState(true)
+    const [nextCursor, setNextCursor] = useState<string | null>(null)
+    const [loadingMore, setLoadingMore] = useState(false)
     const [actionLoading, setActionLoading] = useState(false)
     const router = useRouter()
     const [selectedLink, setSelectedLink] = useState<Link | null>(null)
@@ -44,8 +55,9 @@ export default function Dashboard() {
             }
 
             try {
-                const res = await api.get('/my-urls')
+                const res = await api.get('/my-urls', { params: { limit: PAGE_SIZE } })
                 setLinks(res.data)
+                setNextCursor(res.headers['x-next-cursor'] || null)
             } catch (error) {
                 if (axios.isAxiosError(error) && error.response?.status === 401) {
                     localStorage.removeItem('token')
@@ -59,12 +71,27 @@ export default function Dashboard() {
         fetchLinks().then(() => {})
     }, [router])
 
+    const handleLoadMore = async () => {
+        if (!nextCursor) return
+        setLoadingMore(true)
+        try {
+            const res = await api.get('/my-urls', { params: { limit: PAGE_SIZE, cursor: nextCursor } })
+            setLinks(current => mergeLinks(current, res.data))
+            setNextCursor(res.headers['x-next-cursor'] || null)
+        } catch {
+            alert("Could not load more links")
+        } finally {
+            setLoadingMore(false)
+        }
+    }
+
     const handleShorten = async () => {
         if (!longUrl) return
         setActionLoading(true)
         try {
             const res = await api.post('/shorten', { target_url: longUrl })
-            setLinks([res.data, ...links])
+            // Той самий URL повертає вже наявне посилання: переносимо його нагору, а не дублюємо
+            setLinks([res.data, ...links.filter(l => l.id !== res.data.id)])
             setLongUrl("")
         } catch {
             alert("Failed to shorten link")
@@ -181,7 +208,7 @@ export default function Dashboard() {
                                     initial={{ opacity: 0, y: 20 }}
                                     animate={{ opacity: 1, y: 0 }}
                                     exit={{ opacity: 0, scale: 0.9 }}
-                                    transition={{ delay: index * 0.05 }}
+                                    transition={{ delay: (index % PAGE_SIZE) * 0.05 }}
                                 >
                                     <Card className="bg-[#0c0c0c] border-[#1a1a1a] p-6 hover:border-[#333] hover:bg-[#111] transition-all duration-300 group flex flex-col justify-between min-h-45 rounded-3xl relative overflow-hidden">
                                         {/* Ефект наведення - легкий градієнт */}
@@ -237,6 +264,19 @@ export default function Dashboard() {
                         )}
                     </AnimatePresence>
                 </div>
+
+                {nextCursor && (
+                    <div className="flex justify-center">
+                        <Button
+                            variant="ghost"
+                            onClick={handleLoadMore}
+                            disabled={loadingMore}
+                            className="text-[11px] text-[#666] hover:text-white hover:bg-white/5 gap-2 rounded-full px-6"
+                        >
+                            {loadingMore ? <Loader2 className="h-4 w-4 animate-spin" /> : "Load more"}
+                        </Button>
+                    </div>
+                )}
             </div>
 
             <SettingsModalGlobal
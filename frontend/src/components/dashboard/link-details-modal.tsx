@@ -3,6 +3,7 @@ import { motion, AnimatePresence } from "framer-motion"
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { Button } from "@/components/ui/button"
 import { X, Calendar, MousePointerClick, QrCode } from "lucide-react"
+import api from "@/lib/api"
 
 interface LinkDetailsProps {
     link: any;
@@ -13,6 +14,9 @@ interface LinkDetailsProps {
 export function LinkDetailsModal({ link, isOpen, onClose }: LinkDetailsProps) {
     if (!link) return null;
 
+    // QR рендериться бекендом на льоту (GET /qr/{short_key}) і кешується браузером по ETag
+    const qrUrl = link.short_key ? `${api.defaults.baseURL}/qr/${link.short_key}` : null;
+
     return (
         <AnimatePresence>
             {isOpen && (
@@ -59,11 +63,11 @@ export function LinkDetailsModal({ link, isOpen, onClose }: LinkDetailsProps) {
                                 </div>
 
                                 <div className="flex flex-col items-center justify-center p-6 bg-white/[0.02] rounded-xl border border-dashed border-[#222222]">
-                                    {link.qr_code ? (
+                                    {qrUrl ? (
                                         <div className="text-center space-y-4">
                                             <div className="p-2 bg-white rounded-lg"> {/* Білий фон для кращого сканування */}
                                                 <img
-                                                    src={link.qr_code}
+                                                    src={qrUrl}
                                                     alt="QR Code"
                                                     className="w-32 h-32"
                                                 />
@@ -71,7 +75,7 @@ export function LinkDetailsModal({ link, isOpen, onClose }: LinkDetailsProps) {
                                             <div className="flex flex-col gap-2">
                                                 <p className="text-[10px] text-[#777777] uppercase tracking-widest font-bold">QR Code Ready</p>
                                                 <a
-                                                    href={link.qr_code}
+                                                    href={qrUrl}
                                                     download={`qr-${link.short_key}.png`}
                                                     className="text-[10px] text-white/50 hover:text-white underline transition-colors"
                                                 >
@@ -4,13 +4,25 @@ const api = axios.create({
     baseURL: 'http://localhost:8000',
 });
 
+// Після запису API повертає X-Primary-Until: до цього моменту наші читання йдуть з primary,
+// а не з репліки, яка могла ще не отримати зміну
+let primaryUntil: string | null = null;
+
 // Автоматично додаємо токен до кожного запиту, якщо він є
 api.interceptors.request.use((config) => {
     const token = localStorage.getItem('token');
     if (token) {
         config.headers.Authorization = `Bearer ${token}`;
     }
+    if (primaryUntil && Number(primaryUntil) * 1000 > Date.now()) {
+        config.headers['X-Primary-Until'] = primaryUntil;
+    }
     return config;
 });
 
+api.interceptors.response.use((response) => {
+    primaryUntil = response.headers['x-primary-until'] ?? primaryUntil;
+    return response;
+});
+
 export default api;
\ No newline at end of file
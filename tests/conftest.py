@@ -1,36 +1,60 @@
 import pytest
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 from backend.main import app
-from backend.database import Base, get_db
+import auth
+import cache
+from database import Base, get_async_db, get_replica_db, to_async_url
+import metrics
 import os
 import pytest_asyncio
 
 TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
 
 engine = create_engine(TEST_DATABASE_URL)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# NullPool: pytest-asyncio створює новий event loop на кожен тест
+async_engine = create_async_engine(to_async_url(TEST_DATABASE_URL), poolclass=NullPool)
+metrics.instrument_engine(async_engine)
+TestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_db():
     Base.metadata.create_all(bind=engine)
     yield
 
-def override_get_db():
-    db = None
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        if db is not None:
-            db.close()
 
-app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_db
+for read_db in (get_replica_db, auth.get_principal_read_db, auth.get_current_principal_read_db):
+    app.dependency_overrides[read_db] = override_get_db
 
 # У файлі tests/conftest.py
 @pytest_asyncio.fixture
 async def ac():
     transport = ASGITransport(app=app) # type: ignore
     async with AsyncClient(transport=transport, base_url="http://test") as client:
-        yield client
\ No newline at end of file
+        yield client
+
+
+@pytest_asyncio.fixture
+async def memory_engine():
+    # Окрема in-memory SQLite зі свіжою схемою для юніт-тестів модулів (без застосунку)
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def clean_url_cache():
+    # Тести, що кладуть посилання прямо в глобальний кеш, не повинні залишати їх іншим
+    cache.url_cache.clear()
+    cache.missing_url_cache.clear()
+    yield cache.url_cache
+    cache.url_cache.clear()
+    cache.missing_url_cache.clear()
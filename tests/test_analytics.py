@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import crud
+import models
+from analytics import GRANULARITIES, ClickEventQueue, user_agent_family
+
+
+def test_user_agent_family():
+    assert user_agent_family("Mozilla/5.0 (Windows NT 10.0) Chrome/120.0 Safari/537.36") == "Chrome"
+    assert user_agent_family("Mozilla/5.0 Chrome/120.0 Safari/537.36 Edg/120.0") == "Edge"
+    assert user_agent_family("TelegramBot (like TwitterBot)") == "Bot"
+    assert user_agent_family(None) is None
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_events_and_accumulates_rollups(memory_engine):
+    queue = ClickEventQueue(maxsize=3, flush_interval=60, batch_size=100)
+    async with AsyncSession(memory_engine) as db:
+        queue.push("aaaaaa", "https://t.me/channel", "curl/8.0")
+        queue.push("aaaaaa")
+        assert await queue.flush(db) == 2
+        queue.push("aaaaaa")
+        queue.push("bbbbbb")
+        assert await queue.flush(db) == 2
+
+        for _ in range(4):
+            queue.push("cccccc")
+        assert queue.stats()["dropped"] == 1
+
+        events = await db.scalar(select(func.count()).select_from(models.ClickEvent))
+        event = await db.scalar(select(models.ClickEvent).where(models.ClickEvent.referrer.is_not(None)))
+        day = await crud.get_click_rollups(db, "aaaaaa", "day", since=GRANULARITIES["day"](event.clicked_at))
+
+    assert events == 4
+    assert (event.referrer, event.user_agent_family) == ("t.me", "curl")
+    assert sum(count for _, count in day) == 3
+
+
+@pytest.mark.asyncio
+async def test_deleting_a_link_drops_its_click_history(memory_engine):
+    queue = ClickEventQueue(maxsize=10, flush_interval=60, batch_size=100)
+    async with AsyncSession(memory_engine) as db:
+        db.add_all([models.URL(full_url="https://gone.example/", short_key="gonekey", owner_id=1),
+                    models.URL(full_url="https://kept.example/", short_key="keptkey", owner_id=1)])
+        await db.commit()
+        queue.push("gonekey")
+        queue.push("keptkey")
+        await queue.flush(db)
+
+        assert await crud.delete_db_url(db, "gonekey", 1)
+        for model in (models.ClickEvent, models.ClickRollup):
+            assert (await db.execute(select(model.short_key).distinct())).scalars().all() == ["keptkey"]
+    cache.missing_url_cache.clear()
@@ -0,0 +1,75 @@
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import cache
+from bot import service as service_module
+from bot.service import BotService, HttpBotService, InProcessBotService, ServiceError
+
+
+@pytest.mark.asyncio
+async def test_inprocess_service_calls_crud_directly(memory_engine):
+    service = InProcessBotService(session_factory=async_sessionmaker(memory_engine, expire_on_commit=False))
+
+    with pytest.raises(ServiceError) as exc:
+        await service.list_urls(777)
+    assert exc.value.status_code == 401
+
+    user = await service.register("botuser", "secret", 777)
+    assert user.telegram_id == 777
+    with pytest.raises(ServiceError):
+        await service.register("botuser", "secret", 778)
+    assert await service.login("botuser", "wrong", 777) is None
+
+    short_key = await service.shorten(777, "https://example.com/page")
+    assert await service.list_urls(777) == ([{"short_key": short_key, "clicks": 0}], False)
+    with pytest.raises(ServiceError) as exc:
+        await service.shorten(777, "ftp://example.com")
+    assert exc.value.status_code == 400
+
+    cache.principal_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_http_service_reuses_one_client():
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers["X-Telegram-ID"])
+        if request.url.path == "/shorten":
+            return httpx.Response(200, json={"short_key": "abc123"})
+        return httpx.Response(401, json={"detail": "Not authenticated"})
+
+    service = HttpBotService("http://api.test", transport=httpx.MockTransport(handler))
+    client = service.client
+    assert await service.shorten(5, "https://example.com") == "abc123"
+    with pytest.raises(ServiceError) as exc:
+        await service.list_urls(5)
+    assert exc.value.status_code == 401
+    assert seen == ["5", "5"] and service.client is client
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_http_list_reports_truncation(monkeypatch):
+    monkeypatch.setattr(service_module, "BOT_LIST_LIMIT", 2)
+    limits = []
+
+    def handler(request):
+        limits.append(request.url.params["limit"])
+        links = [{"short_key": f"k{n}", "clicks": n} for n in range(2)]
+        return httpx.Response(200, json=links, headers={"X-Next-Cursor": "abc"})
+
+    service = HttpBotService("http://api.test", transport=httpx.MockTransport(handler))
+    urls, has_more = await service.list_urls(5)
+    assert len(urls) == 2 and has_more and limits == ["2"]
+    await service.close()
+
+
+def test_service_must_implement_every_operation():
+    class LoginOnly(BotService):
+        async def list_urls(self, telegram_id):
+            return []
+
+    with pytest.raises(TypeError):
+        LoginOnly()
@@ -0,0 +1,73 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import bulk
+import models
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_ndjson_stream_is_parsed_across_chunks():
+    items = [item async for item in bulk.iter_ndjson(chunks(b'"https://a.com"\n{"target_', b'url": "https://b.com"}\n'))]
+    assert items == ["https://a.com", {"target_url": "https://b.com"}]
+
+
+@pytest.mark.asyncio
+async def test_shorten_stream_validates_inserts_and_applies_quota(monkeypatch, memory_engine):
+    monkeypatch.setattr(bulk, "BULK_CHUNK_SIZE", 2)
+    quota = bulk.BulkQuota(capacity=2, window=3600, max_concurrent=1)
+    items = ["https://a.com", "ftp://bad", {"target_url": "https://b.com"}, "https://c.com"]
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        results = [r async for r in bulk.shorten_stream(db, 1, bulk.iter_list(items), quota=quota)]
+        count = await db.scalar(select(func.count()).select_from(models.URL))
+
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert "short_key" in results[0] and "short_key" in results[2]
+    assert results[1]["error"] == "Invalid URL scheme"
+    assert results[3]["error"] == "Bulk quota exceeded"
+    assert count == 2
+
+
+@pytest.mark.asyncio
+async def test_sql_quota_is_shared_between_workers(memory_engine):
+    sessions = async_sessionmaker(memory_engine)
+
+    workers = [bulk.SQLBulkQuota(capacity=3, window=3600, max_concurrent=1, session_factory=sessions)
+               for _ in range(2)]
+    assert await workers[0].consume(1, 2) == 2
+    assert await workers[1].consume(1, 2) == 1
+    assert await workers[1].remaining(2) == 3
+
+    await workers[0].start_job(1)
+    with pytest.raises(HTTPException):
+        await workers[1].start_job(1)
+    await workers[0].finish_job(1)
+    await workers[1].start_job(1)
+
+
+@pytest.mark.asyncio
+async def test_job_slot_released_when_stream_never_starts():
+    quota = bulk.BulkQuota(capacity=10, window=3600, max_concurrent=1)
+    await quota.start_job(1)
+
+    async def never_iterated():
+        yield "x"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def broken_send(message):
+        # Клієнт пішов ще до заголовків відповіді
+        raise OSError("connection reset")
+
+    response = bulk.JobStreamingResponse(never_iterated(), quota, 1, media_type="application/x-ndjson")
+    # starlette перетворює OSError відправки на ClientDisconnect
+    with pytest.raises(Exception):
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, broken_send)
+    await quota.start_job(1)
@@ -0,0 +1,31 @@
+import time
+
+from cache import TTLCache
+
+
+def test_lru_eviction_and_counters():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", "https://a.com")
+    c.set("b", "https://b.com")
+    assert c.get("a") == "https://a.com"  # "a" стає найсвіжішим
+    c.set("c", "https://c.com")
+
+    assert c.get("b") is None
+    assert c.get("c") == "https://c.com"
+    stats = c.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_ttl_expiry_and_pop():
+    c = TTLCache(maxsize=10, ttl=0.01)
+    c.set("a", "https://a.com")
+    time.sleep(0.02)
+    assert "a" not in c
+
+    c.ttl = 60
+    c.set("b", "https://b.com")
+    assert c.pop("b") == "https://b.com"
+    assert c.get("b") is None
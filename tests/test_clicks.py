@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from clicks import ClickBuffer
+
+
+@pytest.mark.asyncio
+async def test_flush_applies_deltas_in_one_pass(memory_engine):
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        db.add_all([
+            models.URL(full_url="https://a.com", short_key="aaaaa", clicks=2),
+            models.URL(full_url="https://b.com", short_key="bbbbb", clicks=0),
+        ])
+        await db.commit()
+
+        buffer = ClickBuffer(flush_interval=60, flush_threshold=1000)
+        for _ in range(3):
+            buffer.add("aaaaa")
+        buffer.add("bbbbb")
+        buffer.add("gone1")
+        assert buffer.pending("aaaaa") == 3
+
+        assert await buffer.flush(db) == 5
+        assert buffer.pending("aaaaa") == 0
+        rows = dict((await db.execute(select(models.URL.short_key, models.URL.clicks))).all())
+        assert rows == {"aaaaa": 5, "bbbbb": 1}
+        assert buffer.stats()["pending_clicks"] == 0
+
+
+def test_discard_drops_pending_clicks():
+    buffer = ClickBuffer(flush_interval=60, flush_threshold=2)
+    buffer.add("aaaaa")
+    buffer.add("aaaaa")
+    assert buffer._wakeup.is_set()
+    buffer.discard("aaaaa")
+    assert buffer.stats()["pending_clicks"] == 0
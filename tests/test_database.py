@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+import models
+
+
+@pytest.mark.asyncio
+async def test_release_connection_keeps_loaded_objects(memory_engine):
+    async with AsyncSession(memory_engine, autoflush=False, expire_on_commit=False) as db:
+        db.add(models.User(username="pool_user", hashed_password="x"))
+        await db.commit()
+
+        user = await db.scalar(select(models.User).where(models.User.username == "pool_user"))
+        assert db.in_transaction()
+        await database.release_connection(db)
+        assert not db.in_transaction()
+        assert user.hashed_password == "x"
+
+        # Змінений об'єкт повертається в сесію і зберігається новим з'єднанням
+        db.add(user)
+        user.hashed_password = "y"
+        await db.commit()
+        assert await db.scalar(select(models.User.hashed_password).where(models.User.id == user.id)) == "y"
+
+
+def test_engine_options():
+    assert database.engine_options("sqlite://")["pool_pre_ping"] is database.DB_POOL_PRE_PING
+    assert "pool_size" not in database.engine_options("sqlite://")
+    assert database.engine_options("postgresql+asyncpg://u@h/db")["pool_size"] == database.DB_POOL_SIZE
+
+
+def test_pool_stats_report_saturation():
+    stats = database.pool_stats()
+    assert stats["async"]["capacity"] == database.DB_POOL_SIZE + database.DB_MAX_OVERFLOW
+    assert 0 <= stats["async"]["saturation"] <= 1
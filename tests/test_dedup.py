@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import models
+import ratelimit
+import utils
+from utils import canonicalize_url, url_hash
+
+
+def test_canonical_form_ignores_case_ports_param_order_and_opt_in_tracking(monkeypatch):
+    assert canonicalize_url("HTTPS://Example.COM:443/a?b=2&a=1") == "https://example.com/a?a=1&b=2"
+    # Різні кампанії — різні посилання, поки URL_DROP_TRACKING_PARAMS не ввімкнено
+    assert url_hash("https://example.com/?utm_campaign=a") != url_hash("https://example.com/?utm_campaign=b")
+    monkeypatch.setattr(utils, "URL_DROP_TRACKING_PARAMS", True)
+    assert canonicalize_url("https://example.com/a?b=2&a=1&utm_source=x&fbclid=1") == "https://example.com/a?a=1&b=2"
+    assert canonicalize_url("http://example.com:8080") == "http://example.com:8080/"
+    # Шлях і регістр значень — частина адреси
+    assert url_hash("https://example.com/A") != url_hash("https://example.com/a")
+
+
+@pytest.mark.asyncio
+async def test_same_target_returns_existing_link_per_owner(memory_engine):
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        first = await crud.create_db_url(db, "https://Example.com/p?b=1&a=2", user_id=1)
+        again = await crud.create_db_url(db, "https://example.com:443/p?a=2&b=1", user_id=1)
+        other_owner = await crud.create_db_url(db, "https://example.com/p?a=2&b=1", user_id=2)
+        assert again.short_key == first.short_key
+        assert again.full_url == "https://Example.com/p?b=1&a=2"
+        assert other_owner.short_key != first.short_key
+
+        keys = await crud.create_db_urls_bulk(
+            db, ["https://example.com/p?a=2&b=1", "https://new.example/", "https://NEW.example"], user_id=1,
+        )
+        assert keys[0] == first.short_key
+        assert keys[1] == keys[2] != first.short_key
+        assert await db.scalar(select(func.count()).select_from(models.URL)) == 3
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replays_and_rejects_other_url(ac, monkeypatch):
+    monkeypatch.setattr(ratelimit.limiter, "enabled", False)
+    await ac.post("/register", json={"username": "idem_user", "password": "password123"})
+    token = (await ac.post("/token", data={"username": "idem_user", "password": "password123"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "retry-1"}
+
+    first = await ac.post("/shorten", json={"target_url": "https://idem.example/a"}, headers=headers)
+    retry = await ac.post("/shorten", json={"target_url": "https://idem.example/a"}, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["short_key"] == first.json()["short_key"]
+
+    conflict = await ac.post("/shorten", json={"target_url": "https://idem.example/b"}, headers=headers)
+    assert conflict.status_code == 422
@@ -0,0 +1,35 @@
+import pytest
+
+import cache
+import fastredirect
+import scanner
+
+
+@pytest.mark.asyncio
+async def test_clean_links_served_by_fast_path(ac, clean_url_cache):
+    cache.url_cache.set("fastok", cache.LinkTarget("https://example.com/a b?q=1", scanner.CLEAN))
+    cache.url_cache.set("fastwarn", cache.LinkTarget("https://shady.example/", scanner.FLAGGED))
+    served = fastredirect.counters["served"]
+
+    response = await ac.get("/fastok")
+    assert response.status_code == fastredirect.REDIRECT_STATUS
+    assert response.headers["location"] == "https://example.com/a%20b?q=1"
+    assert fastredirect.counters["served"] == served + 1
+
+    # Flagged-посилання йде у звичайний роут з попередженням
+    warning = await ac.get("/fastwarn")
+    assert warning.status_code == 200 and "may be unsafe" in warning.text
+    assert fastredirect.counters["served"] == served + 1
+
+
+@pytest.mark.asyncio
+async def test_blocked_and_flagged_links_fall_through(ac, clean_url_cache):
+    cache.url_cache.set("fastbad", cache.LinkTarget("https://evil.example/", scanner.BLOCKED))
+    cache.url_cache.set("fastmeh", cache.LinkTarget("https://shady.example/", scanner.FLAGGED))
+    served, fallbacks = fastredirect.counters["served"], fastredirect.counters["fallbacks"]
+
+    assert (await ac.get("/fastbad")).status_code == 403
+    flagged = await ac.get("/fastmeh")
+    assert flagged.status_code == 200 and "may be unsafe" in flagged.text
+    assert fastredirect.counters["served"] == served
+    assert fastredirect.counters["fallbacks"] == fallbacks + 2
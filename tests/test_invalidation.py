@@ -0,0 +1,135 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import auth
+import cache
+import invalidation
+import scanner
+from database import Base
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def warm_caches():
+    cache.url_cache.set("busgone", cache.LinkTarget("https://gone.example/", scanner.CLEAN))
+    cache.url_cache.set("busscan", cache.LinkTarget("https://scan.example/", scanner.PENDING))
+    cache.principal_cache.set(("tg", 777), (auth.Principal(id=77, username="bus_user", telegram_id=777), float("inf")))
+
+
+def assert_evicted():
+    assert cache.url_cache.get("busgone") is None and "busgone" in cache.missing_url_cache
+    assert cache.url_cache.get("busscan").scan_status == scanner.BLOCKED
+    assert cache.principal_cache.get(("tg", 777)) is None
+
+
+@pytest.mark.parametrize("transport_name", ["memory", "sql"])
+@pytest.mark.asyncio
+async def test_events_reach_other_processes_only_after_commit(tmp_path, transport_name):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bus.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    if transport_name == "memory":
+        shared = invalidation.MemoryTransport()
+        writer, worker = invalidation.InvalidationBus(shared), invalidation.InvalidationBus(shared)
+    else:
+        # Кожен "процес" зі своїм транспортом, спільна лише таблиця
+        writer = invalidation.InvalidationBus(invalidation.SQLTransport(sessions, poll_interval=0.01))
+        worker = invalidation.InvalidationBus(invalidation.SQLTransport(sessions, poll_interval=0.01))
+    listener = asyncio.create_task(worker.run())
+    try:
+        await wait_for(lambda: worker.connected)
+        warm_caches()
+
+        async with AsyncSession(engine) as db:
+            await writer.publish(db, invalidation.URL_GONE, ["busgone"])
+            await writer.publish(db, invalidation.SCAN_STATUS, [f"busscan={scanner.BLOCKED}"])
+            await writer.publish(db, invalidation.USER, [77])
+            await asyncio.sleep(0.05)
+            assert cache.url_cache.get("busgone") is not None
+            await db.commit()
+
+        await wait_for(lambda: worker.received == 3)
+        assert_evicted()
+        assert writer.published == 3 and worker.own == 0
+    finally:
+        listener.cancel()
+        cache.url_cache.clear()
+        cache.missing_url_cache.clear()
+        cache.principal_cache.clear()
+        await engine.dispose()
+
+
+def test_large_batches_are_split_under_notify_limit():
+    keys = [f"key{n:06d}" for n in range(2000)]
+    payloads = invalidation.encode("abc", [f"{invalidation.URL_GONE}:{key}" for key in keys])
+    assert len(payloads) > 1 and all(len(p) <= invalidation.MAX_PAYLOAD for p in payloads)
+    decoded = [value for payload in payloads for _, value in invalidation.decode(payload)[2]]
+    assert decoded == keys
+
+
+def test_forked_workers_get_their_own_origin():
+    bus = invalidation.InvalidationBus(None)
+    parent_origin = bus.origin
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Воркер gunicorn: той самий об'єкт bus, успадкований від майстра
+        os.write(write_end, bus.origin.encode())
+        os._exit(0)
+    os.close(write_end)
+    child_origin = os.read(read_end, 64).decode()
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    assert child_origin and child_origin != parent_origin
+    assert bus.origin == parent_origin
+
+
+@pytest.mark.asyncio
+async def test_two_buses_apply_each_others_events():
+    shared = invalidation.MemoryTransport()
+    first, second = invalidation.InvalidationBus(shared), invalidation.InvalidationBus(shared)
+    assert first.origin != second.origin
+    try:
+        for sender, receiver in ((first, second), (second, first)):
+            receiver.handle(invalidation.encode(sender.origin, [f"{invalidation.URL_GONE}:busgone"])[0])
+            assert receiver.received == 1 and receiver.own == 0
+    finally:
+        cache.missing_url_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_events_are_not_delivered_on_a_later_commit(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bus.db'}")
+    shared = invalidation.MemoryTransport()
+    writer, worker = invalidation.InvalidationBus(shared), invalidation.InvalidationBus(shared)
+    listener = asyncio.create_task(worker.run())
+    try:
+        await wait_for(lambda: worker.connected)
+        async with AsyncSession(engine) as db:
+            await db.execute(text("SELECT 1"))
+            await writer.publish(db, invalidation.URL_GONE, ["rolledback"])
+            await db.rollback()
+            await db.execute(text("SELECT 1"))
+            await writer.publish(db, invalidation.URL_GONE, ["committed"])
+            await db.commit()
+            await db.execute(text("SELECT 1"))
+            await db.commit()
+
+        await wait_for(lambda: worker.received == 1)
+        await asyncio.sleep(0.05)
+        assert worker.received == 1
+        assert "committed" in cache.missing_url_cache and "rolledback" not in cache.missing_url_cache
+    finally:
+        listener.cancel()
+        cache.missing_url_cache.clear()
+        await engine.dispose()
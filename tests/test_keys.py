@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import keys
+import models
+from keys import BASE, KeyAllocator, KeyCodec, base62_decode, base62_encode
+
+
+def test_codec_is_collision_free_and_grows():
+    codec = KeyCodec(min_length=2, scramble=True, secret="test")
+    band = BASE ** 2
+    keys = {codec.encode(n) for n in range(band)}
+    assert len(keys) == band
+    assert all(len(k) == 2 for k in keys)
+    assert len(codec.encode(band)) == 3
+
+    plain = KeyCodec(min_length=3, scramble=False, secret="")
+    assert base62_decode(plain.encode(12345)) == 12345
+    assert base62_encode(0, 3) == "aaa"
+
+
+@pytest.mark.asyncio
+async def test_allocators_reserve_disjoint_blocks(memory_engine):
+    codec = KeyCodec(min_length=6, scramble=True, secret="test")
+    first, second = KeyAllocator(codec, block_size=10), KeyAllocator(codec, block_size=10)
+    async with AsyncSession(memory_engine) as db:
+        keys = await first.allocate_many(db, 15) + await second.allocate_many(db, 15)
+        keys.append(await first.allocate(db))
+
+    assert len(set(keys)) == 31
+    assert first.blocks_reserved == 2  # 10 + 10
+    assert second.blocks_reserved == 1  # одразу 15
+
+
+@pytest.mark.asyncio
+async def test_scramble_secret_is_pinned_in_database(monkeypatch, memory_engine):
+    async with AsyncSession(memory_engine) as db:
+        first = KeyAllocator(KeyCodec(min_length=6, scramble=True), block_size=10)
+        issued = await first.allocate_many(db, 10)
+        # Новий процес з іншим KEY_SCRAMBLE_SECRET (ротація) кодує так само, як перший
+        monkeypatch.setattr(keys, "KEY_SCRAMBLE_SECRET", "rotated")
+        restarted = KeyAllocator(KeyCodec(min_length=6, scramble=True), block_size=10)
+        await restarted.allocate_many(db, 1)
+        assert restarted.codec.secret == first.codec.secret
+        assert [restarted.codec.encode(n) for n in range(10)] == issued
+
+
+@pytest.mark.asyncio
+async def test_taken_keys_are_skipped_on_create(monkeypatch, memory_engine):
+    allocator = KeyAllocator(KeyCodec(min_length=6, scramble=True, secret="test"), block_size=10)
+    monkeypatch.setattr(keys, "key_allocator", allocator)
+
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        # Ключі, які аллокатор видасть першими, уже зайняті (напр. видані зі старим секретом)
+        for number in (0, 1, 2, 4):
+            db.add(models.URL(full_url="https://old.example/", short_key=allocator.codec.encode(number), owner_id=9))
+        await db.commit()
+
+        created = await crud.create_db_url(db, "https://new.example/", user_id=1)
+        assert created.short_key == allocator.codec.encode(3)
+        # 4 зайнятий: цей рядок відкидає on_conflict_do_nothing, і він отримує ключ у другому проході
+        bulk_keys = await crud.create_db_urls_bulk(db, ["https://a.example/", "https://b.example/"], user_id=1)
+        assert set(bulk_keys) == {allocator.codec.encode(n) for n in (5, 6)}
+        assert await db.scalar(select(func.count()).select_from(models.URL)) == 7
@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+
+import auth
+import metrics
+
+
+def sample(name, **labels):
+    from prometheus_client import REGISTRY
+
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.asyncio
+async def test_request_histograms_per_route(ac, monkeypatch):
+    monkeypatch.setattr(auth, "INTERNAL_TOKEN", "scrape-token")
+    before = sample("http_request_db_queries_count", route="/register")
+
+    response = await ac.post("/register", json={"username": f"metrics_{uuid.uuid4().hex[:8]}", "password": "password123"})
+    assert response.status_code == 200
+    assert sample("http_request_db_queries_count", route="/register") == before + 1
+    assert sample("http_request_db_queries_sum", route="/register") > 0
+
+    body = (await ac.get("/metrics", headers={"Authorization": "Bearer scrape-token"})).text
+    assert 'http_request_duration_seconds_bucket{le="0.0005",method="POST",route="/register",status="200"}' in body
+    assert 'span_duration_seconds_count{span="bcrypt_hash"}' in body
+
+
+@pytest.mark.asyncio
+async def test_internal_endpoints_require_token(ac, monkeypatch):
+    monkeypatch.setattr(auth, "INTERNAL_TOKEN", None)
+    assert (await ac.get("/metrics")).status_code == 404
+    monkeypatch.setattr(auth, "INTERNAL_TOKEN", "scrape-token")
+    for path in ("/metrics", "/internal/stats"):
+        assert (await ac.get(path)).status_code == 401
+        assert (await ac.get(path, headers={"X-Internal-Token": "wrong"})).status_code == 401
+    assert (await ac.get("/internal/stats", headers={"X-Internal-Token": "scrape-token"})).status_code == 200
+
+
+def test_span_attributes_time_to_current_request():
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    try:
+        with metrics.span("unit"):
+            pass
+        with metrics.span("unit"):
+            pass
+    finally:
+        metrics.current_request.reset(token)
+    assert set(stats.spans) == {"unit"}
+    assert sample("span_duration_seconds_count", span="unit") >= 2
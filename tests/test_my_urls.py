@@ -0,0 +1,32 @@
+import pytest
+
+import ratelimit
+from backend import main
+
+
+@pytest.mark.asyncio
+async def test_pages_by_clicks_cover_every_link_and_cursor_is_exposed(ac, monkeypatch):
+    monkeypatch.setattr(ratelimit.limiter, "enabled", False)
+    await ac.post("/register", json={"username": "pager_user", "password": "password123"})
+    token = (await ac.post("/token", data={"username": "pager_user", "password": "password123"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Origin": "http://localhost:3000"}
+    urls = [f"https://page{n}.example/" for n in range(5)]
+    assert (await ac.post("/shorten/bulk", json=urls, headers=headers)).status_code == 200
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "sort": "-clicks", **({"cursor": cursor} if cursor else {})}
+        response = await ac.get("/my-urls", params=params, headers=headers)
+        # Фронтенд читає курсор із заголовка: CORS має його відкривати
+        assert "x-next-cursor" in response.headers["access-control-expose-headers"].lower()
+        seen += [row["id"] for row in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 5
+
+    # Інлайн-QR рендериться на кожен рядок: сторінка обрізається, решта — за курсором
+    monkeypatch.setattr(main, "MY_URLS_QR_LIMIT", 2)
+    response = await ac.get("/my-urls", params={"limit": 1000, "include_qr": True}, headers=headers)
+    assert len(response.json()) == 2 and all(row["qr_code"] for row in response.json())
+    assert response.headers.get("x-next-cursor")
@@ -0,0 +1,32 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import auth
+import cache
+import models
+
+
+@pytest.mark.asyncio
+async def test_principal_cached_until_user_invalidated(memory_engine):
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        user = models.User(username="cached", hashed_password="x", telegram_id=4242)
+        db.add(user)
+        await db.commit()
+        token = auth.create_access_token({"sub": "cached"})
+
+        by_token = await auth.principal_from_token(db, token)
+        by_tg = await auth.principal_from_telegram_id(db, 4242)
+        assert by_token == by_tg == auth.Principal(user.id, "cached", 4242)
+
+        # Рядка в базі вже немає, але кеш ще відповідає без запиту
+        await db.execute(delete(models.User))
+        await db.commit()
+        assert (await auth.principal_from_token(db, token)).id == user.id
+
+        cache.invalidate_user(user.id)
+        assert await auth.principal_from_telegram_id(db, 4242) is None
+        with pytest.raises(HTTPException) as exc:
+            await auth.principal_from_token(db, token)
+        assert exc.value.status_code == 401
@@ -0,0 +1,26 @@
+import pytest
+
+import cache
+
+
+@pytest.mark.asyncio
+async def test_qr_rendered_on_demand_with_etag(ac, clean_url_cache):
+    cache.url_cache.set("qrkey", cache.LinkTarget("https://example.com", None))
+
+    png = await ac.get("/qr/qrkey")
+    assert png.status_code == 200
+    assert png.headers["content-type"] == "image/png"
+    assert png.content.startswith(b"\x89PNG")
+    assert "max-age" in png.headers["cache-control"]
+
+    not_modified = await ac.get("/qr/qrkey", headers={"If-None-Match": png.headers["etag"]})
+    assert not_modified.status_code == 304
+
+    svg = await ac.get("/qr/qrkey", params={"format": "svg", "size": 4})
+    assert svg.status_code == 200
+    assert svg.headers["content-type"].startswith("image/svg+xml")
+    assert svg.headers["etag"] != png.headers["etag"]
+
+    cache.invalidate_url("qrkey")
+    missing = await ac.get("/qr/qrkey")
+    assert missing.status_code == 404
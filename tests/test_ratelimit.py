@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from fastapi import Depends, FastAPI, Header
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import ratelimit
+from ratelimit import MemoryStore, Policy, RateLimiter, RedisStore, SQLStore, gcra_step, sliding_step
+
+
+def test_gcra_allows_burst_then_steady_rate():
+    policy = Policy(3, 60, "gcra")
+    tat, now = None, 1000.0
+    for remaining in (2, 1, 0):
+        decision, tat = gcra_step(tat, now, policy)
+        assert decision.allowed and decision.remaining == remaining
+    decision, _ = gcra_step(tat, now, policy)
+    assert not decision.allowed and decision.retry_after == pytest.approx(20)
+    assert gcra_step(tat, now + 20, policy)[0].allowed
+
+
+def test_sliding_window_weights_previous_window():
+    policy = Policy(10, 60, "sliding")
+    state, now = None, 6000.0  # початок вікна
+    for _ in range(10):
+        decision, state = sliding_step(state, now, policy)
+        assert decision.allowed
+    assert not sliding_step(state, now + 59, policy)[0].allowed
+    # Через пів наступного вікна з попередніх 10 рахуються 5
+    decision, state = sliding_step(state, now + 90, policy)
+    assert decision.allowed and decision.remaining == 4
+
+
+async def exhaust(limiters, policy_name, identity):
+    allowed = 0
+    for i in range(10):
+        decision = await limiters[i % len(limiters)].hit(policy_name, identity)
+        allowed += decision.allowed
+    return allowed
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", ["gcra", "sliding"])
+async def test_shared_stores_hold_limit_across_workers(algorithm, memory_engine):
+    policies = {"test": Policy(4, 60, algorithm)}
+
+    sessions = async_sessionmaker(memory_engine)
+    # Два "воркери" з окремими лімітерами над однією базою
+    workers = [RateLimiter(SQLStore(sessions), policies) for _ in range(2)]
+    assert await exhaust(workers, "test", "ip:1") == 4
+
+    server = fakeredis.FakeServer()
+    workers = [RateLimiter(RedisStore(fakeredis.aioredis.FakeRedis(server=server)), policies) for _ in range(2)]
+    assert await exhaust(workers, "test", "ip:1") == 4
+    assert await exhaust(workers, "test", "ip:2") == 4
+
+    # Окремі memory-сховища рахують кожне своє
+    workers = [RateLimiter(MemoryStore(), policies) for _ in range(2)]
+    assert await exhaust(workers, "test", "ip:1") == 8
+
+
+@pytest.mark.asyncio
+async def test_store_failure_fails_open():
+    class BrokenStore:
+        async def hit(self, key, policy):
+            raise ConnectionError("redis is down")
+
+    limiter = RateLimiter(BrokenStore(), {"test": Policy(1, 60)})
+    assert (await limiter.hit("test", "ip:1")).allowed
+    assert limiter.stats()["errors"] == 1
+    assert ratelimit.POLICIES["redirect"].limit >= 100
+
+
+@pytest.mark.asyncio
+async def test_lost_cas_races_fail_open(memory_engine, monkeypatch):
+    monkeypatch.setattr(ratelimit, "SQL_CAS_ATTEMPTS", 0)
+    limiter = RateLimiter(SQLStore(async_sessionmaker(memory_engine)), {"test": Policy(1, 60)})
+    assert all([(await limiter.hit("test", "ip:1")).allowed for _ in range(3)])
+    assert limiter.stats()["contended"] == 3 and limiter.stats()["errors"] == 0
+
+
+@pytest.mark.asyncio
+async def test_user_scope_is_keyed_on_authenticated_principal_not_headers():
+    limiter = RateLimiter(MemoryStore(), {"shorten": Policy(1, 300, "gcra", "user")})
+    app = FastAPI()
+
+    async def principal(authorization: str = Header()):
+        # Як auth.get_principal: сторонні заголовки не змінюють, хто користувач
+        return SimpleNamespace(id=int(authorization.split()[-1]))
+
+    @app.post("/shorten", dependencies=[Depends(ratelimit.user_rate_limit("shorten", principal, limiter))])
+    async def shorten():
+        return {}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://rl") as client:
+        assert (await client.post("/shorten", headers={"Authorization": "Bearer 1"})).status_code == 200
+        # Новий X-Telegram-ID чи інший запис того самого токена раніше давали свіжий bucket
+        for headers in ({"Authorization": "Bearer 1", "X-Telegram-ID": "424242"},
+                        {"Authorization": "bearer  1"}):
+            assert (await client.post("/shorten", headers=headers)).status_code == 429
+        assert (await client.post("/shorten", headers={"Authorization": "Bearer 2"})).status_code == 200
+
+
+def test_auto_store_is_shared_with_several_workers(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert isinstance(ratelimit.build_store("auto"), SQLStore)
+    # Редирект не ходить у базу: лише акаунтні політики в SQL
+    default, stores = ratelimit.build_stores(ratelimit.POLICIES, "auto")
+    assert isinstance(stores["redirect"], MemoryStore)
+    assert stores["login"] is stores["shorten"] is default and isinstance(default, SQLStore)
+    monkeypatch.setenv("RATE_LIMIT_STORE_REDIRECT", "sql")
+    assert isinstance(ratelimit.build_stores(ratelimit.POLICIES, "auto")[1]["redirect"], SQLStore)
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert isinstance(ratelimit.build_store("auto"), MemoryStore)
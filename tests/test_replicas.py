@@ -0,0 +1,97 @@
+import pytest
+from fastapi import FastAPI, Request
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import cache
+import crud
+import models
+from database import PRIMARY_UNTIL_HEADER, Base, ReadYourWrites, ReplicaRouter, primary_until
+
+
+async def sqlite_engine(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+@pytest.mark.asyncio
+async def test_reads_routed_to_replicas_with_read_your_writes(tmp_path):
+    primary = await sqlite_engine(tmp_path / "primary.db")
+    replica_a = await sqlite_engine(tmp_path / "replica_a.db")
+    replica_b = await sqlite_engine(tmp_path / "replica_b.db")
+    router = ReplicaRouter(primary, [replica_a, replica_b], read_your_writes=60)
+
+    assert [router.engine_for() for _ in range(4)] == [replica_a, replica_b, replica_a, replica_b]
+
+    # Після власної зміни користувач читає з primary, інші — далі з реплік
+    router.mark_write(7)
+    assert router.engine_for(7) is primary
+    assert router.engine_for(8) in (replica_a, replica_b)
+
+    # Рядок є лише на primary (репліка "відстає"): промах на репліці перепитується в primary
+    async with AsyncSession(primary) as db:
+        db.add(models.URL(full_url="https://fresh.example/", short_key="freshkey", owner_id=7))
+        await db.commit()
+    async with router.session() as read_db, AsyncSession(primary) as db:
+        assert await crud.get_redirect_target(read_db, "freshkey") is None
+        cache.missing_url_cache.clear()
+        target = await crud.get_redirect_target(read_db, "freshkey", primary=db)
+        assert (target.full_url, target.scan_status) == ("https://fresh.example/", "pending")
+    cache.url_cache.clear()
+
+    for engine in (primary, replica_a, replica_b):
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_unhealthy_replicas_fall_back_to_primary(tmp_path):
+    primary = await sqlite_engine(tmp_path / "primary.db")
+    broken = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/missing/dir.db", poolclass=NullPool)
+    router = ReplicaRouter(primary, [broken])
+
+    await router.check()
+    assert router.healthy == []
+    assert router.engine_for() is primary
+
+    router.healthy = [broken]
+    with pytest.raises(Exception):
+        async with router.session() as db:
+            await db.execute(models.URL.__table__.select())
+    assert router.healthy == [] and router.failures == 1
+
+    await primary.dispose()
+
+
+@pytest.mark.asyncio
+async def test_write_marker_routes_reads_to_primary_on_other_workers(tmp_path):
+    primary = await sqlite_engine(tmp_path / "primary.db")
+    replica = await sqlite_engine(tmp_path / "replica.db")
+    writer, reader = ReplicaRouter(primary, [replica]), ReplicaRouter(primary, [replica])
+    app = FastAPI()
+
+    @app.post("/write")
+    async def write():
+        writer.mark_write(7)
+        return {}
+
+    @app.get("/read")
+    async def read(request: Request):
+        return {"primary": reader.engine_for(7, primary_until(request)) is primary}
+
+    async with AsyncClient(transport=ASGITransport(app=ReadYourWrites(app, writer)), base_url="http://rw") as client:
+        marker = (await client.post("/write")).headers[PRIMARY_UNTIL_HEADER]
+        # Інший воркер про запис не знає, але клієнт приносить маркер (заголовком або cookie)
+        assert (await client.get("/read", headers={PRIMARY_UNTIL_HEADER: marker})).json() == {"primary": True}
+        assert (await client.get("/read")).json() == {"primary": True}
+        client.cookies.clear()
+        assert (await client.get("/read")).json() == {"primary": False}
+
+    # Помилка з'єднання, яку ендпоінт перехопив сам, теж виводить репліку з ротації
+    reader.report_error(replica, OperationalError("SELECT 1", {}, Exception("connection refused")))
+    assert reader.healthy == [] and reader.engine_for() is primary
+    for engine in (primary, replica):
+        await engine.dispose()
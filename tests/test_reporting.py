@@ -0,0 +1,35 @@
+import json
+
+import httpx
+import pytest
+
+import http_client
+from reporting import ErrorReporter
+
+
+@pytest.mark.asyncio
+async def test_identical_errors_are_deduplicated_into_one_digest(monkeypatch):
+    sent = []
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "token")
+    monkeypatch.setenv("TG_ID", "1")
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: sent.append(json.loads(request.content)) or httpx.Response(200))
+    ))
+    reporter = ErrorReporter(interval=1, cooldown=60, maxsize=2)
+
+    for _ in range(5):
+        reporter.report(RuntimeError("db is down"), endpoint="/shorten")
+    reporter.report(ValueError("bad"), endpoint="/my-urls")
+    reporter.report(KeyError("x"), endpoint="/token")  # черга повна
+    assert reporter.dropped == 1
+
+    assert await reporter.flush() == 2
+    assert len(sent) == 1
+    assert "/shorten (x5)" in sent[0]["text"] and "RuntimeError" in sent[0]["text"]
+
+    # Повтор у межах cooldown чекає, а не шле нове повідомлення
+    reporter.report(RuntimeError("db is down"), endpoint="/shorten")
+    assert await reporter.flush() == 0
+    assert await reporter.flush(force=True) == 1
+    assert len(sent) == 2
+    await http_client.close()
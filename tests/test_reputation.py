@@ -0,0 +1,152 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import metrics
+import models
+from reputation import ReputationService, TokenBucket
+from utils import get_url_id
+
+
+def make_service(session_factory, handler, rate=100.0, capacity=10, max_wait=1.0, timeout=10.0):
+    return ReputationService(
+        api_url="http://vt.test/api/v3",
+        api_key="test",
+        bucket=TokenBucket(rate=rate, capacity=capacity),
+        verdict_ttl=60,
+        unknown_ttl=60,
+        cache_size=100,
+        max_wait=max_wait,
+        session_factory=session_factory,
+        transport=httpx.MockTransport(handler),
+        timeout=timeout,
+    )
+
+
+@pytest.mark.asyncio
+async def test_lookups_are_coalesced_and_persisted(memory_engine):
+    sessions = async_sessionmaker(memory_engine, expire_on_commit=False)
+
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        if request.url.path.endswith(get_url_id("https://unknown.example")):
+            return httpx.Response(404, json={"error": {"code": "NotFoundError"}})
+        stats = {"malicious": 2, "suspicious": 1, "harmless": 50}
+        return httpx.Response(200, json={"data": {"attributes": {"last_analysis_stats": stats}}})
+
+    service = make_service(sessions, handler)
+    verdicts = await asyncio.gather(*[service.check("https://bad.example") for _ in range(5)])
+    assert len(requests) == 1
+    assert requests[0].headers["x-apikey"] == "test"
+    assert all(v.malicious == 2 and v.suspicious == 1 and not v.is_safe for v in verdicts)
+    assert service.coalesced == 4
+
+    unknown = await service.check("https://unknown.example")
+    assert not unknown.known and unknown.is_safe
+
+    # Новий процес без кешу в пам'яті бере вердикт з бази, а не з VT
+    fresh = make_service(sessions, handler)
+    assert (await fresh.check("https://bad.example")).malicious == 2
+    assert len(requests) == 2 and fresh.db_hits == 1
+
+    await service.close()
+    await fresh.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_lookup_does_not_report_into_the_first_request(memory_engine):
+    seen = []
+
+    async def handler(request):
+        seen.append(metrics.current_request.get())
+        stats = {"malicious": 0, "suspicious": 0, "harmless": 10}
+        return httpx.Response(200, json={"data": {"attributes": {"last_analysis_stats": stats}}})
+
+    service = make_service(async_sessionmaker(memory_engine, expire_on_commit=False), handler)
+    token = metrics.current_request.set(metrics.RequestStats())
+    try:
+        assert (await service.check("https://first.example")).is_safe
+    finally:
+        metrics.current_request.reset(token)
+    assert seen == [None]
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_rejects_when_wait_is_too_long():
+    bucket = TokenBucket(rate=1 / 60, capacity=1)
+    await bucket.acquire(max_wait=0)
+    with pytest.raises(HTTPException) as exc:
+        await bucket.acquire(max_wait=1)
+    assert exc.value.status_code == 503
+    assert int(exc.value.headers["Retry-After"]) >= 59
+
+
+@pytest.mark.asyncio
+async def test_interactive_check_is_not_queued_behind_waiting_scanner():
+    bucket = TokenBucket(rate=2, capacity=1)
+    await bucket.acquire(max_wait=0)
+    scanner_wait = asyncio.create_task(bucket.acquire(max_wait=5))
+    await asyncio.sleep(0.01)
+
+    started = asyncio.get_running_loop().time()
+    with pytest.raises(HTTPException):
+        await bucket.acquire(max_wait=0.1)
+    # Відмова одразу, а не після сну сканера під lock
+    assert asyncio.get_running_loop().time() - started < 0.2
+    await scanner_wait
+    assert bucket.waited_seconds > 0
+
+
+@pytest.mark.asyncio
+async def test_joined_lookup_is_bounded_by_callers_own_wait(memory_engine):
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        stats = {"malicious": 1, "suspicious": 0, "harmless": 10}
+        return httpx.Response(200, json={"data": {"attributes": {"last_analysis_stats": stats}}})
+
+    service = make_service(async_sessionmaker(memory_engine, expire_on_commit=False), handler, timeout=0.05)
+    # Сканер почав перевірку і готовий чекати довго
+    scan = asyncio.create_task(service.check("https://slow.example", max_wait=600))
+    await asyncio.sleep(0.01)
+
+    started = asyncio.get_running_loop().time()
+    assert await service.check("https://slow.example", max_wait=0.05) == (0, 0, False)
+    assert asyncio.get_running_loop().time() - started < 0.5 and service.timed_out == 1
+
+    release.set()
+    assert (await scan).malicious == 1
+    assert service.verdicts.get(get_url_id("https://slow.example")).malicious == 1
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_expiry_follows_checked_at(memory_engine):
+    sessions = async_sessionmaker(memory_engine, expire_on_commit=False)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    async with sessions() as db:
+        db.add(models.UrlVerdict(url_id=get_url_id("https://old.example"), malicious=0, suspicious=0, known=True,
+                                 checked_at=now - timedelta(seconds=59)))
+        await db.commit()
+
+    async def handler(request):
+        stats = {"malicious": 0, "suspicious": 0, "harmless": 10}
+        return httpx.Response(200, json={"data": {"attributes": {"last_analysis_stats": stats}}})
+
+    service = make_service(sessions, handler)
+    await service.check("https://old.example")
+    assert service.db_hits == 1
+    # Рядку лишалось ~1 с з verdict_ttl=60 — у пам'яті він живе стільки ж, а не ще 60 с
+    _, expires_at = service.verdicts._data[get_url_id("https://old.example")]
+    assert expires_at - time.monotonic() < 2
+    await service.close()
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import crud
+import models
+import scanner
+
+
+class FailingChecker:
+    async def check(self, url, max_wait=None):
+        raise RuntimeError("upstream down")
+
+
+@pytest.mark.asyncio
+async def test_scan_batch_fills_verdicts_and_invalidates_cache(memory_engine):
+    checker = scanner.StubChecker(blocked_hosts={"evil.example"}, flagged_hosts={"shady.example"})
+    # Два процеси API над однією базою
+    queue, other = [scanner.ScanQueue(checker, workers=1, batch_size=10, maxsize=10, poll_interval=1)
+                    for _ in range(2)]
+    queue.running = other.running = True
+
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        for key, url in [("scanok", "https://good.example/"), ("scanbad", "https://evil.example/x"),
+                         ("scanmeh", "https://shady.example/")]:
+            db.add(models.URL(full_url=url, short_key=key, owner_id=1))
+        await db.commit()
+
+        assert await crud.get_redirect_target(db, "scanbad") == cache.LinkTarget("https://evil.example/x", scanner.PENDING)
+        assert await queue.refill(db) == 3
+        assert await queue.refill(db) == 0  # вже в черзі
+        assert await other.refill(db) == 3
+
+        assert await queue.scan_batch(db, queue.take(10)) == 3
+        # Рядки вже взяв перший процес: другий їх не перевіряє вдруге
+        assert await other.scan_batch(db, other.take(10)) == 0 and other.skipped == 3
+        statuses = dict((await db.execute(select(models.URL.short_key, models.URL.scan_status))).all())
+        assert statuses == {"scanok": scanner.CLEAN, "scanbad": scanner.BLOCKED, "scanmeh": scanner.FLAGGED}
+        assert cache.url_cache.get("scanbad") == cache.LinkTarget("https://evil.example/x", scanner.BLOCKED)
+        assert (await crud.get_redirect_target(db, "scanbad"))[1] == scanner.BLOCKED
+
+        # Помилки перевірки повертають посилання в чергу, поки не вичерпано спроби
+        queue.checker = FailingChecker()
+        await db.execute(update(models.URL).where(models.URL.short_key == "scanok").values(scan_status=scanner.PENDING))
+        await db.commit()
+        queue.enqueue("scanok", "https://good.example/")
+        for _ in range(scanner.SCAN_MAX_ATTEMPTS):
+            await queue.scan_batch(db, queue.take(10))
+        assert queue.take(10) == []
+        assert await db.scalar(select(models.URL.scan_status).where(models.URL.short_key == "scanok")) == scanner.ERROR
+    cache.url_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_stale_claims_return_to_pending_and_idle_queue_ignores_enqueue(monkeypatch, memory_engine):
+    queue = scanner.ScanQueue(scanner.StubChecker(set(), set()), workers=1, batch_size=10, maxsize=10, poll_interval=1)
+    # Бот у режимі inprocess: воркерів черги в процесі немає
+    assert not queue.enqueue("idlekey", "https://good.example/")
+
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        db.add(models.URL(full_url="https://good.example/", short_key="crashed", owner_id=1,
+                          scan_status=scanner.SCANNING, scanned_at=datetime(2000, 1, 1)))
+        await db.commit()
+        queue.running = True
+        assert await queue.refill(db) == 1
+        assert await queue.scan_batch(db, queue.take(10)) == 1
+        assert await db.scalar(select(models.URL.scan_status)) == scanner.CLEAN
@@ -0,0 +1,101 @@
+import os
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import crud
+import models
+import scanner
+import snapshot
+import sweeper
+from redirect_server import SnapshotRedirectApp
+
+
+def test_table_lookups_and_delta_layers(tmp_path):
+    base = {f"k{i}": (snapshot.REDIRECT, f"https://example.com/{i}") for i in range(1000)}
+    snapshot.write_table(tmp_path / "base.snap", base, generation=1, exported_at=0)
+    snapshot.write_table(tmp_path / "delta.snap", {"k1": (snapshot.DELETED, ""), "k2": (snapshot.FALLBACK, "x"),
+                                                   "new": (snapshot.REDIRECT, "https://new.example/")}, 1, 0)
+
+    table = snapshot.SnapshotTable(str(tmp_path / "base.snap"))
+    assert table.entry_count == 1000 and table.slot_count == 2048
+    assert all(table.get(key) == value for key, value in base.items())
+    assert table.get("missing") is None
+
+    layered = snapshot.Snapshot(table, [snapshot.SnapshotTable(str(tmp_path / "delta.snap"))])
+    assert layered.get("k0") == (snapshot.REDIRECT, "https://example.com/0")
+    assert layered.get("k1") is None
+    assert layered.get("k2") == (snapshot.FALLBACK, "x")
+    assert layered.get("new") == (snapshot.REDIRECT, "https://new.example/")
+    assert layered.keys() == (set(base) - {"k1"}) | {"new"}
+    layered.close()
+
+
+@pytest.mark.asyncio
+async def test_export_and_serve_with_reload(tmp_path, memory_engine):
+    directory = str(tmp_path)
+
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        db.add_all([
+            models.URL(full_url="https://a.example/a b", short_key="snapa", owner_id=1),
+            models.URL(full_url="https://shady.example/", short_key="snapf", owner_id=1,
+                       scan_status=scanner.FLAGGED),
+        ])
+        await db.commit()
+        assert await snapshot.export_full(db, directory) == "base-000001.snap"
+
+        app = SnapshotRedirectApp(directory, reload_interval=0, fallback_url="http://app")
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://snap") as client:
+            response = await client.get("/snapa")
+            assert response.status_code == 307 and response.headers["location"] == "https://a.example/a%20b"
+            # Flagged і невідомі ключі — в основний застосунок
+            assert (await client.get("/snapf")).headers["location"] == "http://app/snapf"
+            assert (await client.get("/snapb")).headers["location"] == "http://app/snapb"
+
+            db.add(models.URL(full_url="https://b.example/", short_key="snapb", owner_id=1))
+            assert await crud.delete_db_url(db, "snapa", 1)
+            cache.missing_url_cache.clear()
+            time.sleep(0.01)  # інший mtime маніфесту
+            assert await snapshot.export_delta(db, directory) == "delta-000001-0001.snap"
+
+            assert (await client.get("/snapb")).headers["location"] == "https://b.example/"
+            assert (await client.get("/snapa")).headers["location"] == "http://app/snapa"
+            assert app.counters["reloads"] == 2
+
+            await snapshot.export_full(db, directory)
+            assert sorted(name for name in os.listdir(directory) if name.endswith(".snap")) == ["base-000002.snap"]
+            assert (await client.get("/snapb")).status_code == 307
+            assert app.snapshot.generation == 2
+
+
+@pytest.mark.asyncio
+async def test_delta_reads_deletions_from_tombstones(tmp_path, monkeypatch, memory_engine):
+    directory = str(tmp_path)
+
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        db.add_all([models.URL(full_url="https://t.example/", short_key=f"tomb{n}", owner_id=1) for n in range(3)])
+        await db.commit()
+        await snapshot.export_full(db, directory)
+
+        # Видалений і знову виданий ключ у delta — живий
+        assert await crud.delete_db_url(db, "tomb0", 1)
+        assert await crud.delete_db_url(db, "tomb1", 1)
+        db.add(models.URL(full_url="https://reused.example/", short_key="tomb1", owner_id=1))
+        await db.commit()
+        cache.missing_url_cache.clear()
+        await snapshot.export_delta(db, directory)
+        layered = snapshot.load(directory)
+        assert layered.get("tomb0") is None
+        assert layered.get("tomb1") == (snapshot.REDIRECT, "https://reused.example/")
+        assert layered.keys() == {"tomb1", "tomb2"}
+        layered.close()
+
+        # Експорт, що відстав довше, ніж живуть надгробки, робиться повним
+        manifest = snapshot.read_manifest(directory)
+        manifest["exported_at"] -= 2 * 86400
+        snapshot.write_manifest(directory, manifest)
+        monkeypatch.setattr(sweeper, "URL_TOMBSTONE_TTL", 86400)
+        assert await snapshot.export_delta(db, directory) == "base-000002.snap"
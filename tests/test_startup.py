@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+
+def test_import_main_has_no_side_effects():
+    # База недосяжна і змінних JWT немає: імпорт усе одно має пройти, без важких модулів
+    env = {k: v for k, v in os.environ.items() if k not in ("SECRET_KEY", "ALGORITHM", "ACCESS_TOKEN_EXPIRE_MINUTES")}
+    env["DATABASE_URL"] = "sqlite:////nonexistent-dir/voidlink.db"
+    script = "import sys, main; print(sorted(m for m in ('httpx', 'jose', 'passlib', 'qrcode', 'PIL') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_upgrade_adds_columns_and_indexes_to_existing_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE urls (id INTEGER PRIMARY KEY, full_url VARCHAR, short_key VARCHAR, "
+                          "owner_id INTEGER)"))
+
+    created = migrations.upgrade(engine)
+    assert "ix_urls_expires_at" in created and "ux_urls_owner_id_url_hash" in created
+    inspector = inspect(engine)
+    assert {"expires_at", "max_clicks", "url_hash"} <= {c["name"] for c in inspector.get_columns("urls")}
+    assert inspector.has_table("recycled_keys")
+    # Повторний запуск нічого не робить
+    assert migrations.upgrade(engine) == []
+    engine.dispose()
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import keys
+import models
+import ratelimit
+from sweeper import ExpirySweeper, archived_rollup_key
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@pytest.mark.asyncio
+async def test_click_cap_and_past_expiry(ac, monkeypatch):
+    monkeypatch.setattr(ratelimit.limiter, "enabled", False)
+    await ac.post("/register", json={"username": "expiry_user", "password": "password123"})
+    token = (await ac.post("/token", data={"username": "expiry_user", "password": "password123"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    past = (utcnow() - timedelta(minutes=1)).isoformat()
+    response = await ac.post("/shorten", json={"target_url": "https://once.example/", "expires_at": past}, headers=headers)
+    assert response.status_code == 400
+
+    response = await ac.post("/shorten", json={"target_url": "https://once.example/", "max_clicks": 2}, headers=headers)
+    short_key = response.json()["short_key"]
+    assert [(await ac.get(f"/{short_key}")).status_code for _ in range(3)] == [307, 307, 410]
+
+    info = (await ac.get(f"/my-urls/{short_key}", headers=headers)).json()
+    assert info["clicks"] == 2 and info["max_clicks"] == 2 and info["expires_at"] is not None
+
+
+@pytest.mark.asyncio
+async def test_sweeper_archives_in_batches_and_recycles_keys(monkeypatch, memory_engine):
+    monkeypatch.setattr(keys.key_allocator, "recycle", True)
+
+    now = utcnow()
+    async with AsyncSession(memory_engine, expire_on_commit=False) as db:
+        db.add_all([
+            models.URL(full_url=f"https://old.example/{n}", short_key=f"old{n}", owner_id=1,
+                       expires_at=now - timedelta(minutes=n + 1))
+            for n in range(5)
+        ])
+        db.add(models.URL(full_url="https://live.example/", short_key="live", owner_id=1,
+                          expires_at=now + timedelta(days=1)))
+        db.add(models.ClickEvent(short_key="old0", clicked_at=now))
+        db.add(models.ClickRollup(short_key="old0", granularity="day", bucket_start=now, clicks=3))
+        await db.commit()
+        cache.url_cache.set("old0", cache.LinkTarget("https://old.example/0", None))
+
+        sweeper = ExpirySweeper(interval=60, batch_size=2, max_batches=10, batch_pause=0, mode="archive")
+        assert await sweeper.sweep(db) == 5
+        assert sweeper.batches == 3 and sweeper.lag_seconds >= 300
+
+        remaining = (await db.execute(select(models.URL.short_key))).scalars().all()
+        assert remaining == ["live"]
+        assert await db.scalar(select(func.count()).select_from(models.ArchivedURL)) == 5
+        assert await db.scalar(select(func.count()).select_from(models.ClickEvent)) == 0
+        # Агрегати лишаються за архівним id, а не за ключем, який ще видадуть комусь іншому
+        archived_id = await db.scalar(select(models.ArchivedURL.id).where(models.ArchivedURL.short_key == "old0"))
+        assert (await db.execute(select(models.ClickRollup.short_key))).scalars().all() == [
+            archived_rollup_key(archived_id)
+        ]
+        assert cache.url_cache.get("old0") is None and "old0" in cache.missing_url_cache
+        # Надгробки для delta-експорту snapshot.py
+        assert await db.scalar(select(func.count()).select_from(models.URLTombstone)) == 5
+
+        # Ключі повертаються в обіг лише після карантину
+        recycled = (await db.execute(select(models.RecycledKey))).scalars().all()
+        assert len(recycled) == 5 and all(row.available_at > now for row in recycled)
+        allocator = keys.KeyAllocator(keys.key_allocator.codec, block_size=10, recycle=True)
+        await db.execute(models.RecycledKey.__table__.update().where(models.RecycledKey.short_key == "old3")
+                         .values(available_at=now))
+        assert await allocator.take_recycled(db, 2) == ["old3"]
+    cache.missing_url_cache.clear()